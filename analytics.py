@@ -0,0 +1,402 @@
+"""
+Diagnostics computed while the simulation runs: energy, momentum and orbital elements
+Author:
+Nilusink
+"""
+from constants import G, PI
+import typing as tp
+import numpy as np
+
+if tp.TYPE_CHECKING:
+    from objects import Simulation
+
+
+def kinetic_energy(velocity: np.ndarray, mass: np.ndarray) -> float:
+    return .5 * float(mass @ np.einsum("nk,nk->n", velocity, velocity))
+
+
+def potential_energy(position: np.ndarray, mass: np.ndarray,
+                     softening: float = 0, block_size: int = 2**22) -> float:
+    """
+    plummer softened potential energy of all pairs, summed in blocks of `block_size` pairs (O(N²))
+    """
+    n = len(mass)
+    eps2 = softening ** 2
+    rows = max(1, block_size // max(n, 1))
+    potential = 0.
+    for start in range(0, n, rows):
+        stop = min(start + rows, n)
+        delta = position[start:stop, np.newaxis, :] - position[np.newaxis, :, :]
+        r = np.sqrt(np.einsum("ijk,ijk->ij", delta, delta) + eps2)
+
+        # every pair once: only the upper triangle of this block
+        upper = (np.arange(start, stop)[:, np.newaxis] < np.arange(n)[np.newaxis, :]) & (r > 0)
+        pair_mass = mass[start:stop, np.newaxis] * mass[np.newaxis, :]
+        potential -= G * float(np.sum(pair_mass[upper] / r[upper]))
+
+    return potential
+
+
+def momentum(velocity: np.ndarray, mass: np.ndarray) -> np.ndarray:
+    """
+    total linear momentum (2,)
+    """
+    return mass @ velocity
+
+
+def angular_momentum(position: np.ndarray, velocity: np.ndarray, mass: np.ndarray) -> float:
+    """
+    total angular momentum around the origin (the z component, positive counterclockwise)
+    """
+    return float(mass @ (position[:, 0] * velocity[:, 1] - position[:, 1] * velocity[:, 0]))
+
+
+def orbital_elements(position: np.ndarray, velocity: np.ndarray, mass: np.ndarray,
+                     primary: int) -> tp.Dict[str, np.ndarray]:
+    """
+    osculating two-body elements of every body around `primary` (index)
+    :return: semi_major_axis, eccentricity and period (N,), NaN for the primary itself,
+        unbound bodies have a negative semi-major axis and no period
+    """
+    r = position - position[primary]
+    v = velocity - velocity[primary]
+    mu = G * (mass[primary] + mass)
+
+    distance = np.hypot(r[:, 0], r[:, 1])
+    h = r[:, 0] * v[:, 1] - r[:, 1] * v[:, 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        specific_energy = .5 * np.einsum("nk,nk->n", v, v) - mu / distance
+        a = -mu / (2 * specific_energy)
+        e = np.sqrt(np.maximum(1 + 2 * specific_energy * h ** 2 / mu ** 2, 0))
+        period = np.where(a > 0, 2 * PI * np.sqrt(np.abs(a) ** 3 / mu), np.nan)
+
+    a[primary] = e[primary] = period[primary] = np.nan
+    return {"semi_major_axis": a, "eccentricity": e, "period": period}
+
+
+class TimeSeries:
+    """
+    Compact time series of fixed size records with bounded memory
+
+    Every field is one preallocated array with a row per sample. When the
+    buffer is full, every second sample is dropped and from then on only
+    every second (then fourth, ...) append is kept, so the series always
+    covers the whole run with at most `capacity` samples.
+    """
+    def __init__(self, capacity: int = 4096) -> None:
+        """
+        :param capacity: maximum number of samples kept (at least 2)
+        """
+        if capacity < 2:
+            raise ValueError("Invalid value for \"capacity\", needs to be at least 2")
+
+        self.capacity = capacity
+        self.stride = 1
+        self.__calls = 0
+        self.__size = 0
+        self.__fields: tp.Dict[str, np.ndarray] = {}
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: {self.__size}/{self.capacity} samples, stride {self.stride}>"
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        """
+        the samples of one field (read-only view, oldest first)
+        """
+        view = self.__fields[field][:self.__size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def fields(self) -> tp.Tuple[str, ...]:
+        return tuple(self.__fields)
+
+    @property
+    def wants(self) -> bool:
+        """
+        true if the next sample will be kept
+        """
+        return self.__calls % self.stride == 0
+
+    def skip(self) -> None:
+        """
+        count a sample without adding it (for samples which wouldn't be kept, see `wants`)
+        """
+        self.__calls += 1
+
+    def append(self, values: tp.Mapping[str, tp.Any]) -> bool:
+        """
+        add a sample (the same fields and shapes every time)
+        :return: true if the sample was kept
+        """
+        wanted = self.wants
+        self.__calls += 1
+        if not wanted:
+            return False
+
+        if not self.__fields:
+            for name, value in values.items():
+                value = np.asarray(value)
+                self.__fields[name] = np.zeros((self.capacity,) + value.shape, dtype=value.dtype)
+
+        if self.__size == self.capacity:
+            for array in self.__fields.values():
+                kept = array[::2].copy()
+                array[:len(kept)] = kept
+
+            self.__size = (self.capacity + 1) // 2
+            self.stride *= 2
+
+        for name, array in self.__fields.items():
+            value = np.asarray(values[name])
+            if value.shape != array.shape[1:]:
+                raise ValueError(f"Invalid shape {value.shape} of {name!r}, expected {array.shape[1:]}")
+
+            array[self.__size] = value
+
+        self.__size += 1
+        return True
+
+    def as_dict(self) -> tp.Dict[str, np.ndarray]:
+        """
+        copies of all fields, e.g. for `np.savez(path, **series.as_dict())`
+        """
+        return {name: array[:self.__size].copy() for name, array in self.__fields.items()}
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        """
+        copy of the samples and the decimation, for checkpoints
+        """
+        return {
+            "capacity": self.capacity,
+            "stride": self.stride,
+            "calls": self.__calls,
+            "fields": self.as_dict(),
+        }
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        """
+        continue from a state from `state`
+        """
+        self.capacity = int(state["capacity"])
+        self.stride = int(state["stride"])
+        self.__calls = int(state["calls"])
+        self.__size = 0
+        self.__fields = {}
+        for name, values in state.get("fields", {}).items():
+            values = np.asarray(values)
+            self.__fields[name] = np.zeros((self.capacity,) + values.shape[1:], dtype=values.dtype)
+            self.__fields[name][:len(values)] = values
+            self.__size = len(values)
+
+
+class Observer:
+    """
+    Base class of the analytics stages of `Simulation.iter`
+
+    Every `every` steps, `measure` is called with the simulation. The
+    result is appended to `series` and passed to `callback`. Subclasses
+    only implement `measure`, returning a dict of fixed size values.
+    """
+    name: str = ""
+
+    def __init__(self, every: int = 1,
+                 capacity: int = 4096,
+                 callback: tp.Callable[[tp.Dict[str, tp.Any]], None] | None = None) -> None:
+        """
+        :param every: measure every n simulation steps
+        :param capacity: maximum number of samples kept in `series`
+        :param callback: called with every measurement
+        """
+        if every < 1:
+            raise ValueError("Invalid value for \"every\", needs to be at least 1")
+
+        self.every = every
+        self.callback = callback
+        self.series = TimeSeries(capacity)
+
+        # the measurement of the last update, None if none was due
+        self.last: tp.Dict[str, tp.Any] | None = None
+
+        # set while `stream` reads the measurements
+        self.streaming = False
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: every {self.every} steps, {len(self.series)} samples>"
+
+    def measure(self, sim: "Simulation") -> tp.Dict[str, tp.Any]:
+        raise NotImplementedError
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        """
+        the series (and whatever `measure` keeps between calls), for checkpoints
+        """
+        return {"name": self.name, "every": self.every, "series": self.series.state()}
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        """
+        continue from a state from `state`
+        """
+        if str(state["name"]) != self.name:
+            raise ValueError(f"Invalid observer state: {str(state['name'])!r} (expected {self.name!r})")
+
+        self.every = int(state["every"])
+        self.series.restore(state["series"])
+
+    def update(self, sim: "Simulation") -> tp.Dict[str, tp.Any] | None:
+        """
+        measure if a sample is due (called after every step)
+        :return: the measurement, None if none was due
+        """
+        self.last = None
+        if sim.steps % self.every:
+            return None
+
+        # nobody would see this measurement
+        if self.callback is None and not self.streaming and not self.series.wants:
+            self.series.skip()
+            return None
+
+        record = {"time": sim.time, "step": sim.steps, **self.measure(sim)}
+        self.series.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+        self.last = record
+        return record
+
+
+class ConservationObserver(Observer):
+    """
+    Total energy, linear and angular momentum, and their errors relative to the first sample
+
+    The potential energy costs O(N²), measure large systems less often.
+    """
+    name = "conservation"
+
+    def __init__(self, *args, **kw) -> None:
+        super().__init__(*args, **kw)
+        self.__initial: tp.Tuple[float, float] | None = None
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        initial = np.zeros(0) if self.__initial is None else np.array(self.__initial)
+        return super().state() | {"initial": initial}
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        super().restore(state)
+        initial = np.asarray(state["initial"], dtype=float)
+        self.__initial = (float(initial[0]), float(initial[1])) if len(initial) else None
+
+    def measure(self, sim: "Simulation") -> tp.Dict[str, tp.Any]:
+        store = sim.store
+        kinetic = kinetic_energy(store.velocity, store.mass)
+        potential = potential_energy(store.position, store.mass, sim.solver.softening)
+        energy = kinetic + potential
+        angular = angular_momentum(store.position, store.velocity, store.mass)
+
+        if self.__initial is None:
+            self.__initial = energy, angular
+
+        energy_0, angular_0 = self.__initial
+        return {
+            "kinetic": kinetic,
+            "potential": potential,
+            "energy": energy,
+            "energy_error": abs(energy - energy_0) / abs(energy_0) if energy_0 else 0.,
+            "momentum": momentum(store.velocity, store.mass),
+            "angular_momentum": angular,
+            "angular_momentum_error": abs(angular - angular_0) / abs(angular_0) if angular_0 else 0.,
+        }
+
+
+class OrbitObserver(Observer):
+    """
+    Orbital elements (semi-major axis, eccentricity, period) of a set of bodies around a primary
+
+    The bodies are followed by their store ids, so they are found again
+    when rows move. Bodies which no longer exist get NaN.
+    """
+    name = "orbits"
+
+    def __init__(self, *args,
+                 bodies: tp.Sequence[int] | None = None,
+                 primary: int | None = None,
+                 **kw) -> None:
+        """
+        :param bodies: ids of the bodies to follow (default: all bodies at the first measurement)
+        :param primary: id of the central body (default: the most massive one at the first measurement)
+        """
+        super().__init__(*args, **kw)
+        self.bodies = None if bodies is None else np.asarray(bodies, dtype=np.int64)
+        self.primary = primary
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        # ids are never negative, -1 / no array: not chosen yet
+        return super().state() | {
+            "bodies": np.zeros(0, dtype=np.int64) if self.bodies is None else self.bodies.copy(),
+            "chosen": self.bodies is not None,
+            "primary": -1 if self.primary is None else self.primary,
+        }
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        super().restore(state)
+        self.bodies = np.array(state["bodies"], dtype=np.int64) if bool(state["chosen"]) else None
+        self.primary = None if int(state["primary"]) < 0 else int(state["primary"])
+
+    def measure(self, sim: "Simulation") -> tp.Dict[str, tp.Any]:
+        store = sim.store
+        ids = store.ids
+        if self.primary is None:
+            self.primary = int(ids[np.argmax(store.mass)])
+
+        if self.bodies is None:
+            self.bodies = ids.copy()
+
+        nan = np.full(len(self.bodies), np.nan)
+        out = {"semi_major_axis": nan, "eccentricity": nan.copy(), "period": nan.copy()}
+        primary = np.flatnonzero(ids == self.primary)
+        if not len(primary):
+            return out
+
+        elements = orbital_elements(store.position, store.velocity, store.mass, int(primary[0]))
+
+        # rows of the followed bodies by id
+        order = np.argsort(ids)
+        found = np.searchsorted(ids, self.bodies, sorter=order)
+        found = np.minimum(found, len(ids) - 1)
+        rows = order[found]
+        exists = ids[rows] == self.bodies
+        for name, values in elements.items():
+            out[name][exists] = values[rows[exists]]
+
+        return out
+
+
+def stream(sim: "Simulation", dt: float, steps: int, observers: tp.Sequence[Observer] | None = None,
+           **kw) -> tp.Iterator[tp.Tuple[str, tp.Dict[str, tp.Any]]]:
+    """
+    run `steps` steps of `sim` and yield (observer name, measurement) as they are taken
+    :param observers: observers to run (default: the ones attached to the simulation)
+    :param kw: passed on to `Simulation.iter`
+    """
+    observers = sim.observers if observers is None else observers
+    attached = set(map(id, sim.observers))
+    for observer in observers:
+        observer.streaming = True
+
+    try:
+        for _ in range(steps):
+            sim.iter(dt, **kw)
+            for observer in observers:
+                if id(observer) not in attached:
+                    observer.update(sim)
+
+                if observer.last is not None:
+                    yield observer.name, observer.last
+
+    finally:
+        for observer in observers:
+            observer.streaming = False
@@ -0,0 +1,285 @@
+"""
+Barnes-Hut quadtree gravity solver
+Author:
+Nilusink
+"""
+from gravity import GravitySolver, NumpyGravity, SOLVERS
+from utils import expand_ranges
+from constants import G
+import typing as tp
+import numpy as np
+import time
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """
+    insert a zero bit between every bit of v (v < 2**32)
+    """
+    v = v.astype(np.uint64)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+class QuadTree:
+    """
+    Linear quadtree built from morton-sorted bodies
+
+    Every node covers a contiguous range [start, end) of the sorted bodies,
+    so node masses and centers of mass are plain segment sums.
+    """
+    def __init__(self, positions: np.ndarray, masses: np.ndarray,
+                 leaf_size: int = 8, max_depth: int = 20) -> None:
+        """
+        :param positions: (N, 2) body positions
+        :param masses: (N,) body masses
+        :param leaf_size: nodes with at most this many bodies are not split any further
+        :param max_depth: maximum depth of the tree (max 31)
+        """
+        n = len(masses)
+        lower = positions.min(axis=0)
+        size = float((positions.max(axis=0) - lower).max())
+        size = size * (1 + 1e-9) if size > 0 else 1.0
+
+        # sort bodies along a z-order curve
+        cells = 2 ** max_depth
+        grid = np.clip(((positions - lower) / size * cells).astype(np.int64), 0, cells - 1)
+        codes = _spread_bits(grid[:, 0]) | (_spread_bits(grid[:, 1]) << np.uint64(1))
+        self.order = np.argsort(codes, kind="stable")
+        codes = codes[self.order]
+
+        self.positions = positions[self.order]
+        self.masses = masses[self.order]
+
+        # rank of every (unsorted) body in the sorted arrays
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[self.order] = np.arange(n)
+
+        starts, ends, sizes = [np.zeros(1, dtype=np.int64)], [np.full(1, n, dtype=np.int64)], [np.full(1, size)]
+        active = np.arange(n) if n > leaf_size else np.zeros(0, dtype=np.int64)
+        level = 0
+        while len(active) and level < max_depth:
+            level += 1
+            keys = codes[active] >> np.uint64(2 * (max_depth - level))
+            first = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+            last = np.concatenate((first[1:], [len(active)])) - 1
+
+            level_starts = active[first]
+            level_ends = active[last] + 1
+            starts.append(level_starts)
+            ends.append(level_ends)
+            sizes.append(np.full(len(level_starts), size / 2 ** level))
+
+            # only bodies in nodes that get split take part in the next level
+            split = (level_ends - level_starts) > leaf_size
+            counts = np.where(split, level_ends - level_starts, 0)
+            rows, offsets = expand_ranges(counts)
+            active = level_starts[rows] + offsets
+
+        self.start = np.concatenate(starts)
+        self.end = np.concatenate(ends)
+        self.size = np.concatenate(sizes)
+
+        # children of a node are the nodes of the next level inside its range
+        n_nodes = len(self.start)
+        self.child_lo = np.zeros(n_nodes, dtype=np.int64)
+        self.child_hi = np.zeros(n_nodes, dtype=np.int64)
+        offset = 0
+        for parent_starts, parent_ends, child_starts in zip(starts, ends, starts[1:] + [np.zeros(0, np.int64)]):
+            child_offset = offset + len(parent_starts)
+            lo = np.searchsorted(child_starts, parent_starts, side="left")
+            hi = np.searchsorted(child_starts, parent_ends, side="left")
+            self.child_lo[offset:child_offset] = child_offset + lo
+            self.child_hi[offset:child_offset] = child_offset + hi
+            offset = child_offset
+
+        self.leaf = self.child_hi == self.child_lo
+
+        # monopole moments
+        cum_m = np.concatenate(([0.], np.cumsum(self.masses)))
+        self.mass = cum_m[self.end] - cum_m[self.start]
+        weights = np.where(self.mass > 0, self.mass, 1)
+        self.com = np.empty((n_nodes, 2))
+        for axis in range(2):
+            cum = np.concatenate(([0.], np.cumsum(self.masses * self.positions[:, axis])))
+            self.com[:, axis] = (cum[self.end] - cum[self.start]) / weights
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+
+class BarnesHutGravity(GravitySolver):
+    """
+    Approximates far-field gravity with the center of mass of quadtree nodes
+
+    A node of side length s at distance d from a body is used as a single
+    point mass if s / d < theta, otherwise it is opened. theta = 0 gives the
+    exact result, larger values are faster and less accurate.
+    """
+    name = "barnes-hut"
+
+    def __init__(self, softening: float = 0, theta: float = .5, leaf_size: int = 8,
+                 max_depth: int = 20, batch_size: int = 4096) -> None:
+        """
+        :param softening: plummer softening length
+        :param theta: opening angle
+        :param leaf_size: maximum bodies in a leaf node
+        :param max_depth: maximum depth of the quadtree
+        :param batch_size: number of bodies walking the tree at once (bounds memory)
+        """
+        super().__init__(softening)
+        self.theta = theta
+        self.leaf_size = leaf_size
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+
+        # number of node and body interactions of the last call
+        self.interactions = 0
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: theta={self.theta}, softening={self.softening}>"
+
+    def pair_count(self, bodies: int, targets: int) -> int:
+        return self.interactions
+
+    def accelerations(self, positions: np.ndarray, masses: np.ndarray,
+                      targets: np.ndarray | None = None) -> np.ndarray:
+        n = len(masses)
+        self.interactions = 0
+        if n < 2:
+            return np.zeros((n if targets is None else len(targets), 2))
+
+        tree = QuadTree(np.asarray(positions, dtype=float), np.asarray(masses, dtype=float),
+                        leaf_size=self.leaf_size, max_depth=self.max_depth)
+
+        # walk in tree order, neighbouring bodies open the same nodes
+        ranks = np.arange(n) if targets is None else np.sort(tree.rank[targets])
+        sorted_acc = np.zeros((len(ranks), 2))
+        for first in range(0, len(ranks), self.batch_size):
+            batch = slice(first, first + self.batch_size)
+            sorted_acc[batch] = self.__walk(tree, ranks[batch])
+
+        if targets is None:
+            acc = np.zeros((n, 2))
+            acc[tree.order] = sorted_acc
+            return acc
+
+        return sorted_acc[np.searchsorted(ranks, tree.rank[targets])]
+
+    def __walk(self, tree: QuadTree, bodies: np.ndarray) -> np.ndarray:
+        """
+        walk the tree for a batch of (sorted) bodies, all bodies advance one level per loop
+        """
+        n_batch = len(bodies)
+        ax = np.zeros(n_batch)
+        ay = np.zeros(n_batch)
+        eps2 = self.softening ** 2
+        theta2 = self.theta ** 2
+
+        # frontier of (body within batch, node) pairs, start at the root
+        body = np.arange(n_batch)
+        node = np.zeros(n_batch, dtype=np.int64)
+        while len(body):
+            rank = bodies[body]
+            delta = tree.com[node] - tree.positions[rank]
+            d2 = np.einsum("ij,ij->i", delta, delta)
+
+            inside = (tree.start[node] <= rank) & (rank < tree.end[node])
+            accept = ~inside & (tree.size[node] ** 2 < theta2 * d2)
+
+            # far away nodes act as a single point mass
+            if accept.any():
+                b, dl, r2 = body[accept], delta[accept], d2[accept] + eps2
+                w = G * tree.mass[node[accept]] / (r2 * np.sqrt(r2))
+                ax += np.bincount(b, w * dl[:, 0], minlength=n_batch)
+                ay += np.bincount(b, w * dl[:, 1], minlength=n_batch)
+                self.interactions += len(b)
+
+            # leaves which are too close are summed directly
+            direct = ~accept & tree.leaf[node]
+            if direct.any():
+                d_body, d_node = body[direct], node[direct]
+                rows, offsets = expand_ranges(tree.end[d_node] - tree.start[d_node])
+                b = d_body[rows]
+                other = tree.start[d_node][rows] + offsets
+                keep = other != bodies[b]
+                b, other = b[keep], other[keep]
+
+                dl = tree.positions[other] - tree.positions[bodies[b]]
+                r2 = np.einsum("ij,ij->i", dl, dl) + eps2
+                w = G * tree.masses[other] / (r2 * np.sqrt(r2))
+                ax += np.bincount(b, w * dl[:, 0], minlength=n_batch)
+                ay += np.bincount(b, w * dl[:, 1], minlength=n_batch)
+                self.interactions += len(b)
+
+            # everything else is opened
+            opened = ~accept & ~tree.leaf[node]
+            o_body, o_node = body[opened], node[opened]
+            rows, offsets = expand_ranges(tree.child_hi[o_node] - tree.child_lo[o_node])
+            body = o_body[rows]
+            node = tree.child_lo[o_node][rows] + offsets
+
+        return np.stack((ax, ay), axis=1)
+
+
+SOLVERS[BarnesHutGravity.name] = BarnesHutGravity
+
+
+def accuracy_report(positions: np.ndarray, masses: np.ndarray,
+                    thetas: tp.Iterable[float] = (.1, .2, .3, .5, .7, 1.),
+                    softening: float = 0) -> tp.List[tp.Dict[str, float]]:
+    """
+    compare the Barnes-Hut solver against the exact solver for different opening angles
+    :return: one row per theta with error percentiles (relative to |a_exact|) and timings
+    """
+    start = time.perf_counter()
+    exact = NumpyGravity(softening=softening).accelerations(positions, masses)
+    exact_time = time.perf_counter() - start
+    exact_len = np.linalg.norm(exact, axis=1)
+    exact_len[exact_len == 0] = 1
+
+    rows = []
+    for theta in thetas:
+        solver = BarnesHutGravity(softening=softening, theta=theta)
+        start = time.perf_counter()
+        approx = solver.accelerations(positions, masses)
+        bh_time = time.perf_counter() - start
+
+        err = np.linalg.norm(approx - exact, axis=1) / exact_len
+        rows.append({
+            "theta": theta,
+            "median_error": float(np.median(err)),
+            "p99_error": float(np.percentile(err, 99)),
+            "max_error": float(err.max()),
+            "interactions_per_body": solver.interactions / len(masses),
+            "time": bh_time,
+            "speedup": exact_time / bh_time,
+        })
+
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Barnes-Hut accuracy vs. opening angle")
+    parser.add_argument("-n", type=int, default=20_000, help="number of bodies")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # exponential disk of equal masses
+    rng = np.random.default_rng(args.seed)
+    r = rng.exponential(1., args.n)
+    phi = rng.uniform(0, 2 * np.pi, args.n)
+    pos = np.stack((r * np.cos(phi), r * np.sin(phi)), axis=1)
+    m = np.full(args.n, 1 / args.n)
+
+    print(f"N = {args.n}")
+    print(f"{'theta':>6} {'median err':>11} {'p99 err':>10} {'max err':>10} {'int/body':>9} {'time':>8} {'speedup':>8}")
+    for row in accuracy_report(pos, m, softening=1e-3):
+        print(f"{row['theta']:>6.2f} {row['median_error']:>11.2e} {row['p99_error']:>10.2e} "
+              f"{row['max_error']:>10.2e} {row['interactions_per_body']:>9.1f} "
+              f"{row['time']:>7.2f}s {row['speedup']:>7.1f}x")
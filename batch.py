@@ -0,0 +1,236 @@
+"""
+Headless batch runner, runs a scenario without pygame and writes snapshots
+
+usage:
+python -m batch objects1 --dt 3600 --duration 31557600 --snapshot-every 24 --out runs/solar
+
+Author:
+Nilusink
+"""
+from objects import Simulation, BasicObject, Planet
+from gravity import DEFAULT_SOLVER
+from trajectory import TrajectoryWriter
+from checkpoint import Checkpointer, resume
+from profiler import Profiler
+from analytics import ConservationObserver, OrbitObserver
+from scenario import resolve
+import typing as tp
+import numpy as np
+import importlib
+import argparse
+import time
+import sys
+import os
+
+
+def load_scenario(name: str, module: str = "setup") -> tp.List[BasicObject]:
+    """
+    get a list of objects by its variable name in `module`
+    """
+    scenarios = importlib.import_module(module)
+    objects = getattr(scenarios, name, None)
+
+    if not isinstance(objects, (list, tuple)) or not all(isinstance(obj, BasicObject) for obj in objects):
+        available = [
+            key for key, value in vars(scenarios).items()
+            if isinstance(value, (list, tuple)) and value and all(isinstance(obj, BasicObject) for obj in value)
+        ]
+        raise ValueError(f"Invalid scenario {name!r} (available: {', '.join(available)})")
+
+    return list(objects)
+
+
+def write_snapshot(sim: Simulation, directory: str) -> str:
+    """
+    write the current state of the simulation to `directory`
+    :return: the path of the snapshot file
+    """
+    store = sim.store
+    path = os.path.join(directory, f"snapshot_{sim.steps:09d}.npz")
+    np.savez(
+        path,
+        time=sim.time,
+        steps=sim.steps,
+        ids=store.ids,
+        names=np.array([obj.name if isinstance(obj, Planet) else "" for obj in sim.objects]),
+        mass=store.mass,
+        diameter=store.diameter,
+        fixed=store.fixed,
+        position=store.position,
+        velocity=store.velocity,
+    )
+    return path
+
+
+def run(sim: Simulation,
+        dt: float,
+        steps: int | None = None,
+        duration: float | None = None,
+        out: str | None = None,
+        snapshot_every: int = 0,
+        precision: int = 2,
+        gravity: bool = True,
+        collision: bool = True,
+        progress_every: float = 5,
+        trajectory: TrajectoryWriter | None = None,
+        trajectory_every: int = 1,
+        checkpoint: Checkpointer | None = None) -> None:
+    """
+    advance a simulation with a fixed time step
+    :param sim: the simulation to run
+    :param dt: simulated seconds per step
+    :param steps: number of steps to run
+    :param duration: simulated time to run (alternative to steps)
+    :param out: directory for snapshots, nothing is written if None
+    :param snapshot_every: write a snapshot every n steps (0: only at the start and the end)
+    :param precision: sub-steps per step
+    :param gravity: enable gravity
+    :param collision: enable collisions
+    :param progress_every: print progress every n real seconds (0 disables it)
+    :param trajectory: append frames to this trajectory (including the start)
+    :param trajectory_every: append a frame every n steps
+    :param checkpoint: takes checkpoints during the run and one at the end
+    """
+    if steps is None:
+        if duration is None:
+            raise ValueError("Either \"steps\" or \"duration\" is required")
+
+        steps = int(np.ceil(duration / dt))
+
+    if out is not None:
+        os.makedirs(out, exist_ok=True)
+        write_snapshot(sim, out)
+
+    if trajectory is not None:
+        trajectory.write(sim)
+
+    start = last_print = time.perf_counter()
+    for i in range(1, steps + 1):
+        sim.iter(dt, gravity=gravity, collision=collision, precision=precision)
+
+        if out is not None and snapshot_every and sim.steps % snapshot_every == 0:
+            write_snapshot(sim, out)
+
+        if trajectory is not None and sim.steps % trajectory_every == 0:
+            trajectory.write(sim)
+
+        if checkpoint is not None:
+            checkpoint.update(sim)
+
+        now = time.perf_counter()
+        if progress_every and now - last_print > progress_every:
+            print(f"step {i}/{steps}, {i / (now - start):.1f} steps/s", file=sys.stderr)
+            last_print = now
+
+    if out is not None and (not snapshot_every or steps % snapshot_every):
+        write_snapshot(sim, out)
+
+    if checkpoint is not None:
+        checkpoint.save(sim)
+
+    total = time.perf_counter() - start
+    print(f"{steps} steps in {total:.2f}s ({steps / total if total else float('inf'):.1f} steps/s), "
+          f"simulated time: {sim.time}s", file=sys.stderr)
+
+
+def main(argv: tp.List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="run a simulation without graphics")
+    parser.add_argument("scenario", help="name of the object list in the scenario module, "
+                                         "a scenario file (.toml, .json, .npz, .csv) or \"generator:n[:seed]\"")
+    parser.add_argument("--module", default="setup", help="module containing the scenarios")
+    parser.add_argument("--dt", type=float, required=True, help="simulated seconds per step")
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument("--steps", type=int, help="number of steps")
+    length.add_argument("--duration", type=float, help="simulated time in seconds")
+    parser.add_argument("--precision", type=int, default=2, help="sub-steps per step")
+    parser.add_argument("--solver", default=DEFAULT_SOLVER, help="gravity solver")
+    parser.add_argument("--integrator", default="euler", help="integrator (euler, leapfrog, yoshida4, block)")
+    parser.add_argument("--no-gravity", action="store_true")
+    parser.add_argument("--no-collision", action="store_true")
+    parser.add_argument("--merge", action="store_true", help="touching planets merge instead of bouncing off")
+    parser.add_argument("--trace-length", type=int, default=0, help="positions kept per body (0 disables traces)")
+    parser.add_argument("--out", help="directory for snapshots")
+    parser.add_argument("--snapshot-every", type=int, default=0, help="write a snapshot every n steps")
+    parser.add_argument("--trajectory", help="binary trajectory file to write")
+    parser.add_argument("--trajectory-every", type=int, default=1, help="write a trajectory frame every n steps")
+    parser.add_argument("--checkpoint", help="checkpoint file, resumed from if it exists")
+    parser.add_argument("--checkpoint-steps", type=int, help="take a checkpoint every n steps")
+    parser.add_argument("--checkpoint-seconds", type=float, default=300,
+                        help="take a checkpoint every n real seconds (default: 300)")
+    parser.add_argument("--profile", help="write a summary of the phase timings to this json file")
+    parser.add_argument("--profile-trace", help="write all phase timings as Chrome trace to this file")
+    parser.add_argument("--analytics", help="write energy, momentum and orbital elements over time to this npz file")
+    parser.add_argument("--analytics-every", type=int, default=100, help="measure the analytics every n steps")
+    args = parser.parse_args(argv)
+
+    if args.merge and args.trajectory is not None:
+        parser.error("--merge can't be combined with --trajectory (the number of bodies of a trajectory is fixed)")
+
+    observers = []
+    if args.analytics is not None:
+        observers = [ConservationObserver(args.analytics_every), OrbitObserver(args.analytics_every)]
+
+    profiler = Profiler() if args.profile or args.profile_trace else None
+
+    options = dict(
+        solver=args.solver,
+        integrator=args.integrator,
+        collision_mode="merge" if args.merge else "elastic",
+        trace_length=args.trace_length,
+        profiler=profiler,
+        observers=observers,
+    )
+    if os.path.isfile(args.scenario) or ":" in args.scenario:
+        sim = Simulation.from_arrays(**resolve(args.scenario), **options)
+
+    else:
+        sim = Simulation(load_scenario(args.scenario, args.module), **options)
+
+    # the run length counts from the start of the scenario, a resumed run only does the rest
+    steps = args.steps if args.steps is not None else int(np.ceil(args.duration / args.dt))
+    checkpoint = None
+    resumed = False
+    if args.checkpoint is not None:
+        checkpoint = Checkpointer(args.checkpoint, args.checkpoint_steps, args.checkpoint_seconds)
+        if os.path.exists(args.checkpoint):
+            # (the checkpoint includes the analytics series recorded so far)
+            resume(sim, args.checkpoint)
+            resumed = True
+            print(f"resumed from {args.checkpoint} at step {sim.steps}", file=sys.stderr)
+
+    # a resumed run continues the trajectory of the interrupted one
+    trajectory = None if args.trajectory is None else TrajectoryWriter(args.trajectory, sim, append=resumed)
+    try:
+        run(
+            sim,
+            dt=args.dt,
+            steps=max(steps - sim.steps, 0),
+            out=args.out,
+            snapshot_every=args.snapshot_every,
+            precision=args.precision,
+            gravity=not args.no_gravity,
+            collision=not args.no_collision,
+            trajectory=trajectory,
+            trajectory_every=args.trajectory_every,
+            checkpoint=checkpoint,
+        )
+
+    finally:
+        if trajectory is not None:
+            trajectory.close()
+
+        if args.analytics is not None:
+            np.savez(args.analytics, **{
+                f"{observer.name}/{field}": values
+                for observer in observers for field, values in observer.series.as_dict().items()
+            })
+
+        if args.profile:
+            profiler.dump_json(args.profile)
+
+        if args.profile_trace:
+            profiler.dump_chrome_trace(args.profile_trace)
+
+
+if __name__ == "__main__":
+    main()
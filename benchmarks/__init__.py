@@ -0,0 +1,5 @@
+"""
+Benchmarks for the simulation
+Author:
+Nilusink
+"""
@@ -0,0 +1,304 @@
+"""
+Benchmark suite: every scenario generator at growing N with every gravity solver
+
+Measures steps per second, force evaluations per second, the peak memory
+of building and stepping the simulation and the relative energy drift
+over the run. Results are written to benchmarks/results/<commit>.json and
+compared with the results of an earlier commit, slowdowns above the
+threshold are reported as regressions.
+
+usage: python -m benchmarks.suite [--quick] [--compare REF] [--strict]
+Author:
+Nilusink
+"""
+from generators import GENERATORS, generate, dynamical_time, rms_radius
+from gravity import available_solvers, get_solver
+from analytics import kinetic_energy, potential_energy
+from objects import Simulation
+import typing as tp
+import numpy as np
+import subprocess
+import tracemalloc
+import platform
+import argparse
+import datetime
+import glob
+import json
+import time
+import sys
+import os
+
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+SIZES = (10, 100, 1_000, 10_000, 100_000)
+
+
+def energy(sim: Simulation, softening: float = 0) -> float:
+    """
+    total kinetic and (plummer softened) potential energy
+    """
+    store = sim.store
+    return kinetic_energy(store.velocity, store.mass) + potential_energy(store.position, store.mass, softening)
+
+
+def git_commit() -> str:
+    """
+    short hash of the checked out commit, "-dirty" if there are uncommitted changes
+    """
+    root = os.path.dirname(RESULTS)
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+    return f"{commit}-dirty" if dirty else commit
+
+
+def environment() -> tp.Dict[str, tp.Any]:
+    """
+    versions and machine the results were measured with
+    """
+    try:
+        import numba
+        numba_version = numba.__version__
+
+    except ImportError:
+        numba_version = None
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba_version,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_case(scenario: str, n: int, solver: str, steps: int,
+             precision: int = 2, softening: float = 1e-3, energy_limit: int = 20_000,
+             seed: int = 0) -> tp.Dict[str, tp.Any]:
+    """
+    measure one scenario / size / solver combination, with a time step of 1/1000 of the
+    dynamical time and a softening length of `softening` times the rms radius
+    """
+    bodies = generate(scenario, n, seed=seed)
+    dt = dynamical_time(bodies) / 1000
+
+    gravity = get_solver(solver)
+    gravity.softening = softening * rms_radius(bodies)
+
+    # warm up (imports, numba compilation, worker processes), not part of any measurement
+    Simulation.from_arrays(**bodies, solver=gravity, trace_length=0).iter(dt, precision=precision)
+
+    # memory: building the simulation and its first step (tracemalloc slows everything down, so not timed)
+    tracemalloc.start()
+    sim = Simulation.from_arrays(**bodies, solver=gravity, trace_length=0)
+    sim.iter(dt, precision=precision)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start_energy = energy(sim, gravity.softening) if len(sim.objects) <= energy_limit else None
+    evaluations = sim.integrator.force_evaluations
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        sim.iter(dt, precision=precision)
+
+    duration = time.perf_counter() - start
+    evaluations = sim.integrator.force_evaluations - evaluations
+
+    drift = None
+    if start_energy is not None:
+        drift = abs(energy(sim, gravity.softening) - start_energy) / abs(start_energy) if start_energy else 0.
+
+    close = getattr(gravity, "close", None)
+    if close is not None:
+        close()
+
+    return {
+        "scenario": scenario,
+        "n": len(sim.objects),
+        "solver": solver,
+        "steps": steps,
+        "dt": dt,
+        "seconds": duration,
+        "steps_per_second": steps / duration,
+        "force_evaluations_per_second": evaluations / duration,
+        "peak_memory": peak,
+        "energy_drift": drift,
+    }
+
+
+def run_suite(scenarios: tp.Iterable[str], sizes: tp.Iterable[int], solvers: tp.Iterable[str],
+              steps: int = 10, max_step_time: float = 1., softening: float = 1e-3, energy_limit: int = 20_000,
+              log: tp.TextIO | None = sys.stderr) -> tp.List[tp.Dict[str, tp.Any]]:
+    """
+    run every combination, sizes are skipped once a solver is expected to take longer than
+    `max_step_time` per step (extrapolated from the last two sizes, linearly after the first one
+    where the fixed costs per step still dominate)
+    """
+    rows = []
+    for scenario in scenarios:
+        for solver in solvers:
+            timings: tp.List[tp.Tuple[int, float]] = []
+            for n in sorted(sizes):
+                if timings:
+                    last_n, last_time = timings[-1]
+                    exponent = 1.
+                    if len(timings) > 1:
+                        (first_n, first_time), _ = timings[-2:]
+                        exponent = float(np.clip(np.log(last_time / first_time) / np.log(last_n / first_n), 1, 2))
+
+                    if last_time * (n / last_n) ** exponent > max_step_time:
+                        if log is not None:
+                            print(f"{scenario:<8} {solver:<11} n={n:<7} skipped (too slow)", file=log)
+
+                        continue
+
+                row = run_case(scenario, n, solver, steps, softening=softening, energy_limit=energy_limit)
+                timings.append((row["n"], row["seconds"] / steps))
+                rows.append(row)
+                if log is not None:
+                    print(format_row(row), file=log)
+
+    return rows
+
+
+def format_row(row: tp.Dict[str, tp.Any]) -> str:
+    drift = "-" if row["energy_drift"] is None else f"{row['energy_drift']:.2e}"
+    return (f"{row['scenario']:<8} {row['solver']:<11} n={row['n']:<7} "
+            f"{row['steps_per_second']:>10.1f} steps/s {row['force_evaluations_per_second']:>12.4g} evals/s "
+            f"{row['peak_memory'] / 2**20:>8.1f} MiB  drift {drift}")
+
+
+def save(rows: tp.List[tp.Dict[str, tp.Any]], directory: str = RESULTS) -> str:
+    """
+    write the results of the checked out commit
+    :return: path of the results file
+    """
+    os.makedirs(directory, exist_ok=True)
+    commit = git_commit()
+    path = os.path.join(directory, f"{commit}.json")
+    with open(path, "w") as file:
+        json.dump({
+            "commit": commit,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "environment": environment(),
+            "results": rows,
+        }, file, indent=2)
+
+    return path
+
+
+def load(reference: str, directory: str = RESULTS) -> tp.Dict[str, tp.Any]:
+    """
+    results by path or by commit (any git revision)
+    """
+    if os.path.isfile(reference):
+        path = reference
+
+    else:
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", reference], cwd=os.path.dirname(directory),
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+
+        except (OSError, subprocess.CalledProcessError):
+            commit = reference
+
+        path = os.path.join(directory, f"{commit}.json")
+
+    if not os.path.isfile(path):
+        raise ValueError(f"Invalid reference {reference!r}, no results at {path}")
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def previous(current: str, directory: str = RESULTS) -> str | None:
+    """
+    the newest results file of another commit
+    """
+    paths = [path for path in glob.glob(os.path.join(directory, "*.json")) if path != current]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def compare(rows: tp.List[tp.Dict[str, tp.Any]], reference: tp.List[tp.Dict[str, tp.Any]],
+            threshold: float = .1) -> tp.List[tp.Dict[str, tp.Any]]:
+    """
+    speed of every case relative to the reference (same scenario, size and solver)
+    :return: one row per matching case, "regression" is set if it is more than `threshold` slower
+    """
+    old = {(row["scenario"], row["n"], row["solver"]): row for row in reference}
+    out = []
+    for row in rows:
+        match = old.get((row["scenario"], row["n"], row["solver"]))
+        if match is None:
+            continue
+
+        ratio = row["steps_per_second"] / match["steps_per_second"]
+        out.append({
+            "scenario": row["scenario"],
+            "n": row["n"],
+            "solver": row["solver"],
+            "ratio": ratio,
+            "memory_ratio": row["peak_memory"] / max(match["peak_memory"], 1),
+            "regression": ratio < 1 - threshold,
+        })
+
+    return out
+
+
+def main(argv: tp.List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="benchmark suite with regression tracking")
+    parser.add_argument("--scenarios", nargs="+", default=list(GENERATORS), choices=list(GENERATORS))
+    parser.add_argument("--solvers", nargs="+", default=available_solvers(), choices=available_solvers())
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--quick", action="store_true", help="only sizes up to 1000")
+    parser.add_argument("--steps", type=int, default=10, help="timed steps per case")
+    parser.add_argument("--max-step-time", type=float, default=1.,
+                        help="skip sizes expected to take longer per step (seconds)")
+    parser.add_argument("--softening", type=float, default=1e-3, help="softening length in rms radii")
+    parser.add_argument("--energy-limit", type=int, default=20_000,
+                        help="only measure the energy drift up to this many bodies (O(N²))")
+    parser.add_argument("--compare", help="commit or results file to compare with (default: the newest other one)")
+    parser.add_argument("--threshold", type=float, default=.1, help="slowdown reported as regression")
+    parser.add_argument("--strict", action="store_true", help="exit with 1 if there are regressions")
+    parser.add_argument("--no-save", action="store_true", help="don't write the results")
+    args = parser.parse_args(argv)
+
+    sizes = [n for n in args.sizes if not args.quick or n <= 1_000]
+    rows = run_suite(args.scenarios, sizes, args.solvers, args.steps, args.max_step_time, args.softening,
+                     args.energy_limit)
+
+    path = None
+    if not args.no_save:
+        path = save(rows)
+        print(f"results written to {path}", file=sys.stderr)
+
+    reference_path = args.compare or previous(path or "")
+    if reference_path is None:
+        return 0
+
+    reference = load(reference_path)
+    regressions = 0
+    print(f"\ncompared with {reference['commit']} ({reference['date']}):")
+    for row in compare(rows, reference["results"], args.threshold):
+        regressions += row["regression"]
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['scenario']:<8} {row['solver']:<11} n={row['n']:<7} "
+              f"{row['ratio']:>6.2f}x speed {row['memory_ratio']:>6.2f}x memory{flag}")
+
+    return int(args.strict and regressions > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Micro-benchmark of the Vector class
+
+Runs the per-pair vector arithmetic of the gravity and integration step
+(difference, length / angle, polar force, scaling, accumulation) with the
+current Vector and with the previous implementation, which recalculated
+length and angle with numpy on every x / y assignment.
+
+usage: python -m benchmarks.vector_ops [-n ITERATIONS]
+Author:
+Nilusink
+"""
+from objects import Vector, G, PI
+import typing as tp
+import numpy as np
+import argparse
+import timeit
+
+
+class LegacyVector:
+    """
+    the Vector implementation before lazy polar coordinates (for comparison only)
+    """
+    def __init__(self) -> None:
+        self.__x = 0
+        self.__y = 0
+        self.__angle = 0
+        self.__length = 0
+
+    @staticmethod
+    def from_cartesian(x: float, y: float) -> "LegacyVector":
+        p = LegacyVector()
+        p.x = x
+        p.y = y
+        return p
+
+    @staticmethod
+    def from_polar(angle: float, length: float) -> "LegacyVector":
+        p = LegacyVector()
+        while angle > 2*PI:
+            angle -= 2*PI
+        while angle < 0:
+            angle += 2*PI
+        p.angle = angle
+        p.length = length
+        return p
+
+    @property
+    def x(self) -> float:
+        return self.__x
+
+    @x.setter
+    def x(self, value: float) -> None:
+        self.__x = value
+        self.__update("c")
+
+    @property
+    def y(self) -> float:
+        return self.__y
+
+    @y.setter
+    def y(self, value: float) -> None:
+        self.__y = value
+        self.__update("c")
+
+    @property
+    def angle(self) -> float:
+        return self.__angle
+
+    @angle.setter
+    def angle(self, value: float) -> None:
+        self.__angle = value
+        self.__update("p")
+
+    @property
+    def length(self) -> float:
+        return self.__length
+
+    @length.setter
+    def length(self, value: float) -> None:
+        self.__length = value
+        self.__update("p")
+
+    def __add__(self, other) -> "LegacyVector":
+        return LegacyVector.from_cartesian(x=self.x + other.x, y=self.y + other.y)
+
+    def __sub__(self, other) -> "LegacyVector":
+        return LegacyVector.from_cartesian(x=self.x - other.x, y=self.y - other.y)
+
+    def __mul__(self, other) -> "LegacyVector":
+        return LegacyVector.from_cartesian(x=self.x * other, y=self.y * other)
+
+    def __truediv__(self, other) -> "LegacyVector":
+        return LegacyVector.from_cartesian(x=self.x / other, y=self.y / other)
+
+    def __update(self, calc_from: str) -> None:
+        if calc_from in ("p", "polar"):
+            self.__x = np.cos(self.angle) * self.length
+            self.__y = np.sin(self.angle) * self.length
+            return
+
+        self.__length = np.sqrt(self.x**2 + self.y**2)
+        self.__angle = np.arctan2(self.y, self.x)
+
+
+def pair_step(cls: tp.Type, in_place: bool = False) -> tp.Callable[[], None]:
+    """
+    one gravity interaction + integration step of a pair, as done in Simulation.iter
+    """
+    p1, p2 = cls.from_cartesian(0, 0), cls.from_cartesian(1.5e11, 2e9)
+    v1, v2 = cls.from_cartesian(0, 0), cls.from_cartesian(0, 29780)
+    m1, m2, dt = 1.9885e+30, 5.97237e+24, 60.
+
+    def step() -> None:
+        nonlocal p1, p2, v1, v2
+        delta = p1 - p2
+        f_l = G * (m1 * m2) / delta.length ** 2
+        f = cls.from_polar(angle=delta.angle + PI, length=f_l)
+
+        if in_place:
+            v1 += f / m1 * dt
+            v2 += f / -m2 * dt
+            p1 += v1 * dt
+            p2 += v2 * dt
+
+        else:
+            v1 = v1 + f / m1 * dt
+            v2 = v2 + f / -m2 * dt
+            p1 = p1 + v1 * dt
+            p2 = p2 + v2 * dt
+
+    return step
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Vector micro-benchmark")
+    parser.add_argument("-n", type=int, default=50_000, help="iterations per measurement")
+    parser.add_argument("-r", type=int, default=5, help="repetitions, the best one is reported")
+    args = parser.parse_args()
+
+    cases = [
+        ("legacy Vector", pair_step(LegacyVector)),
+        ("Vector", pair_step(Vector)),
+        ("Vector, in-place", pair_step(Vector, in_place=True)),
+        ("legacy from_cartesian", lambda: LegacyVector.from_cartesian(1., 2.)),
+        ("Vector.from_cartesian", lambda: Vector.from_cartesian(1., 2.)),
+    ]
+
+    results = {}
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=args.n, repeat=args.r))
+        results[name] = best / args.n
+
+    print(f"{'case':<24} {'time / op':>12} {'speedup':>9}")
+    for name, t in results.items():
+        base = results["legacy from_cartesian" if "from_cartesian" in name else "legacy Vector"]
+        print(f"{name:<24} {t * 1e6:>10.2f}us {base / t:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
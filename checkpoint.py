@@ -0,0 +1,146 @@
+"""
+Checkpoints: save and resume the full state of a simulation
+Author:
+Nilusink
+"""
+from objects import Simulation
+import typing as tp
+import numpy as np
+import time
+import os
+
+
+def _flatten(state: tp.Dict[str, tp.Any], prefix: str = "") -> tp.Dict[str, np.ndarray]:
+    """
+    nested dicts to {"a/b/c": array}
+    """
+    flat = {}
+    for key, value in state.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}/"))
+
+        else:
+            flat[f"{prefix}{key}"] = np.asarray(value)
+
+    return flat
+
+
+def _unflatten(flat: tp.Mapping[str, np.ndarray]) -> tp.Dict[str, tp.Any]:
+    """
+    {"a/b/c": array} to nested dicts
+    """
+    state: tp.Dict[str, tp.Any] = {}
+    for key, value in flat.items():
+        *path, name = key.split("/")
+        node = state
+        for part in path:
+            node = node.setdefault(part, {})
+
+        node[name] = value[()] if value.ndim == 0 else value
+
+    return state
+
+
+def save_checkpoint(sim: Simulation, path: str) -> None:
+    """
+    write the state of `sim` to `path`
+
+    The file is written next to the target and then renamed, so `path`
+    always holds either the previous or the new checkpoint, never a
+    partially written one.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **_flatten(sim.state()))
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path: str) -> tp.Dict[str, tp.Any]:
+    """
+    read a checkpoint, pass the result to `Simulation.restore`
+    """
+    with np.load(path, allow_pickle=False) as data:
+        return _unflatten({key: data[key] for key in data.files})
+
+
+def resume(sim: Simulation, path: str) -> Simulation:
+    """
+    restore `sim` from the checkpoint at `path`
+    """
+    sim.restore(load_checkpoint(path))
+    return sim
+
+
+class Checkpointer:
+    """
+    Decides when to take a checkpoint during a run
+
+    Call `update` after every step, a checkpoint is written every
+    `every_steps` steps and / or every `every_seconds` real seconds
+    (whichever comes first).
+    """
+    def __init__(self, path: str,
+                 every_steps: int | None = None,
+                 every_seconds: float | None = None,
+                 clock: tp.Callable[[], float] = time.monotonic) -> None:
+        """
+        :param path: checkpoint file (overwritten by every checkpoint)
+        :param every_steps: checkpoint every n simulation steps
+        :param every_seconds: checkpoint every n seconds of real time
+        :param clock: time source in seconds
+        """
+        if not every_steps and not every_seconds:
+            raise ValueError("Either \"every_steps\" or \"every_seconds\" is required")
+
+        self.path = path
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+        self.__clock = clock
+        self.__last_time = clock()
+        self.__last_step: int | None = None
+
+        self.count = 0
+
+        # real seconds spent writing checkpoints
+        self.duration = 0.
+
+    def due(self, sim: Simulation) -> bool:
+        """
+        true if a checkpoint should be taken now
+        """
+        if self.__last_step is None:
+            self.__last_step = sim.steps
+
+        if self.every_steps and sim.steps - self.__last_step >= self.every_steps:
+            return True
+
+        return bool(self.every_seconds) and self.__clock() - self.__last_time >= self.every_seconds
+
+    def save(self, sim: Simulation) -> None:
+        """
+        take a checkpoint now
+        """
+        start = time.perf_counter()
+        save_checkpoint(sim, self.path)
+        self.duration += time.perf_counter() - start
+        self.count += 1
+
+        self.__last_step = sim.steps
+        self.__last_time = self.__clock()
+
+    def update(self, sim: Simulation) -> bool:
+        """
+        take a checkpoint if one is due
+        :return: true if a checkpoint was taken
+        """
+        if self.due(sim):
+            self.save(sim)
+            return True
+
+        return False
@@ -0,0 +1,116 @@
+"""
+Broad phase collision detection
+Author:
+Nilusink
+"""
+from utils import expand_ranges
+import typing as tp
+import numpy as np
+
+
+Pairs = tp.Tuple[np.ndarray, np.ndarray]
+
+
+def grid_pairs(position: np.ndarray, radius: np.ndarray) -> Pairs:
+    """
+    candidate pairs from a uniform grid (spatial hash)
+
+    The cell size is the largest diameter, so touching bodies are always
+    in the same or in neighbouring cells. Every cell is compared with
+    itself and four of its neighbours, so each pair is only found once.
+    :return: (i, j) index arrays of bodies which might touch
+    """
+    n = len(radius)
+    if n < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    cell = 2 * float(radius.max())
+    if cell <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    cells = np.floor(position / cell).astype(np.int64)
+    cells -= cells.min(axis=0)
+
+    # one padding row on each side, so y +- 1 never wraps into the next column
+    stride = int(cells[:, 1].max()) + 3
+    keys = cells[:, 0] * stride + cells[:, 1] + 1
+
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+
+    # same cell, only the bodies after this one
+    hi = np.searchsorted(keys, keys, side="right")
+    rows, offsets = expand_ranges(hi - np.arange(1, n + 1))
+    first, second = [rows], [rows + 1 + offsets]
+
+    # (x+1, y-1), (x+1, y), (x+1, y+1), (x, y+1)
+    for offset in (stride - 1, stride, stride + 1, 1):
+        neighbour = keys + offset
+        lo = np.searchsorted(keys, neighbour, side="left")
+        hi = np.searchsorted(keys, neighbour, side="right")
+        rows, offsets = expand_ranges(hi - lo)
+        first.append(rows)
+        second.append(lo[rows] + offsets)
+
+    return order[np.concatenate(first)], order[np.concatenate(second)]
+
+
+def sweep_pairs(position: np.ndarray, radius: np.ndarray) -> Pairs:
+    """
+    candidate pairs from sweep and prune along the axis with the larger spread
+
+    Handles very different body sizes better than the grid, but degrades
+    if many bodies overlap on the sweep axis.
+    :return: (i, j) index arrays of bodies which might touch
+    """
+    n = len(radius)
+    if n < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    axis = int(np.argmax(np.ptp(position, axis=0)))
+    lower = position[:, axis] - radius
+    upper = position[:, axis] + radius
+
+    order = np.argsort(lower, kind="stable")
+    lower = lower[order]
+    upper = upper[order]
+
+    # every body after this one which starts before this one ends
+    hi = np.searchsorted(lower, upper, side="right")
+    rows, offsets = expand_ranges(np.maximum(hi - np.arange(1, n + 1), 0))
+    first = rows
+    second = rows + 1 + offsets
+
+    # prune on the other axis
+    other = 1 - axis
+    gap = np.abs(position[order[first], other] - position[order[second], other])
+    keep = gap < radius[order[first]] + radius[order[second]]
+
+    return order[first[keep]], order[second[keep]]
+
+
+BROAD_PHASES: tp.Dict[str, tp.Callable[[np.ndarray, np.ndarray], Pairs]] = {
+    "grid": grid_pairs,
+    "sweep": sweep_pairs,
+}
+
+
+def touching_pairs(position: np.ndarray, radius: np.ndarray, broad_phase: str = "grid") -> Pairs:
+    """
+    all pairs of bodies which overlap, each pair is returned once with i < j
+    :param position: (N, 2) positions
+    :param radius: (N,) radii
+    :param broad_phase: "grid" or "sweep"
+    """
+    if broad_phase not in BROAD_PHASES:
+        raise ValueError(f"Invalid value for \"broad_phase\": {broad_phase!r} (available: {', '.join(BROAD_PHASES)})")
+
+    i, j = BROAD_PHASES[broad_phase](position, radius)
+
+    # narrow phase
+    delta = position[i] - position[j]
+    dist2 = np.einsum("ij,ij->i", delta, delta)
+    touch = dist2 < (radius[i] + radius[j]) ** 2
+    i, j = i[touch], j[touch]
+
+    return np.minimum(i, j), np.maximum(i, j)
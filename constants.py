@@ -0,0 +1,14 @@
+"""
+Physical and mathematical constants
+Author:
+Nilusink
+"""
+
+# gravitational constant
+G: float = 6.67408e-11
+
+# pi
+PI = 3.1415926535897932384626433832795028841971
+
+# one astronomical unit
+AU = 149597870700
@@ -0,0 +1,166 @@
+"""
+Contact state of touching bodies: collision cooldowns and contact manifolds
+Author:
+Nilusink
+"""
+import typing as tp
+import numpy as np
+
+
+def pair_keys(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    one int64 key per unordered pair of body ids (ids below 2**31)
+    """
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    return (np.minimum(a, b) << 32) | np.maximum(a, b)
+
+
+class ContactTable:
+    """
+    All pairs of bodies which touch or collided recently, keyed by their ids
+
+    The table is a set of arrays sorted by the pair key, so looking up a
+    whole batch of candidate pairs is one `searchsorted` and the cost only
+    depends on the number of contacts, not on the number of bodies. Ids
+    stay the same when rows move, so entries survive reordering the store.
+
+    Time is counted in ticks (one per collision pass, see `advance`). A pair
+    which collided is blocked for the next `cooldown` ticks. Every entry
+    keeps a contact manifold (normal, penetration depth, first and last
+    tick of contact, number of collisions) which is updated while the
+    bodies touch and dropped `expiry` ticks after the last contact.
+    """
+    FIELDS = {
+        "key": ((), np.int64),
+        "first": ((), np.int64),
+        "seen": ((), np.int64),
+        "collision": ((), np.int64),
+        "hits": ((), np.int64),
+        "normal": ((2,), np.float64),
+        "depth": ((), np.float64),
+    }
+
+    # "collision" tick of pairs which never collided
+    NEVER = -2**62
+
+    def __init__(self, cooldown: int = 2, expiry: int | None = None) -> None:
+        """
+        :param cooldown: ticks a pair is blocked after a collision
+        :param expiry: ticks an entry is kept after the last contact (default: `cooldown`)
+        """
+        if cooldown < 0:
+            raise ValueError("Invalid value for \"cooldown\", can't be negative")
+
+        self.cooldown = cooldown
+        self.expiry = cooldown if expiry is None else expiry
+        self.tick = 0
+        self.__rows: tp.Dict[str, np.ndarray] = {
+            name: np.zeros((0,) + shape, dtype=dtype) for name, (shape, dtype) in self.FIELDS.items()
+        }
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: {len(self)} contacts, tick {self.tick}>"
+
+    def __len__(self) -> int:
+        return len(self.__rows["key"])
+
+    def __find(self, keys: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+        """
+        (row, found) of every key
+        """
+        table = self.__rows["key"]
+        rows = np.minimum(np.searchsorted(table, keys), max(len(table) - 1, 0))
+        found = table[rows] == keys if len(table) else np.zeros(len(keys), dtype=bool)
+        return rows, found
+
+    def advance(self) -> None:
+        """
+        start the next tick and drop entries which expired
+        """
+        self.tick += 1
+        rows = self.__rows
+        keep = (self.tick - rows["seen"] <= self.expiry) | (self.tick - rows["collision"] <= self.cooldown)
+        if not keep.all():
+            self.__rows = {name: values[keep] for name, values in rows.items()}
+
+    def blocked(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """
+        mask of the pairs (ids) which collided within the last `cooldown` ticks
+        """
+        if not len(self):
+            return np.zeros(len(a), dtype=bool)
+
+        rows, found = self.__find(pair_keys(a, b))
+        return found & (self.tick - self.__rows["collision"][rows] <= self.cooldown)
+
+    def update(self, a: np.ndarray, b: np.ndarray,
+               normal: np.ndarray, depth: np.ndarray,
+               collided: np.ndarray | None = None) -> None:
+        """
+        record the pairs (ids, each pair once) touching in this tick
+        :param normal: (k, 2) unit vectors from a to b
+        :param depth: (k,) penetration depths
+        :param collided: (k,) mask of the pairs which collided in this tick
+        """
+        keys = pair_keys(a, b)
+        collided = np.zeros(len(keys), dtype=bool) if collided is None else np.asarray(collided, dtype=bool)
+        if not len(keys):
+            return
+
+        rows, found = self.__find(keys)
+
+        # known contacts
+        table = self.__rows
+        hit = rows[found]
+        table["seen"][hit] = self.tick
+        table["normal"][hit] = normal[found]
+        table["depth"][hit] = depth[found]
+        table["collision"][hit[collided[found]]] = self.tick
+        table["hits"][hit] += collided[found]
+
+        # new contacts
+        new = ~found
+        if new.any():
+            count = int(new.sum())
+            added = {
+                "key": keys[new],
+                "first": np.full(count, self.tick),
+                "seen": np.full(count, self.tick),
+                "collision": np.where(collided[new], self.tick, self.NEVER),
+                "hits": collided[new].astype(np.int64),
+                "normal": normal[new],
+                "depth": depth[new],
+            }
+            merged = {name: np.concatenate((table[name], added[name])) for name in self.FIELDS}
+            order = np.argsort(merged["key"], kind="stable")
+            self.__rows = {name: values[order] for name, values in merged.items()}
+
+    def manifold(self, a: int, b: int) -> tp.Dict[str, tp.Any] | None:
+        """
+        the contact entry of a pair of ids, None if they are not in contact
+        """
+        rows, found = self.__find(pair_keys([a], [b]))
+        if not found[0]:
+            return None
+
+        return {name: values[rows[0]].copy() for name, values in self.__rows.items() if name != "key"}
+
+    def contacts(self) -> tp.Dict[str, np.ndarray]:
+        """
+        all entries: ids a < b and their manifolds (copies)
+        """
+        rows = {name: values.copy() for name, values in self.__rows.items() if name != "key"}
+        keys = self.__rows["key"]
+        rows["a"], rows["b"] = keys >> 32, keys & (2**32 - 1)
+        return rows
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        return {"tick": self.tick, **{name: values.copy() for name, values in self.__rows.items()}}
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        self.tick = int(state["tick"])
+        self.__rows = {
+            name: np.asarray(state[name], dtype=dtype).reshape((-1,) + shape)
+            for name, (shape, dtype) in self.FIELDS.items()
+        }
@@ -0,0 +1,237 @@
+"""
+Ensembles: many independent copies of one scenario, stepped together
+Author:
+Nilusink
+"""
+from objects import Simulation, BasicObject, Planet
+from kernels import HAS_NUMBA, ensemble_gravity_kernel
+from constants import G
+import typing as tp
+import numpy as np
+
+
+class Ensemble:
+    """
+    M independent variants of a scenario with N bodies
+
+    The state of all members lives in (M, N, 2) arrays and every step is
+    calculated for all members at once, so a parameter sweep costs a few
+    numpy calls per step instead of M python simulations.
+    Edit `position`, `velocity` or `mass` of single members to perturb
+    them (e.g. `ensemble.velocity[:, earth] *= factors[:, np.newaxis]`).
+
+    Only gravity is calculated, collisions are not resolved but the first
+    contact of every member is recorded in the summary.
+    """
+    INTEGRATORS = ("euler", "leapfrog")
+
+    def __init__(self, objects: tp.Sequence[BasicObject] | Simulation,
+                 members: int,
+                 integrator: str = "euler",
+                 softening: float = 0,
+                 block_size: int = 2**20) -> None:
+        """
+        :param objects: scenario (list of objects or a simulation) every member starts from
+        :param members: number of members
+        :param integrator: "euler" (same scheme as the default of Simulation) or "leapfrog"
+        :param softening: plummer softening length
+        :param block_size: maximum number of pair interactions evaluated at once
+        """
+        if members < 1:
+            raise ValueError("Invalid value for \"members\", needs to be at least 1")
+
+        if integrator not in self.INTEGRATORS:
+            raise ValueError(f"Invalid value for \"integrator\": {integrator!r} "
+                             f"(available: {', '.join(self.INTEGRATORS)})")
+
+        if isinstance(objects, Simulation):
+            objects = objects.objects
+
+        self.names = [obj.name if isinstance(obj, Planet) else "" for obj in objects]
+        n = len(objects)
+
+        self.integrator = integrator
+        self.softening = softening
+        self.block_size = block_size
+
+        self.position = np.empty((members, n, 2))
+        self.velocity = np.empty((members, n, 2))
+        self.position[:] = [(obj.position.x, obj.position.y) for obj in objects]
+        self.velocity[:] = [(obj.velocity.x, obj.velocity.y) for obj in objects]
+        self.mass = np.empty((members, n))
+        self.mass[:] = [obj.mass for obj in objects]
+        self.diameter = np.array([obj.diameter if isinstance(obj, Planet) else 0. for obj in objects])
+        self.fixed = np.array([obj.fixed for obj in objects], dtype=bool)
+
+        self.time = 0.
+        self.steps = 0
+
+        self.__acceleration: np.ndarray | None = None
+        self.__energy: np.ndarray | None = None
+        self.__min_distance = np.full(members, np.inf)
+        self.__first_contact = np.full(members, np.nan)
+        self.__max_speed = np.zeros(members)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: {self.members} members, {self.bodies} bodies>"
+
+    @property
+    def members(self) -> int:
+        return self.position.shape[0]
+
+    @property
+    def bodies(self) -> int:
+        return self.position.shape[1]
+
+    def index(self, name: str) -> int:
+        """
+        index of a planet by its name
+        """
+        if name not in self.names:
+            raise ValueError(f"Invalid planet name {name!r}")
+
+        return self.names.index(name)
+
+    def energy(self) -> np.ndarray:
+        """
+        total (kinetic + potential) energy of every member
+        """
+        kinetic = .5 * np.einsum("mn,mnk,mnk->m", self.mass, self.velocity, self.velocity)
+        potential = np.zeros(self.members)
+        i, j = np.triu_indices(self.bodies, 1)
+        eps2 = self.softening ** 2
+        rows = max(1, self.block_size // max(len(i), 1))
+        for start in range(0, self.members, rows):
+            stop = min(start + rows, self.members)
+            d = self.position[start:stop, j] - self.position[start:stop, i]
+            r = np.sqrt(np.einsum("mpk,mpk->mp", d, d) + eps2)
+            potential[start:stop] = -(G * self.mass[start:stop, i] * self.mass[start:stop, j] / r).sum(axis=1)
+
+        return kinetic + potential
+
+    def __gravity(self) -> np.ndarray:
+        """
+        acceleration of every body of every member, also tracks the
+        closest approach and the first contact of each member
+        """
+        m, n = self.members, self.bodies
+        acc = np.zeros((m, n, 2))
+        if n < 2:
+            return acc
+
+        eps2 = self.softening ** 2
+        touching = ((self.diameter[:, np.newaxis] + self.diameter[np.newaxis, :]) / 2) ** 2
+        np.fill_diagonal(touching, -1)
+
+        # the python version of the kernel would be far slower than numpy
+        if HAS_NUMBA:
+            contact = np.zeros(m, dtype=bool)
+            ensemble_gravity_kernel(self.position, G * self.mass, eps2, touching,
+                                    acc, self.__min_distance, contact)
+            self.__first_contact[contact & np.isnan(self.__first_contact)] = self.time
+            return acc
+
+        rows = max(1, self.block_size // (n * n))
+        diagonal = np.arange(n)
+
+        for start in range(0, m, rows):
+            stop = min(start + rows, m)
+            d = self.position[start:stop, np.newaxis, :, :] - self.position[start:stop, :, np.newaxis, :]
+            r2 = np.einsum("mijk,mijk->mij", d, d)
+
+            # a body doesn't attract itself
+            r2[:, diagonal, diagonal] = np.inf
+            self.__min_distance[start:stop] = np.minimum(self.__min_distance[start:stop], r2.min(axis=(1, 2)))
+
+            contact = (r2 <= touching).any(axis=(1, 2)) & np.isnan(self.__first_contact[start:stop])
+            self.__first_contact[start:stop][contact] = self.time
+
+            r2 += eps2
+            w = G * self.mass[start:stop, np.newaxis, :] / (r2 * np.sqrt(r2))
+            acc[start:stop] = np.einsum("mij,mijk->mik", w, d)
+
+        return acc
+
+    def iter(self, dt: float, precision: int = 2) -> None:
+        """
+        advance all members by dt (same meaning as in `Simulation.iter`)
+        :param dt: time step
+        :param precision: number of integrator steps dt is split into
+        """
+        if self.__energy is None:
+            self.__energy = self.energy()
+
+        moving = ~self.fixed
+        dt /= precision
+        for _ in range(precision):
+            match self.integrator:
+                case "euler":
+                    acc = self.__gravity()
+                    self.velocity[:, moving] += acc[:, moving] * dt
+                    self.position[:, moving] += self.velocity[:, moving] * dt
+
+                case "leapfrog":
+                    if self.__acceleration is None:
+                        self.__acceleration = self.__gravity()
+
+                    self.velocity[:, moving] += self.__acceleration[:, moving] * (dt / 2)
+                    self.position[:, moving] += self.velocity[:, moving] * dt
+                    self.__acceleration = self.__gravity()
+                    self.velocity[:, moving] += self.__acceleration[:, moving] * (dt / 2)
+
+            self.time += dt
+            speed = np.sqrt(np.einsum("mnk,mnk->mn", self.velocity, self.velocity)).max(axis=1)
+            self.__max_speed = np.maximum(self.__max_speed, speed)
+
+        self.steps += 1
+
+    def run(self, dt: float, steps: int, precision: int = 2) -> tp.Dict[str, np.ndarray]:
+        """
+        run `steps` iterations
+        :return: the summary after the run
+        """
+        for _ in range(steps):
+            self.iter(dt, precision)
+
+        return self.summary()
+
+    def summary(self) -> tp.Dict[str, np.ndarray]:
+        """
+        statistics of every member (one value / row per member):
+        min_distance: closest approach of any two bodies
+        first_contact: time the first two planets touched (nan if never)
+        max_speed: highest speed of any body
+        energy_error: relative change of the total energy since the start
+        position, velocity: the current state (M, N, 2)
+        """
+        start = self.energy() if self.__energy is None else self.__energy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            energy_error = np.abs((self.energy() - start) / start)
+
+        return {
+            "min_distance": np.sqrt(self.__min_distance),
+            "first_contact": self.__first_contact.copy(),
+            "max_speed": self.__max_speed.copy(),
+            "energy_error": np.nan_to_num(energy_error, nan=0.),
+            "position": self.position.copy(),
+            "velocity": self.velocity.copy(),
+        }
+
+
+if __name__ == "__main__":
+    # example sweep: scale the orbital velocity of the earth by +-5%
+    import setup
+    import time
+
+    ens = Ensemble(setup.objects1, 10_000)
+    earth = ens.index("Earth")
+    factors = np.linspace(.95, 1.05, ens.members)
+    ens.velocity[:, earth] *= factors[:, np.newaxis]
+
+    start = time.perf_counter()
+    stats = ens.run(dt=3600 * 6, steps=365 * 4, precision=1)
+    r = np.linalg.norm(stats["position"][:, earth] - stats["position"][:, ens.index("Sun")], axis=1)
+    print(f"{ens.members} members x {ens.bodies} bodies, one year in {time.perf_counter() - start:.1f}s")
+    for k in np.linspace(0, ens.members - 1, 5).astype(int):
+        print(f"v x {factors[k]:.3f}: sun distance after a year {r[k]:.4e} m, "
+              f"energy error {stats['energy_error'][k]:.1e}")
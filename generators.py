@@ -0,0 +1,298 @@
+"""
+Parametric scenario generators
+
+Every generator returns the bodies as arrays, ready for
+`Simulation.from_arrays(**bodies)`:
+mass (N,), position (N, 2), velocity (N, 2), diameter (N,), fixed (N,) and names.
+The same arguments (including the seed) always give the same bodies.
+
+Author:
+Nilusink
+"""
+from constants import G, PI, AU
+import typing as tp
+import numpy as np
+
+
+Bodies = tp.Dict[str, tp.Any]
+
+SUN_MASS = 1.9885e+30
+
+# name, diameter, mass, semi-major axis (AU), orbital speed (m/s) of the planets in setup.objects1
+PLANETS = (
+    ("Mercury", 2 * 2439700, 3.3011e+23, 0.387098, 47360),
+    ("Venus", 2 * 6051800, 4.8675e+24, 0.723332, 35020),
+    ("Earth", 2 * 6371000, 5.97237e+24, 1, 29780),
+    ("Mars", 2 * 3389500, 6.4171e+23, 1.666, 24007),
+    ("Jupiter", 2 * 69911000, 1.8982e+27, 5.2044, 13070),
+    ("Saturn", 2 * 60268000, 5.68343e+26, 9.5826, 9680),
+    ("Uranus", 2 * 25362000, 8.6810e+25, 19.19126, 6800),
+    ("Neptune", 2 * 24622000, 1.02413e+26, 30.07, 5430),
+)
+
+
+def bodies(mass: np.ndarray,
+           position: np.ndarray,
+           velocity: np.ndarray | None = None,
+           diameter: np.ndarray | None = None,
+           fixed: np.ndarray | None = None,
+           names: tp.Sequence[str] | None = None) -> Bodies:
+    """
+    the arrays of a scenario, missing ones are filled with zeros / empty names
+    """
+    n = len(mass)
+    return {
+        "mass": np.asarray(mass, dtype=float),
+        "position": np.asarray(position, dtype=float).reshape(n, 2),
+        "velocity": np.zeros((n, 2)) if velocity is None else np.asarray(velocity, dtype=float).reshape(n, 2),
+        "diameter": np.zeros(n) if diameter is None else np.asarray(diameter, dtype=float),
+        "fixed": np.zeros(n, dtype=bool) if fixed is None else np.asarray(fixed, dtype=bool),
+        "names": [""] * n if names is None else list(names),
+    }
+
+
+def _circular(position: np.ndarray, enclosed_mass: np.ndarray) -> np.ndarray:
+    """
+    counterclockwise velocities of circular orbits around the origin
+    """
+    r = np.maximum(np.hypot(position[:, 0], position[:, 1]), 1e-300)
+    speed = np.sqrt(G * enclosed_mass / r)
+    return np.stack((-position[:, 1], position[:, 0]), axis=1) * (speed / r)[:, np.newaxis]
+
+
+def _at_rest(body: Bodies) -> Bodies:
+    """
+    move the center of mass to the origin and remove the net momentum
+    """
+    mass = body["mass"]
+    total = mass.sum()
+    if total:
+        body["position"] -= mass @ body["position"] / total
+        body["velocity"] -= mass @ body["velocity"] / total
+
+    return body
+
+
+def random_cluster(n: int,
+                   radius: float = AU,
+                   total_mass: float = SUN_MASS,
+                   velocity_scale: float = .5,
+                   seed: int = 0) -> Bodies:
+    """
+    point masses spread uniformly over a disk with random (gaussian) velocities
+    :param n: number of bodies
+    :param radius: radius of the cluster
+    :param total_mass: mass of all bodies together, split equally
+    :param velocity_scale: velocity dispersion in units of sqrt(G * total_mass / radius)
+    :param seed: random seed
+    """
+    if n < 1:
+        raise ValueError("Invalid value for \"n\", needs to be at least 1")
+
+    rng = np.random.default_rng(seed)
+    r = radius * np.sqrt(rng.uniform(0, 1, n))
+    phi = rng.uniform(0, 2 * PI, n)
+    position = np.stack((r * np.cos(phi), r * np.sin(phi)), axis=1)
+    velocity = rng.normal(0, velocity_scale * np.sqrt(G * total_mass / radius) / np.sqrt(2), (n, 2))
+
+    return _at_rest(bodies(np.full(n, total_mass / n), position, velocity))
+
+
+def rotating_disk(n: int,
+                  radius: float = 5 * AU,
+                  central_mass: float = SUN_MASS,
+                  disk_mass: float = 1e-3 * SUN_MASS,
+                  central: bool = True,
+                  seed: int = 0) -> Bodies:
+    """
+    a central star with an exponential disk of particles on circular orbits
+    :param n: number of bodies (the star and n - 1 disk particles, or n particles without the star)
+    :param radius: outer radius of the disk, the scale length is a quarter of it
+    :param central_mass: mass of the star
+    :param disk_mass: mass of all disk particles together
+    :param central: add the star, false if it is already part of the scenario (at rest in the origin)
+    :param seed: random seed
+    """
+    if n < 1:
+        raise ValueError("Invalid value for \"n\", needs to be at least 1")
+
+    rng = np.random.default_rng(seed)
+    k = n - 1 if central else n
+    r = np.clip(rng.exponential(radius / 4, k), radius / 50, radius)
+    phi = rng.uniform(0, 2 * PI, k)
+    position = np.stack((r * np.cos(phi), r * np.sin(phi)), axis=1)
+
+    # the star and the disk mass inside the orbit pull every particle in
+    mass = np.full(k, disk_mass / k) if k else np.zeros(0)
+    inside = np.empty(k)
+    inside[np.argsort(r, kind="stable")] = np.cumsum(np.sort(mass))
+    velocity = _circular(position, central_mass + inside)
+    if not central:
+        return bodies(mass, position, velocity)
+
+    return _at_rest(bodies(
+        np.concatenate(([central_mass], mass)),
+        np.concatenate((np.zeros((1, 2)), position)),
+        np.concatenate((np.zeros((1, 2)), velocity)),
+        names=["Star"] + [""] * k,
+    ))
+
+
+def keplerian_disk(n: int,
+                   inner: float = .5 * AU,
+                   outer: float = 5 * AU,
+                   central_mass: float = SUN_MASS,
+                   disk_mass: float = 1e-6 * SUN_MASS,
+                   power: float = 1.,
+                   central: bool = True,
+                   seed: int = 0) -> Bodies:
+    """
+    the sun and a thin disk of point masses on circular keplerian orbits around it
+    :param n: number of bodies (the sun and n - 1 disk particles, or n particles without the sun)
+    :param inner: inner radius of the disk
+    :param outer: outer radius of the disk
+    :param central_mass: mass of the sun
+    :param disk_mass: mass of all disk particles together (small, only the sun sets the orbits)
+    :param power: surface density falls off as r**-power
+    :param central: add the sun, false if it is already part of the scenario (at rest in the origin)
+    :param seed: random seed
+    """
+    if n < 1:
+        raise ValueError("Invalid value for \"n\", needs to be at least 1")
+
+    if not 0 < inner < outer:
+        raise ValueError("Invalid values for \"inner\" and \"outer\", need 0 < inner < outer")
+
+    rng = np.random.default_rng(seed)
+    k = n - 1 if central else n
+
+    # inverse transform sampling of the radius, its density is r * r**-power
+    u = rng.uniform(0, 1, k)
+    exponent = 2 - power
+    if exponent:
+        r = (inner ** exponent + u * (outer ** exponent - inner ** exponent)) ** (1 / exponent)
+
+    else:
+        r = inner * (outer / inner) ** u
+
+    phi = rng.uniform(0, 2 * PI, k)
+    position = np.stack((r * np.cos(phi), r * np.sin(phi)), axis=1)
+    velocity = _circular(position, np.full(k, central_mass))
+    if not central:
+        return bodies(np.full(k, disk_mass / k), position, velocity)
+
+    return _at_rest(bodies(
+        np.concatenate(([central_mass], np.full(k, disk_mass / k) if k else np.zeros(0))),
+        np.concatenate((np.zeros((1, 2)), position)),
+        np.concatenate((np.zeros((1, 2)), velocity)),
+        np.concatenate(([2 * 696342000.], np.zeros(k))),
+        names=["Sun"] + [""] * k,
+    ))
+
+
+def collision_pile(n: int,
+                   diameter: float = 1e6,
+                   density: float = 3000,
+                   spacing: float = 1.05,
+                   infall: float = 1.,
+                   seed: int = 0) -> Bodies:
+    """
+    a dense square pile of equal planets falling together, for collision heavy runs
+    :param n: number of bodies
+    :param diameter: diameter of every body
+    :param density: density of the bodies (kg/m³, as spheres)
+    :param spacing: distance of neighbours in diameters (1: touching)
+    :param infall: speed towards the center in m/s per diameter of distance
+    :param seed: random seed for a small jitter of the positions
+    """
+    if n < 1:
+        raise ValueError("Invalid value for \"n\", needs to be at least 1")
+
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(n)))
+    grid = np.stack(np.divmod(np.arange(n), side), axis=1).astype(float)
+    position = (grid - (side - 1) / 2) * diameter * spacing
+    position += rng.uniform(-.01, .01, (n, 2)) * diameter
+    velocity = -position / diameter * infall
+
+    mass = np.full(n, density * 4 / 3 * PI * (diameter / 2) ** 3)
+    return _at_rest(bodies(mass, position, velocity, np.full(n, float(diameter))))
+
+
+def solar_system(asteroids: int = 0,
+                 inner: float = 2.1 * AU,
+                 outer: float = 3.3 * AU,
+                 seed: int = 0) -> Bodies:
+    """
+    the sun and the eight planets (as in setup.objects1), plus an optional asteroid belt
+    :param asteroids: number of asteroids (point masses of 1e15 to 1e18 kg on circular orbits)
+    :param inner: inner radius of the belt
+    :param outer: outer radius of the belt
+    :param seed: random seed of the belt
+    """
+    names = ["Sun"] + [planet[0] for planet in PLANETS]
+    diameter = np.array([2 * 696342000] + [planet[1] for planet in PLANETS], dtype=float)
+    mass = np.array([SUN_MASS] + [planet[2] for planet in PLANETS])
+    position = np.array([[0., 0.]] + [[planet[3] * AU, 0.] for planet in PLANETS])
+    velocity = np.array([[0., 0.]] + [[0., planet[4]] for planet in PLANETS])
+
+    rng = np.random.default_rng(seed)
+    r = rng.uniform(inner, outer, asteroids)
+    phi = rng.uniform(0, 2 * PI, asteroids)
+    belt = np.stack((r * np.cos(phi), r * np.sin(phi)), axis=1)
+
+    return bodies(
+        np.concatenate((mass, 10 ** rng.uniform(15, 18, asteroids))),
+        np.concatenate((position, belt)),
+        np.concatenate((velocity, _circular(belt, np.full(asteroids, SUN_MASS)))),
+        np.concatenate((diameter, np.zeros(asteroids))),
+        names=names + [""] * asteroids,
+    )
+
+
+def rms_radius(body: Bodies) -> float:
+    """
+    mass weighted rms distance from the center of mass
+    """
+    mass = body["mass"]
+    total = mass.sum()
+    center = mass @ body["position"] / total
+    return float(np.sqrt(mass @ np.sum((body["position"] - center) ** 2, axis=1) / total))
+
+
+def dynamical_time(body: Bodies) -> float:
+    """
+    sqrt(R³ / (G M)) with the rms radius R, a typical time scale of the scenario
+    """
+    r = rms_radius(body)
+    return float(np.sqrt(r ** 3 / (G * body["mass"].sum()))) if r else 1.
+
+
+def _solar_system(n: int, seed: int = 0) -> Bodies:
+    """
+    the solar system filled up to n bodies with asteroids (at least the sun and the planets)
+    """
+    return solar_system(asteroids=max(n - 1 - len(PLANETS), 0), seed=seed)
+
+
+# generators by name, all taking (n, seed=...)
+GENERATORS: tp.Dict[str, tp.Callable[..., Bodies]] = {
+    "cluster": random_cluster,
+    "disk": rotating_disk,
+    "kepler": keplerian_disk,
+    "pile": collision_pile,
+    "solar": _solar_system,
+}
+
+
+def generate(name: str, n: int, seed: int = 0, **kw) -> Bodies:
+    """
+    bodies of a generator by name
+    """
+    try:
+        generator = GENERATORS[name]
+
+    except KeyError:
+        raise ValueError(f"Invalid generator {name!r} (available: {', '.join(GENERATORS)})") from None
+
+    return generator(n, seed=seed, **kw)
@@ -0,0 +1,200 @@
+"""
+Gravity solvers used by the simulation
+Author:
+Nilusink
+"""
+from kernels import HAS_NUMBA, gravity_kernel
+from constants import G
+import typing as tp
+import numpy as np
+import importlib
+
+
+class GravitySolver:
+    """
+    Base class of all gravity solvers
+
+    A solver gets the positions (N, 2) and masses (N,) of all bodies
+    and returns the gravitational acceleration (N, 2) acting on each body.
+    If `targets` (indices) are given, only the acceleration of those
+    bodies is calculated and returned (len(targets), 2).
+    """
+    name: str = ""
+
+    def __init__(self, softening: float = 0) -> None:
+        """
+        :param softening: plummer softening length, avoids infinite forces on close encounters
+        """
+        self.softening = softening
+
+    def accelerations(self, positions: np.ndarray, masses: np.ndarray,
+                      targets: np.ndarray | None = None) -> np.ndarray:
+        raise NotImplementedError
+
+    def pair_count(self, bodies: int, targets: int) -> int:
+        """
+        number of pair interactions evaluated by the last call (every target with every other body)
+        """
+        return targets * max(bodies - 1, 0)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: softening={self.softening}>"
+
+
+class PythonGravity(GravitySolver):
+    """
+    Reference solver, calculates every pair of bodies in pure python
+    """
+    name = "python"
+
+    def accelerations(self, positions: np.ndarray, masses: np.ndarray,
+                      targets: np.ndarray | None = None) -> np.ndarray:
+        n = len(masses)
+        pos = positions.tolist()
+        mass = masses.tolist()
+        eps2 = self.softening ** 2
+        acc = [[0.0, 0.0] for _ in range(n)]
+
+        # F = G*(m1*m2)/r**2, every pair is only calculated once
+        for i in range(n):
+            xi, yi = pos[i]
+            for j in range(i + 1, n):
+                dx = pos[j][0] - xi
+                dy = pos[j][1] - yi
+                r2 = dx * dx + dy * dy + eps2
+                inv_r3 = G / (r2 * r2 ** .5)
+
+                acc[i][0] += mass[j] * dx * inv_r3
+                acc[i][1] += mass[j] * dy * inv_r3
+                acc[j][0] -= mass[i] * dx * inv_r3
+                acc[j][1] -= mass[i] * dy * inv_r3
+
+        acc = np.array(acc, dtype=float).reshape(n, 2)
+        return acc if targets is None else acc[targets]
+
+
+class NumpyGravity(GravitySolver):
+    """
+    Vectorized all-pairs solver
+
+    The interaction matrix is evaluated in row blocks, so memory stays
+    bounded by `block_size` pair interactions instead of N**2.
+    """
+    name = "numpy"
+
+    def __init__(self, softening: float = 0, block_size: int = 2**20) -> None:
+        """
+        :param softening: plummer softening length
+        :param block_size: maximum number of pair interactions evaluated at once
+        """
+        super().__init__(softening)
+        self.block_size = block_size
+
+    def accelerations(self, positions: np.ndarray, masses: np.ndarray,
+                      targets: np.ndarray | None = None) -> np.ndarray:
+        n = len(masses)
+        targets = np.arange(n) if targets is None else np.asarray(targets, dtype=np.int64)
+        acc = np.zeros((len(targets), 2))
+        if n < 2:
+            return acc
+
+        x = np.ascontiguousarray(positions[:, 0], dtype=float)
+        y = np.ascontiguousarray(positions[:, 1], dtype=float)
+        gm = G * np.asarray(masses, dtype=float)
+        eps2 = self.softening ** 2
+        rows = max(1, self.block_size // n)
+
+        for start in range(0, len(targets), rows):
+            stop = min(start + rows, len(targets))
+            block = targets[start:stop]
+            dx = x[np.newaxis, :] - x[block, np.newaxis]
+            dy = y[np.newaxis, :] - y[block, np.newaxis]
+
+            r2 = dx * dx
+            r2 += dy * dy
+            r2 += eps2
+
+            # a body doesn't attract itself
+            r2[np.arange(stop - start), block] = np.inf
+
+            w = gm / (r2 * np.sqrt(r2))
+            acc[start:stop, 0] = np.einsum("ij,ij->i", w, dx)
+            acc[start:stop, 1] = np.einsum("ij,ij->i", w, dy)
+
+        return acc
+
+
+class NumbaGravity(GravitySolver):
+    """
+    Compiled all-pairs solver, runs on all cores
+
+    Without numba installed it calculates the same result with NumpyGravity.
+    """
+    name = "numba"
+
+    def __init__(self, softening: float = 0) -> None:
+        super().__init__(softening)
+        self.__fallback = NumpyGravity(softening)
+
+    def accelerations(self, positions: np.ndarray, masses: np.ndarray,
+                      targets: np.ndarray | None = None) -> np.ndarray:
+        if not HAS_NUMBA:
+            self.__fallback.softening = self.softening
+            return self.__fallback.accelerations(positions, masses, targets)
+
+        n = len(masses)
+        targets = np.arange(n) if targets is None else np.asarray(targets, dtype=np.int64)
+        ax = np.zeros(len(targets))
+        ay = np.zeros(len(targets))
+        gravity_kernel(
+            np.ascontiguousarray(positions[:, 0], dtype=float),
+            np.ascontiguousarray(positions[:, 1], dtype=float),
+            G * np.asarray(masses, dtype=float),
+            targets,
+            float(self.softening ** 2),
+            ax,
+            ay,
+        )
+        return np.stack((ax, ay), axis=1)
+
+
+SOLVERS: tp.Dict[str, tp.Type[GravitySolver]] = {
+    PythonGravity.name: PythonGravity,
+    NumpyGravity.name: NumpyGravity,
+    NumbaGravity.name: NumbaGravity,
+}
+
+# solvers in modules of their own (which import this one), they register
+# themselves in SOLVERS when their module is imported by `get_solver`
+SOLVER_MODULES: tp.Dict[str, str] = {
+    "barnes-hut": "barnes_hut",
+    "parallel": "parallel",
+}
+
+# the fastest exact solver available
+DEFAULT_SOLVER = NumbaGravity.name if HAS_NUMBA else NumpyGravity.name
+
+
+def available_solvers() -> tp.List[str]:
+    """
+    names of all solvers, including the ones which aren't imported yet
+    """
+    return list(SOLVERS) + [name for name in SOLVER_MODULES if name not in SOLVERS]
+
+
+def get_solver(solver: "str | GravitySolver", **kw) -> GravitySolver:
+    """
+    get a solver instance by name (or pass an instance through)
+    """
+    if isinstance(solver, GravitySolver):
+        return solver
+
+    if solver not in SOLVERS and solver in SOLVER_MODULES:
+        importlib.import_module(SOLVER_MODULES[solver])
+
+    if solver not in SOLVERS:
+        raise ValueError(
+            f"Invalid value for \"solver\": {solver!r} (available: {', '.join(available_solvers())})"
+        )
+
+    return SOLVERS[solver](**kw)
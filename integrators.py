@@ -0,0 +1,335 @@
+"""
+Time integration schemes
+Author:
+Nilusink
+"""
+from constants import G
+from store import BodyStore
+import typing as tp
+import numpy as np
+
+
+# gravity(targets): write the gravitational acceleration of `targets` (or all bodies) to store.acceleration
+GravityFunction = tp.Callable[[tp.Optional[np.ndarray]], None]
+
+# collide(): resolve collisions, changes velocities and zeroes the acceleration of colliding bodies
+CollideFunction = tp.Callable[[], None]
+
+
+def _relative_change(old: np.ndarray, new: np.ndarray) -> float:
+    """
+    largest relative change of the acceleration of a body, used as local error estimate
+    (bodies without an acceleration before or after, e.g. after a collision, are ignored)
+    """
+    if not len(new):
+        return 0.
+
+    new_len = np.linalg.norm(new, axis=1)
+    change = np.linalg.norm(new - old, axis=1)
+    valid = (new_len > 0) & old.any(axis=1)
+    if not valid.any():
+        return 0.
+
+    return float((change[valid] / new_len[valid]).max())
+
+
+class Integrator:
+    """
+    Base class of all integrators
+
+    `step` advances the store by dt and returns an error estimate for the
+    step: the largest relative change of a body's acceleration during the
+    step (~ dt / dynamical time). Values well below 1 mean the step is
+    resolved, values approaching 1 mean the step is too large.
+    """
+    name: str = ""
+
+    def __init__(self) -> None:
+        self.error = 0.
+
+        # total number of single body force evaluations
+        self.force_evaluations = 0
+
+    def reset(self) -> None:
+        """
+        forget cached state (called when bodies are added or changed)
+        """
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        """
+        everything needed to continue bit-identically, for checkpoints
+        """
+        return {"name": self.name, "error": self.error, "force_evaluations": self.force_evaluations}
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        """
+        continue from a state from `state`
+        """
+        if str(state["name"]) != self.name:
+            raise ValueError(f"Invalid integrator state: {str(state['name'])!r} (expected {self.name!r})")
+
+        self.error = float(state["error"])
+        self.force_evaluations = int(state["force_evaluations"])
+
+    def step(self, store: BodyStore, dt: float, gravity: GravityFunction, collide: CollideFunction) -> float:
+        raise NotImplementedError
+
+    def _gravity(self, store: BodyStore, gravity: GravityFunction, targets: np.ndarray | None = None) -> None:
+        """
+        calculate the gravity and count the number of bodies it was calculated for
+        """
+        gravity(targets)
+        self.force_evaluations += len(store.position) if targets is None else len(targets)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}>"
+
+
+class SemiImplicitEuler(Integrator):
+    """
+    First order: forces, then v += a*dt and x += v*dt
+    """
+    name = "euler"
+
+    def step(self, store: BodyStore, dt: float, gravity: GravityFunction, collide: CollideFunction) -> float:
+        old = store.acceleration.copy()
+        self._gravity(store, gravity)
+        collide()
+
+        moving = ~store.fixed
+        store.velocity[moving] += store.acceleration[moving] * dt
+        store.position[moving] += store.velocity[moving] * dt
+
+        self.error = _relative_change(old, store.acceleration)
+        return self.error
+
+
+class Leapfrog(Integrator):
+    """
+    Second order, symplectic kick-drift-kick leapfrog (velocity verlet)
+
+    The acceleration at the end of a step is reused for the start of the
+    next one, so it costs one force evaluation per step.
+    """
+    name = "leapfrog"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._primed = False
+
+    def reset(self) -> None:
+        self._primed = False
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        return super().state() | {"primed": self._primed}
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        super().restore(state)
+        self._primed = bool(state["primed"])
+
+    def _kdk(self, store: BodyStore, dt: float, gravity: GravityFunction, collide: CollideFunction) -> float:
+        if not self._primed:
+            self._gravity(store, gravity)
+            self._primed = True
+
+        moving = ~store.fixed
+        old = store.acceleration.copy()
+        store.velocity[moving] += store.acceleration[moving] * (dt / 2)
+        store.position[moving] += store.velocity[moving] * dt
+
+        self._gravity(store, gravity)
+        collide()
+        store.velocity[moving] += store.acceleration[moving] * (dt / 2)
+
+        return _relative_change(old, store.acceleration)
+
+    def step(self, store: BodyStore, dt: float, gravity: GravityFunction, collide: CollideFunction) -> float:
+        self.error = self._kdk(store, dt, gravity, collide)
+        return self.error
+
+
+class Yoshida4(Leapfrog):
+    """
+    Fourth order, symplectic composition of three leapfrog steps (Yoshida 1990)
+    """
+    name = "yoshida4"
+
+    W1 = 1 / (2 - 2 ** (1 / 3))
+    W0 = -2 ** (1 / 3) / (2 - 2 ** (1 / 3))
+
+    def step(self, store: BodyStore, dt: float, gravity: GravityFunction, collide: CollideFunction) -> float:
+        old = store.acceleration.copy()
+        for w in (self.W1, self.W0, self.W1):
+            self._kdk(store, w * dt, gravity, collide)
+
+        self.error = _relative_change(old, store.acceleration)
+        return self.error
+
+
+def encounter_timescale(position: np.ndarray, velocity: np.ndarray, mass: np.ndarray,
+                        targets: np.ndarray | None = None, block_size: int = 2**20) -> np.ndarray:
+    """
+    shortest encounter time of every body (or `targets`) with any other body:
+    min over j of the free-fall time sqrt(r**3 / (G*(m_i+m_j))) and the crossing time r / |v_i-v_j|
+    (evaluated in row blocks like NumpyGravity, O(N) per body)
+    """
+    n = len(mass)
+    targets = np.arange(n) if targets is None else np.asarray(targets, dtype=np.int64)
+    timescale = np.full(len(targets), np.inf)
+    if n < 2:
+        return timescale
+
+    rows = max(1, block_size // n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for start in range(0, len(targets), rows):
+            stop = min(start + rows, len(targets))
+            block = targets[start:stop]
+            dx = position[np.newaxis, :, :] - position[block, np.newaxis, :]
+            dv = velocity[np.newaxis, :, :] - velocity[block, np.newaxis, :]
+            r = np.sqrt(np.einsum("ijk,ijk->ij", dx, dx))
+            v = np.sqrt(np.einsum("ijk,ijk->ij", dv, dv))
+
+            t = np.minimum(np.sqrt(r ** 3 / (G * (mass[np.newaxis, :] + mass[block, np.newaxis]))), r / v)
+            t[np.arange(stop - start), block] = np.inf
+            timescale[start:stop] = np.nan_to_num(t, nan=np.inf).min(axis=1)
+
+    return timescale
+
+
+class BlockLeapfrog(Integrator):
+    """
+    Adaptive kick-drift-kick leapfrog with individual, power of two block time steps
+
+    The step dt is split into 2**max_level ticks. Every body gets its own
+    step of dt / 2**level, with the level chosen so the step is below eta
+    times its shortest encounter time with any other body (free-fall or
+    crossing time, see `encounter_timescale`). Only bodies which finish
+    their own step get a new force evaluation and kick (everybody else is
+    drifted along), so bodies in close encounters take many small steps
+    while distant ones take few large ones. A body picks its next level at
+    the end of each of its steps; it can only move to a coarser level if
+    the current tick is aligned with it.
+
+    Collisions are resolved once per step (at its end, where all bodies are
+    synchronized), like euler and leapfrog, so collision cooldowns
+    count steps and not ticks. Choosing the levels costs O(N²) per step
+    (`encounter_timescale` compares every body with all others, also with
+    the barnes-hut solver), so this integrator is meant for small systems
+    with close encounters.
+    """
+    name = "block"
+
+    def __init__(self, eta: float = .05, max_level: int = 10) -> None:
+        """
+        :param eta: accuracy parameter, smaller values mean smaller steps
+        :param max_level: finest level, the smallest step is dt / 2**max_level
+        """
+        super().__init__()
+        self.eta = eta
+        self.max_level = max_level
+        self.levels = np.zeros(0, dtype=np.int64)
+        self.__primed = False
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: eta={self.eta}, max_level={self.max_level}>"
+
+    def reset(self) -> None:
+        self.__primed = False
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        return super().state() | {
+            "primed": self.__primed,
+            "levels": self.levels.copy(),
+            "eta": self.eta,
+            "max_level": self.max_level,
+        }
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        super().restore(state)
+        self.__primed = bool(state["primed"])
+        self.levels = np.array(state["levels"], dtype=np.int64)
+        self.eta = float(state["eta"])
+        self.max_level = int(state["max_level"])
+
+    def __periods(self, store: BodyStore, dt: float, targets: np.ndarray, tick: int) -> np.ndarray:
+        """
+        step length (in ticks) for `targets`, starting at `tick`
+        """
+        timescale = encounter_timescale(store.position, store.velocity, store.mass, targets)
+        with np.errstate(divide="ignore"):
+            levels = np.ceil(np.log2(dt / (self.eta * timescale)))
+
+        levels = np.nan_to_num(levels, nan=0, posinf=self.max_level, neginf=0)
+        levels = np.clip(levels, 0, self.max_level).astype(np.int64)
+
+        # a step has to start on a multiple of its length
+        if tick:
+            aligned = self.max_level - np.log2(tick & -tick).astype(np.int64)
+            levels = np.maximum(levels, aligned)
+
+        self.levels[targets] = levels
+        return 2 ** (self.max_level - levels)
+
+    def step(self, store: BodyStore, dt: float, gravity: GravityFunction, collide: CollideFunction) -> float:
+        n = len(store.position)
+        if not self.__primed or len(self.levels) != n:
+            self._gravity(store, gravity)
+            self.levels = np.zeros(n, dtype=np.int64)
+            self.__primed = True
+
+        ticks = 2 ** self.max_level
+        h = dt / ticks
+        moving = ~store.fixed
+        everybody = np.arange(n)
+
+        period = self.__periods(store, dt, everybody, 0)
+        next_end = period.copy()
+        store.velocity[moving] += store.acceleration[moving] * (period[moving, np.newaxis] * h / 2)
+
+        tick = 0
+        error = 0.
+        while tick < ticks:
+            # drift everybody to the next time a body finishes its step
+            following = int(next_end.min()) if n else ticks
+            store.position[moving] += store.velocity[moving] * ((following - tick) * h)
+            tick = following
+
+            active = np.flatnonzero(next_end == tick)
+            old = store.acceleration[active].copy()
+            self._gravity(store, gravity, active)
+            if tick == ticks:
+                collide()
+
+            error = max(error, _relative_change(old, store.acceleration[active]))
+
+            # closing half kick, then the opening half kick of the next step
+            end = active[moving[active]]
+            store.velocity[end] += store.acceleration[end] * (period[end, np.newaxis] * h / 2)
+            if tick < ticks:
+                period[active] = self.__periods(store, dt, active, tick)
+                next_end[active] = tick + period[active]
+                store.velocity[end] += store.acceleration[end] * (period[end, np.newaxis] * h / 2)
+
+        self.error = error
+        return error
+
+
+INTEGRATORS: tp.Dict[str, tp.Type[Integrator]] = {
+    SemiImplicitEuler.name: SemiImplicitEuler,
+    Leapfrog.name: Leapfrog,
+    Yoshida4.name: Yoshida4,
+    BlockLeapfrog.name: BlockLeapfrog,
+}
+
+
+def get_integrator(integrator: "str | Integrator", **kw) -> Integrator:
+    """
+    get an integrator instance by name (or pass an instance through)
+    """
+    if isinstance(integrator, Integrator):
+        return integrator
+
+    if integrator not in INTEGRATORS:
+        raise ValueError(f"Invalid value for \"integrator\": {integrator!r} (available: {', '.join(INTEGRATORS)})")
+
+    return INTEGRATORS[integrator](**kw)
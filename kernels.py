@@ -0,0 +1,152 @@
+"""
+Compiled inner loops for gravity and collisions
+
+If numba is installed, the kernels are compiled on first use, otherwise
+the same functions run as plain python. tests/test_kernels.py checks
+both versions against the numpy / python solvers and the original
+per pair collision response.
+Author:
+Nilusink
+"""
+import numpy as np
+import math
+
+try:
+    import numba
+
+except ImportError:
+    numba = None
+
+
+HAS_NUMBA = numba is not None
+prange = numba.prange if HAS_NUMBA else range
+
+
+def _gravity(x: np.ndarray, y: np.ndarray, gm: np.ndarray, targets: np.ndarray,
+             eps2: float, ax: np.ndarray, ay: np.ndarray) -> None:
+    """
+    all-pairs gravitational acceleration of `targets`, written to ax / ay
+    :param gm: G * mass of every body
+    """
+    n = len(x)
+    for k in prange(len(targets)):
+        i = targets[k]
+        xi = x[i]
+        yi = y[i]
+        sx = 0.
+        sy = 0.
+        for j in range(n):
+            if j == i:
+                continue
+
+            dx = x[j] - xi
+            dy = y[j] - yi
+            r2 = dx * dx + dy * dy + eps2
+            w = gm[j] / (r2 * math.sqrt(r2))
+            sx += w * dx
+            sy += w * dy
+
+        ax[k] = sx
+        ay[k] = sy
+
+
+def _ensemble_gravity(position: np.ndarray, gm: np.ndarray, eps2: float, touching: np.ndarray,
+                      acc: np.ndarray, min_r2: np.ndarray, contact: np.ndarray) -> None:
+    """
+    all-pairs gravity of every member of an ensemble, written to acc (M, N, 2)
+    :param position: (M, N, 2) positions
+    :param gm: (M, N) G * mass
+    :param touching: (N, N) squared contact distance of each pair
+    :param min_r2: (M,) closest squared distance of any pair, lowered in place
+    :param contact: (M,) set to True if any pair touches
+    """
+    n = position.shape[1]
+    for m in prange(position.shape[0]):
+        for i in range(n):
+            xi = position[m, i, 0]
+            yi = position[m, i, 1]
+            sx = 0.
+            sy = 0.
+            for j in range(n):
+                if j == i:
+                    continue
+
+                dx = position[m, j, 0] - xi
+                dy = position[m, j, 1] - yi
+                r2 = dx * dx + dy * dy
+                if r2 < min_r2[m]:
+                    min_r2[m] = r2
+
+                if r2 <= touching[i, j]:
+                    contact[m] = True
+
+                r2 += eps2
+                w = gm[m, j] / (r2 * math.sqrt(r2))
+                sx += w * dx
+                sy += w * dy
+
+            acc[m, i, 0] = sx
+            acc[m, i, 1] = sy
+
+
+def _resolve_collisions(now: np.ndarray, influence: np.ndarray,
+                        position: np.ndarray, velocity: np.ndarray,
+                        acceleration: np.ndarray, mass: np.ndarray) -> np.ndarray:
+    """
+    elastic collision response for touching pairs, in the given order
+
+    Every body collides at most once per call as the "now" body of a pair.
+    The velocities are split into the collision normal and the carried
+    (tangential) part, only the normal part takes part in the collision:
+    v1' = (m1*v1 + m2*(2*v2-v1)) / (m1+m2)
+    :return: which pairs actually collided
+    """
+    done = np.zeros(len(mass), dtype=np.bool_)
+    collided = np.zeros(len(now), dtype=np.bool_)
+    for k in range(len(now)):
+        i = now[k]
+        j = influence[k]
+        if done[i]:
+            continue
+
+        done[i] = True
+        done[j] = True
+        collided[k] = True
+
+        dx = position[i, 0] - position[j, 0]
+        dy = position[i, 1] - position[j, 1]
+        dist = math.sqrt(dx * dx + dy * dy)
+        nx, ny = 1., 0.
+        if dist > 0:
+            nx = dx / dist
+            ny = dy / dist
+
+        u1 = velocity[i, 0] * nx + velocity[i, 1] * ny
+        u2 = velocity[j, 0] * nx + velocity[j, 1] * ny
+        m1 = mass[i]
+        m2 = mass[j]
+
+        u1_new = (m1 * u1 + m2 * (2 * u2 - u1)) / (m1 + m2)
+        u2_new = (m2 * u2 + m1 * (2 * u1 - u2)) / (m1 + m2)
+
+        velocity[i, 0] += (u1_new - u1) * nx
+        velocity[i, 1] += (u1_new - u1) * ny
+        velocity[j, 0] += (u2_new - u2) * nx
+        velocity[j, 1] += (u2_new - u2) * ny
+        acceleration[i, 0] = 0.
+        acceleration[i, 1] = 0.
+        acceleration[j, 0] = 0.
+        acceleration[j, 1] = 0.
+
+    return collided
+
+
+if HAS_NUMBA:
+    gravity_kernel = numba.njit(cache=True, parallel=True)(_gravity)
+    resolve_collisions = numba.njit(cache=True)(_resolve_collisions)
+    ensemble_gravity_kernel = numba.njit(cache=True, parallel=True)(_ensemble_gravity)
+
+else:
+    gravity_kernel = _gravity
+    ensemble_gravity_kernel = _ensemble_gravity
+    resolve_collisions = _resolve_collisions
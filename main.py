@@ -1,7 +1,16 @@
 from objects import Vector, Simulation, Planet, BasicObject
+from scheduler import FixedStepScheduler
+from renderer import Renderer, SpatialIndex, premultiply, by_priority
+from snapshot import SnapshotExchange
+from profiler import Profiler, null_phase
+from replay import Replay
+from scenario import resolve
 from threading import Thread
 from setup import objects
 import pygame as pg
+import numpy as np
+import argparse
+import math
 import time
 
 
@@ -19,6 +28,15 @@ SCALE = 1*10**(-8)
 # how many "fake" seconds one real second represents
 TIME_SCALE = 1
 
+# physics steps per real second, every step is TIME_SCALE / PHYSICS_RATE "fake" seconds long
+PHYSICS_RATE = 300
+
+# maximum physics steps per loop when the physics falls behind
+MAX_CATCH_UP = 10
+
+# euler, leapfrog, yoshida4 or block (adaptive)
+INTEGRATOR = "euler"
+
 # graphics configuration
 FOLLOW_CENTER = False   # can be toggled by pressing f
 PAUSE = True   # can be toggled by pressing p
@@ -28,11 +46,14 @@ COLLISION = True    # c
 AUTO_SCALE = True   # a
 SHOW_TRACE = True   # t
 TRACE_LENGTH = 1000
+MAX_TRACED = 20_000     # traces take 32 kB per object, larger scenarios run without them
 SHOW_INFO = True    # i
 SHOW_RADIUS = True  # r
 REAL_DIAMETER = True   # d
 WINDOW_SIZE = (1920, 1080)
 SHOW_NAMES = False  # n
+MAX_LABELS = 200    # lines and labels are only drawn for this many objects on screen, the heaviest first
+PROFILE = False     # o, time the physics and render phases and show them in the info
 
 
 def calculate_offset(center: Vector) -> Vector:
@@ -50,10 +71,10 @@ def calculate_scale(window_size: tuple, system_size: Vector) -> float:
     return min(x_size/2.5, y_size/2.5)
 
 
-def handle_pygame_events() -> None:
+def handle_pygame_events(replay: Replay | None = None) -> None:
     global FOLLOW_CENTER, PAUSE, SCALE, SHOW_VELOCITY
     global GRAVITY, AUTO_SCALE, COLLISION, SHOW_TRACE, SHOW_INFO
-    global REAL_DIAMETER, SHOW_RADIUS, SHOW_NAMES
+    global REAL_DIAMETER, SHOW_RADIUS, SHOW_NAMES, PROFILE
     for event in pg.event.get():
         match event.type:
             case pg.QUIT:
@@ -96,6 +117,23 @@ def handle_pygame_events() -> None:
                     case pg.K_n:
                         SHOW_NAMES = not SHOW_NAMES
 
+                    case pg.K_o:
+                        PROFILE = not PROFILE
+
+                    # replay controls: seek with left / right, speed with up / down
+                    case pg.K_LEFT | pg.K_RIGHT if replay is not None:
+                        frames = max(1, len(replay.trajectory) // 100)
+                        replay.seek_frames(frames if event.key == pg.K_RIGHT else -frames)
+
+                    case pg.K_UP if replay is not None:
+                        replay.speed *= 2
+
+                    case pg.K_DOWN if replay is not None:
+                        replay.speed /= 2
+
+                    case pg.K_HOME if replay is not None:
+                        replay.seek(replay.start)
+
             case pg.MOUSEBUTTONDOWN:
                 match event.button:
                     case 4:
@@ -105,22 +143,34 @@ def handle_pygame_events() -> None:
                         SCALE -= SCALE*0.1
 
 
-def main() -> None:
+def main(replay: Replay | None = None, profiler: Profiler | None = None, scenario: str | None = None) -> None:
     """
     Runs the program
+    :param replay: play a recorded trajectory instead of simulating
+    :param scenario: scenario file or "generator:n[:seed]" to simulate instead of setup.objects
+    :param profiler: records the phases while PROFILE is enabled, a new one is used if not given
     """
     global SCALE
+    profiler = profiler if profiler is not None else Profiler()
     screen = pg.display.set_mode(WINDOW_SIZE, pg.SCALED)
-    surface0 = pg.Surface(WINDOW_SIZE, pg.SRCALPHA, 32)
-    surface1 = pg.Surface(WINDOW_SIZE, pg.SRCALPHA, 32)
-    surface2 = pg.Surface(WINDOW_SIZE, pg.SRCALPHA, 32)
     font = pg.font.SysFont(None, 24)
+    renderer = Renderer(screen, font)
+    distance_color = premultiply(DISTANCE_COLOR)
     pg.display.set_caption("Gravity Sim")
     pg.mouse.set_visible(False)
 
     # set initial Objects
+    if replay is not None:
+        # no physics, the store only holds the state of the current frame
+        sim = Simulation(replay.objects(), trace_length=0)
 
-    sim = Simulation(objects)
+    elif scenario is not None:
+        bodies = resolve(scenario)
+        trace_length = TRACE_LENGTH if len(bodies["mass"]) <= MAX_TRACED else 0
+        sim = Simulation.from_arrays(**bodies, trace_length=trace_length, integrator=INTEGRATOR)
+
+    else:
+        sim = Simulation(objects, trace_length=TRACE_LENGTH, integrator=INTEGRATOR)
 
     SCALE = calculate_scale(WINDOW_SIZE, sim.size)
     orig_scale = SCALE
@@ -128,103 +178,170 @@ def main() -> None:
     # so you can position your objects better
     print(f"total grid size: {WINDOW_SIZE[0] / SCALE}x{WINDOW_SIZE[1] / SCALE}")
 
-    def mass_scale_multiplier() -> float:
-        return 20 / (sim.total_mass / len(sim.objects))
-
-    start = time.perf_counter()
     offset = calculate_offset(sim.gravity_center*SCALE)
 
+    # fixed physics step, the renderer interpolates between the last two states
+    scheduler = FixedStepScheduler(step=TIME_SCALE / PHYSICS_RATE, time_scale=TIME_SCALE, max_steps=MAX_CATCH_UP)
+    previous = sim.store.position.copy()
+
+    # the physics thread publishes snapshots, the renderer only reads those
+    # (with a copy of the traces, thinned out to what the renderer draws)
+    exchange = SnapshotExchange(trace_points=renderer.max_trace_points if SHOW_TRACE else 0)
+    exchange.publish(sim)
+
+    def physics_step(dt: float) -> None:
+        nonlocal previous
+        previous = sim.store.position.copy()
+        sim.profiler = profiler if PROFILE else None
+        sim.iter(dt, gravity=GRAVITY, collision=COLLISION, precision=3)
+
     running = True
     def physics_calculator() -> None:
         """
         runs the physics calculations in a loop
         """
-        nonlocal start
         while running:
+            if PAUSE:
+                scheduler.reset()
+                time.sleep(.01)
+                continue
+
             # calculate physics
-            now = time.perf_counter()
-            dt = now-start
-            if not PAUSE:
-                sim.iter((dt)*TIME_SCALE, gravity=GRAVITY, collision=COLLISION, precision=3)
-            start = now
+            if scheduler.advance(physics_step):
+                exchange.publish(sim, previous)
+
+            else:
+                time.sleep(scheduler.time_to_next_step)
 
-    Thread(target=physics_calculator).start()
+    if replay is None:
+        Thread(target=physics_calculator).start()
+
+    last_frame = time.perf_counter()
+
+    # world radius of every object and a spatial index of the latest snapshot, rebuilt for new snapshots
+    index: SpatialIndex | None = None
+    index_key = None
+    world_radii = np.zeros(0)
     try:
         while True:
             # for FPS counter
             now = time.perf_counter()
-            dt = now - start
-            start = now
+            dt = now - last_frame
+            last_frame = now
+            phase = profiler.phase if PROFILE else null_phase
+
+            if replay is not None:
+                if not PAUSE:
+                    replay.advance(dt)
+
+                # the replay is published like a physics step
+                sim.store.position[:] = replay.positions()
+                sim.store.velocity[:] = replay.velocities()
+                sim.store.touch()
+                exchange.publish(sim)
+
+            exchange.trace_points = renderer.max_trace_points if SHOW_TRACE else 0
+            snap = exchange.latest()
+
+            trace_samples = trace_counts = None
+            if SHOW_TRACE and replay is not None:
+                trace_samples = replay.traces(TRACE_LENGTH)
+                trace_counts = np.full(len(trace_samples), trace_samples.shape[1])
+                trace_length = TRACE_LENGTH
+
+            elif SHOW_TRACE and snap.trace.shape[1]:
+                trace_samples, trace_counts, trace_length = snap.trace, snap.trace_counts, snap.trace_length
 
-            # draw objects
             screen.fill(BLACK)
-            surface0.fill(BLACK)
-            surface1.fill((0, 0, 0, 0))
-            surface2.fill((0, 0, 0, 0))
             if FOLLOW_CENTER:
-                offset = calculate_offset(sim.gravity_center*SCALE)
+                offset = calculate_offset(Vector(*snap.gravity_center.tolist())*SCALE)
 
             # scale the simulation if enabled
             if AUTO_SCALE:
-                tmp = calculate_scale(WINDOW_SIZE, sim.size)
+                tmp = calculate_scale(WINDOW_SIZE, Vector(*snap.size.tolist()))
                 SCALE = min(tmp, SCALE)
 
-            # draw center of mass
-            gc = sim.gravity_center
-            gc_pos = gc.x * SCALE - offset.x, gc.y * SCALE - offset.y
-            pg.draw.circle(surface2, RED, gc_pos, 2)
-
-            # iterate objects and draw them
-            for element in sim.objects:
-                element: BasicObject | Planet
-                # calculate position and scale
-                pos = element.position.x*SCALE-offset.x, element.position.y*SCALE-offset.y
-                scale = element.mass*mass_scale_multiplier()*(SCALE/orig_scale)
-                scale = scale if scale > 1 else 1
-
-                # if the object is a planet and REAL_DIAMETER is true,
-                # set the size of the sphere to the correct size
-                scale = scale
-                if type(element) == Planet and REAL_DIAMETER:
-                    scale = (element.diameter/2) * SCALE
-                    scale = 1 if scale < 1 else scale
-
-                # draw object
-                pg.draw.circle(surface1, WHITE, pos, scale)
-
-                # draw trace
-                if SHOW_TRACE:
-                    for i, trace in enumerate(element.trace[-TRACE_LENGTH::]):
-                        pos = trace.x*SCALE-offset.x, trace.y*SCALE-offset.y
-                        pg.draw.circle(surface0, TRACE_COLOR+(i*(255/TRACE_LENGTH),), pos, 1)
-
-                # draw center line
-                if SHOW_RADIUS:
-                    gc_vec = Vector.from_cartesian(*gc_pos)
-                    radius = gc_vec - Vector.from_cartesian(*pos)
-                    pg.draw.line(surface0, DISTANCE_COLOR, gc_pos, pos)
-                    r = font.render(f"r={round(radius.length/SCALE, 2)}m", True, DISTANCE_COLOR)
-                    r_pos = gc_vec - radius/2
-                    surface0.blit(r, (r_pos.x, r_pos.y))
-
-                # draw velocity label and direction
-                if SHOW_VELOCITY:
-                    velocity = font.render(f"{round(element.velocity.length, 3)} m/s", True, BLUE)
-                    surface0.blit(velocity, (pos[0]+scale, pos[1]-scale))
-
-                    tmp = Vector.from_polar(angle=element.velocity.angle, length=scale*2)
-                    p2x = pos[0] + tmp.x
-                    p2y = pos[1] + tmp.y
-                    pg.draw.line(surface0, BLUE, pos, (p2x, p2y))
-
-                # # draw name label
-                if type(element) == Planet and SHOW_NAMES:
-                    name = font.render(element.name, True, RED)
-                    surface0.blit(name, (pos[0]+scale, pos[1]+scale))
+            # size of every object, if REAL_DIAMETER is true, planets get their real size
+            if index is None or index_key != (snap.serial, REAL_DIAMETER):
+                with phase("render index"):
+                    mass_scale_multiplier = 20 / (snap.total_mass / len(snap))
+                    world_radii = snap.mass * mass_scale_multiplier / orig_scale
+                    if REAL_DIAMETER:
+                        world_radii[snap.collides] = snap.diameter[snap.collides] / 2
+
+                    # objects move by up to one step while the renderer interpolates
+                    shift = snap.position - snap.previous
+                    moved = float(np.sqrt(np.einsum("nk,nk->n", shift, shift).max())) if len(snap) else 0.
+                    index = SpatialIndex(snap.position, world_radii, moved)
+                    index_key = (snap.serial, REAL_DIAMETER)
+
+            # only objects near the screen (with a margin for the minimum size of one pixel)
+            rows = index.query(
+                ((offset.x - 2) / SCALE, (offset.y - 2) / SCALE),
+                ((offset.x + WINDOW_SIZE[0] + 2) / SCALE, (offset.y + WINDOW_SIZE[1] + 2) / SCALE)
+            )
+            positions = scheduler.interpolate(snap.previous[rows], snap.position[rows])
+            screen_positions = positions * SCALE - (offset.x, offset.y)
+            radii = np.maximum(world_radii[rows] * SCALE, 1)
+
+            # draw traces
+            if trace_samples is not None:
+                with phase("render traces"):
+                    renderer.traces(
+                        trace_samples, trace_counts, SCALE, (offset.x, offset.y), TRACE_COLOR, trace_length
+                    )
+
+            # center of mass
+            gc = snap.gravity_center
+            gc_pos = gc[0] * SCALE - offset.x, gc[1] * SCALE - offset.y
+
+            # lines and labels, only for the heaviest objects on screen
+            with phase("render labels"):
+                visible = by_priority(renderer.visible(screen_positions, radii), snap.mass[rows], MAX_LABELS)
+                velocities = snap.velocity[rows[visible]]
+                speeds = np.hypot(velocities[:, 0], velocities[:, 1])
+                for row, pos, scale, (vx, vy), speed in zip(
+                        rows[visible].tolist(),
+                        screen_positions[visible].tolist(),
+                        radii[visible].tolist(),
+                        velocities.tolist(),
+                        speeds.tolist()
+                ):
+                    # draw center line
+                    if SHOW_RADIUS:
+                        pg.draw.line(screen, distance_color, gc_pos, pos)
+                        dx, dy = gc_pos[0] - pos[0], gc_pos[1] - pos[1]
+                        renderer.text(
+                            f"r={round(math.hypot(dx, dy)/SCALE, 2)}m",
+                            (gc_pos[0] - dx/2, gc_pos[1] - dy/2),
+                            DISTANCE_COLOR[:3]
+                        )
+
+                    # draw velocity label and direction
+                    if SHOW_VELOCITY:
+                        renderer.text(f"{round(speed, 3)} m/s", (pos[0]+scale, pos[1]-scale), BLUE)
+                        if speed:
+                            p2x = pos[0] + vx / speed * scale*2
+                            p2y = pos[1] + vy / speed * scale*2
+                            pg.draw.line(screen, BLUE, pos, (p2x, p2y))
+
+                    # draw name label
+                    if snap.collides[row] and SHOW_NAMES:
+                        renderer.text(snap.names[row], (pos[0]+scale, pos[1]+scale), RED)
+
+            # draw objects
+            with phase("render bodies"):
+                renderer.bodies(screen_positions, radii, WHITE)
+
+            pg.draw.circle(screen, RED, gc_pos, 2)
 
             # draw toggle infos
             inf = [
                 f"FPS: {round(1/dt, 1)}",
+                f"Bodies: {len(rows)}/{len(snap)} near the screen",
+                f"Physics steps: {scheduler.steps} (dropped: {scheduler.dropped})" if replay is None else
+                f"Replay: frame {replay.index + 1}/{len(replay.trajectory)}, t={replay.time:.6g}s, "
+                f"speed: {replay.speed:.3g}s/s",
                 f"Gravity: {GRAVITY}",
                 f"Collision: {COLLISION}",
                 f"scale: {SCALE}",
@@ -235,33 +352,61 @@ def main() -> None:
                 f"show Velocity: {SHOW_VELOCITY}",
                 f"show Radius: {SHOW_RADIUS}",
                 f"show Trace: {SHOW_TRACE}",
-                f"show Names: {SHOW_NAMES}"
+                f"show Names: {SHOW_NAMES}",
+                f"Profile: {PROFILE}"
             ]
 
+            if PROFILE:
+                inf.extend(profiler.hud())
+
             if SHOW_INFO:
                 for i, line in enumerate(inf):
-                    img = font.render(line, True, WHITE)
-                    surface2.blit(img, (0, 20*i))
+                    renderer.text(line, (0, 20*i), WHITE)
 
             # handle pygame events
-            handle_pygame_events()
+            handle_pygame_events(replay)
 
             # update screen
-            screen.blit(surface0, (0, 0))
-            screen.blit(surface1, (0, 0))
-            screen.blit(surface2, (0, 0))
-            pg.display.update()
+            with phase("display"):
+                pg.display.update()
 
     finally:
         running = False
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="2D gravity simulation")
+    parser.add_argument("--scenario", help="scenario file (.toml, .json, .npz, .csv) or \"generator:n[:seed]\" "
+                                           "to simulate instead of setup.objects")
+    parser.add_argument("--replay", help="play a trajectory file (see batch.py --trajectory) instead of simulating")
+    parser.add_argument("--speed", type=float, help="replay speed in simulated seconds per second")
+    parser.add_argument("--frame-skip", type=int, default=0, help="replay n recorded frames per rendered frame")
+    parser.add_argument("--start", type=float, help="replay start time in simulated seconds")
+    parser.add_argument("--profile", help="enable profiling, write a summary of the phase timings to this json file")
+    parser.add_argument("--profile-trace", help="enable profiling, write all timings as Chrome trace to this file")
+    args = parser.parse_args()
+
+    replay = None
+    if args.replay is not None:
+        replay = Replay(args.replay, speed=args.speed, frame_skip=args.frame_skip)
+        if args.start is not None:
+            replay.seek(args.start)
+
+    profiler = Profiler()
+    if args.profile or args.profile_trace:
+        PROFILE = True
+
     try:
         pg.init()
         pg.font.init()
-        main()
+        main(replay, profiler, args.scenario)
 
     finally:
         pg.quit()
         pg.font.quit()
+
+        if args.profile:
+            profiler.dump_json(args.profile)
+
+        if args.profile_trace:
+            profiler.dump_chrome_trace(args.profile_trace)
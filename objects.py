@@ -3,49 +3,59 @@ Classes of all the physics objects
 Author:
 Nilusink
 """
+from gravity import GravitySolver, get_solver, DEFAULT_SOLVER
+from store import BodyStore
+from traces import TraceBuffer
+from collision import touching_pairs
+from contacts import ContactTable, pair_keys
+from kernels import resolve_collisions
+from integrators import Integrator, get_integrator
+from profiler import Profiler, null_phase
+from analytics import Observer
+from constants import G, PI, AU
 import typing as tp
 import numpy as np
+import math
+import gc
 
-# gravitational constant
-G: float = 6.67408e-11
 
-# pi
-PI = 3.1415926535897932384626433832795028841971
-
-# one astronomical unit
-AU = 149597870700
+# what happens to touching planets: bounce off each other or merge into one body
+COLLISION_MODES = ("elastic", "merge")
 
 
 class Vector:
+    """
+    2D vector, the cartesian coordinates are the source of truth,
+    length and angle are calculated lazily and cached until x or y change
+    """
+    __slots__ = ("__x", "__y", "__angle", "__length")
+
     x: float
     y: float
     angle: float
     length: float
 
     # creation of new elements
-    def __init__(self) -> None:
-        self.__x: float = 0
-        self.__y: float = 0
-        self.__angle: float = 0
-        self.__length: float = 0
+    def __init__(self, x: float = 0, y: float = 0) -> None:
+        self.__x: float = x
+        self.__y: float = y
+        self.__angle: float | None = None
+        self.__length: float | None = None
 
     @staticmethod
     def from_cartesian(x: float, y: float) -> "Vector":
-        p = Vector()
-        p.x = x
-        p.y = y
-
-        return p
+        return Vector(x, y)
 
     @staticmethod
     def from_polar(angle: float, length: float) -> "Vector":
-        p = Vector()
         while angle > 2*PI:
             angle -= 2*PI
         while angle < 0:
             angle += 2*PI
-        p.angle = angle
-        p.length = length
+
+        p = Vector(math.cos(angle) * length, math.sin(angle) * length)
+        p.__angle = angle
+        p.__length = length
 
         return p
 
@@ -57,7 +67,7 @@ class Vector:
     @x.setter
     def x(self, value: float) -> None:
         self.__x = value
-        self.__update("c")
+        self.__angle = self.__length = None
 
     @property
     def y(self) -> float:
@@ -66,13 +76,16 @@ class Vector:
     @y.setter
     def y(self, value: float) -> None:
         self.__y = value
-        self.__update("c")
+        self.__angle = self.__length = None
 
     @property
     def angle(self) -> float:
         """
         value in radian
         """
+        if self.__angle is None:
+            self.__angle = math.atan2(self.__y, self.__x)
+
         return self.__angle
 
     @angle.setter
@@ -80,59 +93,101 @@ class Vector:
         """
         value in radian
         """
+        length = self.length
+        self.__x = math.cos(value) * length
+        self.__y = math.sin(value) * length
         self.__angle = value
-        self.__update("p")
 
     @property
     def length(self) -> float:
+        if self.__length is None:
+            self.__length = math.hypot(self.__x, self.__y)
+
         return self.__length
 
     @length.setter
     def length(self, value: float) -> None:
+        angle = self.angle
+        self.__x = math.cos(angle) * value
+        self.__y = math.sin(angle) * value
         self.__length = value
-        self.__update("p")
 
     # maths
     def __add__(self, other) -> "Vector":
         if type(other) == Vector:
-            return Vector.from_cartesian(x=self.x + other.x, y=self.y + other.y)
+            return Vector(self.__x + other.__x, self.__y + other.__y)
 
-        return Vector.from_cartesian(x=self.x + other, y=self.y + other)
+        return Vector(self.__x + other, self.__y + other)
 
     def __sub__(self, other) -> "Vector":
         if type(other) == Vector:
-            return Vector.from_cartesian(x=self.x - other.x, y=self.y - other.y)
+            return Vector(self.__x - other.__x, self.__y - other.__y)
 
-        return Vector.from_cartesian(x=self.x - other, y=self.y - other)
+        return Vector(self.__x - other, self.__y - other)
 
     def __mul__(self, other) -> "Vector":
         if type(other) == Vector:
             return Vector.from_polar(angle=self.angle + other.angle, length=self.length * other.length)
 
-        return Vector.from_cartesian(x=self.x * other, y=self.y * other)
+        return Vector(self.__x * other, self.__y * other)
 
     def __truediv__(self, other) -> "Vector":
-        return Vector.from_cartesian(x=self.x / other, y=self.y / other)
+        return Vector(self.__x / other, self.__y / other)
 
-    # internal functions
-    def __update(self, calc_from: str) -> None:
-        """
-        :param calc_from: polar (p) | cartesian (c)
-        """
-        if calc_from in ("p", "polar"):
-            self.__x = np.cos(self.angle) * self.length
-            self.__y = np.sin(self.angle) * self.length
-            return
+    # in-place maths, modify the vector instead of creating a new one
+    def __iadd__(self, other) -> "Vector":
+        if type(other) == Vector:
+            self.__x += other.__x
+            self.__y += other.__y
 
-        elif calc_from in ("c", "cartesian"):
-            self.__length = np.sqrt(self.x**2 + self.y**2)
-            self.__angle = np.arctan2(self.y, self.x)
-            return
+        else:
+            self.__x += other
+            self.__y += other
+
+        self.__angle = self.__length = None
+        return self
+
+    def __isub__(self, other) -> "Vector":
+        if type(other) == Vector:
+            self.__x -= other.__x
+            self.__y -= other.__y
+
+        else:
+            self.__x -= other
+            self.__y -= other
 
-        raise ValueError("Invalid value for \"calc_from\"")
+        self.__angle = self.__length = None
+        return self
+
+    def __imul__(self, other) -> "Vector":
+        if type(other) == Vector:
+            angle = self.angle + other.angle
+            length = self.length * other.length
+            self.__x = math.cos(angle) * length
+            self.__y = math.sin(angle) * length
+            self.__angle = self.__length = None
+            return self
+
+        # scaling keeps the angle for positive factors
+        self.__x *= other
+        self.__y *= other
+        self.__length = None
+        if other <= 0:
+            self.__angle = None
+
+        return self
+
+    def __itruediv__(self, other) -> "Vector":
+        self.__x /= other
+        self.__y /= other
+        self.__length = None
+        if other <= 0:
+            self.__angle = None
+
+        return self
 
     def __abs__(self) -> float:
-        return np.sqrt(self.x**2 + self.y**2)
+        return math.hypot(self.__x, self.__y)
 
     def __repr__(self) -> str:
         return f"<\n" \
@@ -143,6 +198,8 @@ class Vector:
 
 
 class BasicObject:
+    __slots__ = ("_store", "_index")
+
     def __init__(self, mass: float,
                  position: Vector,
                  velocity: Vector = Vector.from_cartesian(0, 0),
@@ -150,42 +207,101 @@ class BasicObject:
                  fixed: bool = False) -> None:
         """
         Basic physics object
+
+        The state lives in a BodyStore, the object itself is only a view of
+        its row. Until it is added to a Simulation, it has a store of its own.
         :param mass: mass
         :param position: x start position
         :param velocity: start velocity
         :param acceleration: the start acceleration of the object
         :param fixed: if true, the object won't be moved in the simulation
         """
-        self.__mass = mass
-        self.__position = position
-        self.__trace: tp.List[Vector] = []
-        self.velocity = velocity
-        self.acceleration = acceleration
-        self.fixed = fixed
+        self._store = BodyStore(capacity=1)
+        self._index = self._store.add(
+            mass=mass,
+            position=(position.x, position.y),
+            velocity=(velocity.x, velocity.y),
+            acceleration=(acceleration.x, acceleration.y),
+            fixed=fixed,
+            view=self,
+        )
+
+    @classmethod
+    def _view(cls, store: BodyStore, index: int) -> "BasicObject":
+        """
+        handle of an existing row in `store` (without creating a store of its own)
+        """
+        object_ = cls.__new__(cls)
+        object_._store = store
+        object_._index = index
+        return object_
 
     @property
     def mass(self) -> float:
-        return self.__mass
+        return float(self._store.mass[self._index])
 
     @property
     def position(self) -> Vector:
-        return self.__position
+        """
+        a copy of the current position, assign a new vector to change it
+        """
+        return Vector.from_cartesian(*self._store.position[self._index].tolist())
 
     @position.setter
     def position(self, pos: Vector) -> None:
-        self.__trace.append(pos)
-        self.__position = pos
+        self._store.position[self._index] = pos.x, pos.y
+        self._store.touch()
 
     @property
-    def trace(self) -> tp.List[Vector]:
-        return self.__trace
+    def velocity(self) -> Vector:
+        return Vector.from_cartesian(*self._store.velocity[self._index].tolist())
+
+    @velocity.setter
+    def velocity(self, value: Vector) -> None:
+        self._store.velocity[self._index] = value.x, value.y
+
+    @property
+    def acceleration(self) -> Vector:
+        return Vector.from_cartesian(*self._store.acceleration[self._index].tolist())
+
+    @acceleration.setter
+    def acceleration(self, value: Vector) -> None:
+        self._store.acceleration[self._index] = value.x, value.y
+
+    @property
+    def fixed(self) -> bool:
+        return bool(self._store.fixed[self._index])
+
+    @fixed.setter
+    def fixed(self, value: bool) -> None:
+        self._store.fixed[self._index] = value
+
+    @property
+    def trace(self) -> np.ndarray:
+        """
+        the recorded positions (n, 2), oldest first, as a read-only view
+        (empty unless the simulation was created with a `trace_length`)
+        """
+        if self._store.trace is None:
+            return np.zeros((0, 2))
+
+        return self._store.trace.last(self._index)
 
 
 class Planet(BasicObject):
+    __slots__ = ("__name",)
+
     def __init__(self, name: str, diameter: float, *args, **kw):
         super().__init__(*args, **kw)
         self.__name = name
-        self.__d = diameter
+        self._store.diameter[self._index] = diameter
+        self._store.collides[self._index] = True
+
+    @classmethod
+    def _view(cls, store: BodyStore, index: int, name: str = "") -> "Planet":
+        object_ = super()._view(store, index)
+        object_.__name = name
+        return object_
 
     @property
     def name(self) -> str:
@@ -193,138 +309,488 @@ class Planet(BasicObject):
 
     @property
     def diameter(self) -> float:
-        return self.__d
+        return float(self._store.diameter[self._index])
 
 
 class Simulation:
-    def __init__(self, objects: tp.List[BasicObject] | tp.Tuple[BasicObject]) -> None:
+    def __init__(self, objects: tp.List[BasicObject] | tp.Tuple[BasicObject],
+                 solver: str | GravitySolver = DEFAULT_SOLVER,
+                 trace_length: int = 0,
+                 trace_every: int = 1,
+                 broad_phase: str = "grid",
+                 integrator: str | Integrator = "euler",
+                 collision_mode: str = "elastic",
+                 profiler: Profiler | None = None,
+                 observers: tp.Sequence[Observer] = ()) -> None:
         """
         All Objects to simulate should be in this class
+        :param objects: the objects to simulate
+        :param solver: gravity solver name ("python", "numpy", "numba", "barnes-hut") or a GravitySolver instance,
+            defaults to "numba" if numba is installed, "numpy" otherwise
+        :param trace_length: number of positions kept in the trace of each object, 0 (default) disables
+            traces (`BasicObject.trace` is empty then), they take 32 bytes per position and object
+        :param trace_every: only record every n-th position to the trace
+        :param broad_phase: collision candidate search, "grid" or "sweep"
+        :param integrator: integrator name ("euler", "leapfrog", "yoshida4", "block") or an Integrator instance
+        :param collision_mode: "elastic" (planets bounce off each other) or "merge" (touching planets
+            merge into one, conserving mass and momentum)
+        :param profiler: records the time spent in each phase of `iter` if given
+        :param observers: analytics stages, updated after every step (see analytics.py)
         """
-        self.__objects = objects
-        self.__last_collided = [
-            [],
-            [],
-            []
-        ]
+        trace = TraceBuffer(trace_length, trace_every, rows=len(objects)) if trace_length > 0 else None
+        self.__store = BodyStore(capacity=len(objects), trace=trace)
+        self.__objects: tp.List[BasicObject] = []
+        self.__solver = get_solver(solver)
+        self.__broad_phase = broad_phase
+        self.__integrator = get_integrator(integrator)
+        self.collision_mode = collision_mode
+        self.__gravity_enabled = True
+        self.profiler = profiler
+        self.observers: tp.List[Observer] = list(observers)
+        self.__time = 0.
+        self.__steps = 0
+
+        # touching pairs and collision cooldowns, a pair is blocked for two passes after colliding
+        self.__contacts = ContactTable(cooldown=2)
+
+        # aggregates of the current state, valid while the store version doesn't change
+        self.__aggregates: tp.Dict[str, tp.Any] = {}
+        self.__aggregates_version = -1
+
+        for object_ in objects:
+            self.add_object(object_)
 
     @property
-    def objects(self) -> list:
+    def objects(self) -> tp.List[BasicObject]:
         return self.__objects
 
+    @property
+    def store(self) -> BodyStore:
+        return self.__store
+
+    @property
+    def time(self) -> float:
+        """
+        simulated time in seconds
+        """
+        return self.__time
+
+    @property
+    def steps(self) -> int:
+        """
+        number of calls to `iter`
+        """
+        return self.__steps
+
+    @property
+    def solver(self) -> GravitySolver:
+        return self.__solver
+
+    @solver.setter
+    def solver(self, value: str | GravitySolver) -> None:
+        self.__solver = get_solver(value)
+
+    @property
+    def contacts(self) -> ContactTable:
+        """
+        touching pairs with their contact manifolds and collision cooldowns
+        """
+        return self.__contacts
+
+    @property
+    def collision_mode(self) -> str:
+        return self.__collision_mode
+
+    @collision_mode.setter
+    def collision_mode(self, value: str) -> None:
+        if value not in COLLISION_MODES:
+            raise ValueError(
+                f"Invalid value for \"collision_mode\": {value!r} (available: {', '.join(COLLISION_MODES)})"
+            )
+
+        self.__collision_mode = value
+
+    @property
+    def integrator(self) -> Integrator:
+        return self.__integrator
+
+    @integrator.setter
+    def integrator(self, value: str | Integrator) -> None:
+        self.__integrator = get_integrator(value)
+
+    @property
+    def error(self) -> float:
+        """
+        error estimate of the last step (see Integrator)
+        """
+        return self.__integrator.error
+
+    def __aggregate(self) -> tp.Dict[str, tp.Any]:
+        """
+        total mass, max mass, center of mass and bounds, calculated once per state
+        """
+        store = self.__store
+        if self.__aggregates_version != store.version:
+            version = store.version
+            mass, pos = store.mass, store.position
+            total = mass.sum()
+            lower, upper = (pos.min(axis=0), pos.max(axis=0)) if len(pos) else (np.zeros(2), np.zeros(2))
+            self.__aggregates = {
+                "total_mass": float(total),
+                "max_mass": float(mass.max()) if len(mass) else 0.,
+                "center": (mass @ pos / total).tolist() if total else [0., 0.],
+                "lower": lower.tolist(),
+                "upper": upper.tolist(),
+            }
+            self.__aggregates_version = version
+
+        return self.__aggregates
+
     @property
     def total_mass(self) -> float:
-        return sum([obj.mass for obj in self.objects])
+        return self.__aggregate()["total_mass"]
 
     @property
     def max_mass(self) -> float:
-        return max([obj.mass for obj in self.objects])
+        return self.__aggregate()["max_mass"]
+
+    @property
+    def bounds(self) -> tp.Tuple[Vector, Vector]:
+        """
+        lower left and upper right corner of the box around all objects
+        """
+        aggregates = self.__aggregate()
+        return Vector.from_cartesian(*aggregates["lower"]), Vector.from_cartesian(*aggregates["upper"])
 
     @property
     def size(self) -> Vector:
         """
         The total size in x and y
         """
-        x_vals = [obj.position.x for obj in self.objects]
-        y_vals = [obj.position.y for obj in self.objects]
-
-        return Vector.from_cartesian(x=max(x_vals)-min(x_vals), y=max(y_vals)-min(y_vals))
+        aggregates = self.__aggregate()
+        (x0, y0), (x1, y1) = aggregates["lower"], aggregates["upper"]
+        return Vector.from_cartesian(x1 - x0, y1 - y0)
 
     @property
     def gravity_center(self) -> Vector:
-        gx = sum([obj.position.x*obj.mass for obj in self.objects])
-        gx /= self.total_mass
-        gy = sum([obj.position.y*obj.mass for obj in self.objects])
-        gy /= self.total_mass
-
-        return Vector.from_cartesian(gx, gy)
+        return Vector.from_cartesian(*self.__aggregate()["center"])
+
+    @classmethod
+    def from_arrays(cls, mass: np.ndarray,
+                    position: np.ndarray,
+                    velocity: np.ndarray | None = None,
+                    diameter: np.ndarray | None = None,
+                    fixed: np.ndarray | None = None,
+                    names: tp.Sequence[str] | None = None,
+                    **kw) -> "Simulation":
+        """
+        create a simulation straight from arrays of body states (see `add_arrays`)
+        :param kw: passed on to `Simulation`
+        """
+        sim = cls([], **kw)
+        sim.add_arrays(mass, position, velocity, diameter, fixed, names)
+        return sim
+
+    def add_arrays(self, mass: np.ndarray,
+                   position: np.ndarray,
+                   velocity: np.ndarray | None = None,
+                   diameter: np.ndarray | None = None,
+                   fixed: np.ndarray | None = None,
+                   names: tp.Sequence[str] | None = None) -> tp.List[BasicObject]:
+        """
+        add many bodies at once, written to the store in bulk instead of one object at a time
+        :param mass: (N,) masses
+        :param position: (N, 2) positions
+        :param velocity: (N, 2) velocities, default 0
+        :param diameter: (N,) diameters, bodies with a diameter > 0 become colliding Planets
+        :param fixed: (N,) fixed bodies
+        :param names: names of the planets
+        :return: the new objects
+        """
+        n = len(mass)
+        diameter = np.zeros(n) if diameter is None else np.asarray(diameter, dtype=float)
+        names = [""] * n if names is None else list(names)
+        if len(names) != n or len(diameter) != n:
+            raise ValueError(f"Invalid arrays, expected {n} entries each")
+
+        store = self.__store
+        planets = diameter > 0
+
+        # the new objects can't be garbage yet, but creating millions of them
+        # would trigger many (slow, full) garbage collections
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            objects: tp.List[BasicObject] = [
+                Planet._view(store, i, name) if planet else BasicObject._view(store, i)
+                for i, planet, name in zip(range(len(store), len(store) + n), planets.tolist(), names)
+            ]
+
+        finally:
+            if collecting:
+                gc.enable()
+
+        store.extend(
+            mass=mass,
+            position=position,
+            velocity=velocity,
+            fixed=fixed,
+            diameter=diameter,
+            collides=planets,
+            views=objects,
+        )
+
+        self.__objects.extend(objects)
+        self.__integrator.reset()
+        return objects
 
     def add_object(self, object_: BasicObject) -> None:
+        """
+        add an object to the simulation, its state is moved into the simulations store
+        """
+        self.__store.adopt(object_)
         self.__objects.append(object_)
+        self.__integrator.reset()
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        """
+        full state of the simulation (bodies, traces, integrator, collision
+        bookkeeping and observers) as nested dicts of arrays, see checkpoint.py
+        """
+        return {
+            "time": self.__time,
+            "steps": self.__steps,
+            "gravity_enabled": self.__gravity_enabled,
+            "broad_phase": self.__broad_phase,
+            "collision_mode": self.__collision_mode,
+            "names": np.array([obj.name if isinstance(obj, Planet) else "" for obj in self.__objects]),
+            "planet": np.array([isinstance(obj, Planet) for obj in self.__objects], dtype=bool),
+            "store": self.__store.state(),
+            "integrator": self.__integrator.state(),
+            "contacts": self.__contacts.state(),
+            "observers": {str(i): observer.state() for i, observer in enumerate(self.observers)},
+        }
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        """
+        continue from a state from `state`
+
+        Objects which still match a body (same type and name) are kept,
+        for all other bodies new objects are created.
+        """
+        store = self.__store
+        store.restore(state["store"])
+
+        names, planet = state["names"], state["planet"]
+        for i, view in enumerate(store.views):
+            if view is not None and isinstance(view, Planet) == bool(planet[i]) \
+                    and (not planet[i] or view.name == str(names[i])):
+                continue
+
+            # a handle for row i, its own temporary store is dropped right away
+            view = Planet(str(names[i]), 0, 0, Vector()) if planet[i] else BasicObject(0, Vector())
+            view._store, view._index = store, i
+            store.views[i] = view
+
+        self.__objects = list(store.views)
+
+        if str(state["integrator"]["name"]) != self.__integrator.name:
+            self.__integrator = get_integrator(str(state["integrator"]["name"]))
+
+        self.__integrator.restore(state["integrator"])
+        self.__time = float(state["time"])
+        self.__steps = int(state["steps"])
+        self.__gravity_enabled = bool(state["gravity_enabled"])
+        self.__broad_phase = str(state["broad_phase"])
+        self.collision_mode = str(state.get("collision_mode", "elastic"))
+        if "contacts" in state:
+            self.__contacts.restore(state["contacts"])
+
+        else:
+            # older checkpoints: pairs (rows) which collided in the last ("1") and the one before ("2") pass
+            self.__contacts = ContactTable(cooldown=self.__contacts.cooldown)
+            for age in (2, 1):
+                pairs = np.asarray(state["last_collided"][str(age)], dtype=np.int64).reshape(-1, 2)
+                self.__contacts.advance()
+                self.__contacts.update(
+                    store.ids[pairs[:, 0]], store.ids[pairs[:, 1]],
+                    np.zeros((len(pairs), 2)), np.zeros(len(pairs)), np.ones(len(pairs), dtype=bool)
+                )
+
+        # observers the checkpoint doesn't know (e.g. added for this run) start empty
+        observers = state.get("observers", {})
+        for i, observer in enumerate(self.observers):
+            if str(i) in observers:
+                observer.restore(observers[str(i)])
 
     def iter(self, dt: float, gravity: bool = True, collision: bool = True, precision: int = 2) -> None:
         """
         run 1 iteration of the simulation
+        :param dt: time step
+        :param gravity: enable gravity
+        :param collision: enable collisions
+        :param precision: number of integrator steps dt is split into
         """
-        # iterate each object and then calculate all the forces to the other objects
-        # based on F = G*(m1*m2)/r**2
+        store = self.__store
+        if gravity != self.__gravity_enabled:
+            self.__gravity_enabled = gravity
+            self.__integrator.reset()
+
+        # mergers remove rows, so they happen between integrator steps instead of inside them
+        merge = collision and self.__collision_mode == "merge"
+        gravity_function = self.__gravity if gravity else lambda targets: None
+        collide_function = self.__collide if collision and not merge else lambda: None
+
+        profiler = self.profiler
+        if profiler is not None:
+            gravity_function = profiler.wrap("gravity", gravity_function)
+            collide_function = profiler.wrap("collision", collide_function)
+            phase = profiler.phase
+
+        else:
+            phase = null_phase
+
         dt /= precision
-        for _ in range(precision):
-            if gravity:
-                done_objects = []
-                for now_object in self.objects.copy():
-                    for influence_object in self.objects.copy():
-                        if influence_object is not now_object and not {now_object, influence_object} in done_objects:
-                            done_objects.append({now_object, influence_object})
-
-                            f_l = G * (now_object.mass * influence_object.mass)
-                            delta = now_object.position - influence_object.position
-                            f_l = f_l / delta.length ** 2
-
-                            f = Vector.from_polar(angle=delta.angle + PI, length=f_l)
-
-                            now_a = f / now_object.mass
-                            inf_a = f / -influence_object.mass
-
-                            now_object.acceleration = now_a
-                            now_object.velocity += now_object.acceleration * dt
-
-                            influence_object.acceleration = inf_a
-                            influence_object.velocity += influence_object.acceleration * dt
-
-            if collision:
-                done_objects = []
-                for now_object in self.objects:
-                    if type(now_object) == Planet:
-                        for influence_object in self.objects:
-                            if type(influence_object) == Planet and influence_object is not now_object:
-                                now_object: Planet
-                                influence_object: Planet
-                                delta = now_object.position - influence_object.position
-
-                                # check if they touch
-                                if delta.length < now_object.diameter/2 + influence_object.diameter/2 and not now_object in done_objects\
-                                        and not any([{now_object, influence_object} in self.__last_collided[i] for i in range(len(self.__last_collided))]):
-                                    # v1' = (m1*v1 + m2*(2*v2-v1)) / (m1+m2)
-                                    #
-                                    done_objects += [now_object, influence_object]
-                                    self.__last_collided.append({now_object, influence_object})
-
-                                    # split the velocities in two directions (90°)
-                                    a = (delta.angle-now_object.velocity.angle)
-                                    now_carry = Vector.from_polar(angle=delta.angle-PI/2, length=now_object.velocity.length*np.sin(a))
-                                    now_collision = Vector.from_polar(angle=delta.angle, length=now_object.velocity.length*np.cos(a))
-
-                                    a = (delta.angle-influence_object.velocity.angle)
-                                    inf_carry = Vector.from_polar(angle=delta.angle-PI/2, length=influence_object.velocity.length*np.sin(a))
-                                    inf_collision = Vector.from_polar(angle=delta.angle, length=influence_object.velocity.length*np.cos(a))
-
-                                    now_v = now_collision.length * now_object.mass
-                                    now_v += (inf_collision.length * 2 - now_collision.length) * influence_object.mass
-                                    now_v /= now_object.mass + influence_object.mass
-
-                                    inf_v = inf_collision.length * influence_object.mass
-                                    inf_v += (now_collision.length * 2 - inf_collision.length) * now_object.mass
-                                    inf_v /= influence_object.mass + now_object.mass
-
-                                    now_v = now_carry + Vector.from_polar(angle=now_collision.angle, length=now_v)
-                                    inf_v = inf_carry + Vector.from_polar(angle=inf_collision.angle, length=inf_v)
-
-                                    # assign velocities to objects
-                                    now_object.acceleration = Vector()
-                                    now_object.velocity = now_v
-
-                                    influence_object.acceleration = Vector()
-                                    influence_object.velocity = inf_v
-
-                # move 1 down
-                self.__last_collided = [
-                    [],
-                    [self.__last_collided[0]],
-                    [self.__last_collided[1]]
-                ]
-
-            for now_object in self.objects:
-                if not now_object.fixed:
-                    now_object.velocity += now_object.acceleration * dt
-                    now_object.position += now_object.velocity * dt
+        with phase("step"):
+            for _ in range(precision):
+                with phase("integration"):
+                    self.__integrator.step(store, dt, gravity_function, collide_function)
+
+                if merge:
+                    with phase("collision"):
+                        self.__merge()
+
+                if store.trace is not None:
+                    with phase("trace"):
+                        store.trace.record(store.position, mask=~store.fixed)
+
+                self.__time += dt
+
+        self.__steps += 1
+        store.touch()
+        if profiler is not None:
+            profiler.count("steps")
+
+        if self.observers:
+            with phase("observers"):
+                for observer in self.observers:
+                    observer.update(self)
+
+    def __gravity(self, targets: np.ndarray | None = None) -> None:
+        """
+        F = G*(m1*m2)/r**2 for every pair of objects
+        :param targets: only update the acceleration of these objects
+        """
+        store = self.__store
+        if targets is None:
+            store.acceleration[:] = self.__solver.accelerations(store.position, store.mass)
+
+        elif len(targets):
+            store.acceleration[targets] = self.__solver.accelerations(store.position, store.mass, targets)
+
+        else:
+            return
+
+        if self.profiler is not None:
+            n = len(store.mass)
+            self.profiler.count("pairs", self.__solver.pair_count(n, n if targets is None else len(targets)))
+
+    def __collide(self) -> None:
+        """
+        elastic collisions between all touching planets
+        """
+        store = self.__store
+        planets = np.flatnonzero(store.collides)
+
+        # find touching pairs, then resolve them in the order of the
+        # (now_object, influence_object) loops this replaced
+        a, b = touching_pairs(store.position[planets], store.diameter[planets] / 2, self.__broad_phase)
+        a, b = planets[a], planets[b]
+        now, influence = np.concatenate((a, b)), np.concatenate((b, a))
+        order = np.lexsort((influence, now))
+        now, influence = now[order], influence[order]
+
+        # contact manifolds as detected, before the collisions change the velocities
+        delta = store.position[b] - store.position[a]
+        distance = np.hypot(delta[:, 0], delta[:, 1])
+        normal = delta / np.where(distance > 0, distance, 1)[:, np.newaxis]
+        depth = (store.diameter[a] + store.diameter[b]) / 2 - distance
+
+        # skip pairs which collided recently
+        contacts = self.__contacts
+        contacts.advance()
+        ids = store.ids
+        blocked = contacts.blocked(ids[now], ids[influence])
+        now, influence = now[~blocked], influence[~blocked]
+
+        collided = resolve_collisions(now, influence, store.position, store.velocity, store.acceleration, store.mass)
+        resolved = pair_keys(ids[now[collided]], ids[influence[collided]])
+        contacts.update(ids[a], ids[b], normal, depth, np.isin(pair_keys(ids[a], ids[b]), resolved))
+
+        if self.profiler is not None:
+            self.profiler.count("contacts", len(now))
+            self.profiler.count("collisions", int(collided.sum()))
+
+    def __merge(self) -> None:
+        """
+        merge every group of touching planets into its heaviest member (fixed
+        members first): masses add up, position and velocity are the ones of the
+        center of mass and the diameter is the one of the combined volume.
+        The other members are swap-removed from the store.
+        """
+        store = self.__store
+        planets = np.flatnonzero(store.collides)
+        a, b = touching_pairs(store.position[planets], store.diameter[planets] / 2, self.__broad_phase)
+        if not len(a):
+            return
+
+        # groups of bodies connected by touching pairs: every body gets the lowest
+        # member (of `rows`) as label, by relaxing the pairs and pointer jumping
+        rows, members = np.unique(np.concatenate((planets[a], planets[b])), return_inverse=True)
+        a, b = members[:len(a)], members[len(a):]
+        label = np.arange(len(rows))
+        while True:
+            low = np.minimum(label[a], label[b])
+            new = label.copy()
+            np.minimum.at(new, a, low)
+            np.minimum.at(new, b, low)
+            new = new[new]
+            if np.array_equal(new, label):
+                break
+
+            label = new
+
+        _, group = np.unique(label, return_inverse=True)
+        count = group.max() + 1
+
+        # survivor of every group: fixed first, then the heaviest, then the lowest row
+        mass, fixed = store.mass[rows], store.fixed[rows]
+        order = np.lexsort((rows, -mass, ~fixed, group))
+        first = np.flatnonzero(np.concatenate(([True], group[order][1:] != group[order][:-1])))
+        survivor = rows[order[first]]
+
+        total = np.bincount(group, mass, count)
+        weight = np.where(total > 0, total, 1)[:, np.newaxis]
+
+        def mass_weighted(values: np.ndarray) -> np.ndarray:
+            return np.stack([np.bincount(group, mass * values[rows, k], count) for k in range(2)], axis=1) / weight
+
+        # the mutual attraction of the members cancels in the mass weighted
+        # acceleration, so it stays valid for the merged body (no new force evaluation)
+        held = store.fixed[survivor][:, np.newaxis]
+        for values in (store.position, store.velocity, store.acceleration):
+            values[survivor] = np.where(held, values[survivor], mass_weighted(values))
+        store.diameter[survivor] = np.cbrt(np.bincount(group, store.diameter[rows] ** 3, count))
+        store.mass[survivor] = total
+
+        absorbed = np.setdiff1d(rows, survivor)
+        source, target = store.remove(absorbed)
+
+        objects = self.__objects
+        for i, j in zip(source.tolist(), target.tolist()):
+            objects[j] = objects[i]
+
+        del objects[len(store):]
+
+        if self.profiler is not None:
+            self.profiler.count("mergers", len(absorbed))
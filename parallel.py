@@ -0,0 +1,244 @@
+"""
+Parallel gravity solver, spreads the force evaluation over worker processes
+Author:
+Nilusink
+"""
+from gravity import GravitySolver, NumpyGravity, SOLVERS
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+import multiprocessing as mp
+import typing as tp
+import numpy as np
+import weakref
+import os
+
+
+class SharedArrays:
+    """
+    Positions, masses, target indices and accelerations of up to
+    `capacity` bodies in one shared memory block
+
+    The creating process owns (and unlinks) the block, worker
+    processes attach to it by name.
+    """
+    def __init__(self, capacity: int, name: str | None = None) -> None:
+        """
+        :param capacity: maximum number of bodies
+        :param name: name of an existing block to attach to, a new one is created if None
+        """
+        self.capacity = capacity
+        self.owner = name is None
+
+        # position (2), mass, target and acceleration (2) per body, all 8 bytes
+        size = max(capacity, 1) * 6 * 8
+        if self.owner:
+            self.__shm = shared_memory.SharedMemory(create=True, size=size)
+
+        else:
+            # workers share the resource tracker of the owner, which
+            # only forgets the block once the owner unlinks it
+            self.__shm = shared_memory.SharedMemory(name=name)
+
+        buffer = self.__shm.buf
+        self.position = np.ndarray((capacity, 2), dtype=np.float64, buffer=buffer)
+        self.mass = np.ndarray((capacity,), dtype=np.float64, buffer=buffer, offset=capacity * 16)
+        self.targets = np.ndarray((capacity,), dtype=np.int64, buffer=buffer, offset=capacity * 24)
+        self.acceleration = np.ndarray((capacity, 2), dtype=np.float64, buffer=buffer, offset=capacity * 32)
+
+    @property
+    def name(self) -> str:
+        return self.__shm.name
+
+    def close(self) -> None:
+        """
+        release the block (and remove it if this process created it)
+        """
+        # the arrays have to go before the buffer can be closed
+        del self.position, self.mass, self.targets, self.acceleration
+        self.__shm.close()
+        if self.owner:
+            self.__shm.unlink()
+
+
+def _worker(conn: Connection, name: str, capacity: int, block_size: int) -> None:
+    """
+    worker process: calculates the acceleration of a tile of targets on request
+
+    messages:
+    ("tile", n, start, stop, softening): acceleration of targets[start:stop] with the first n bodies
+    ("resize", name, capacity): attach to a new block
+    ("stop",): exit
+    """
+    arrays = SharedArrays(capacity, name)
+    solver = NumpyGravity(block_size=block_size)
+    try:
+        while True:
+            match conn.recv():
+                case ("tile", n, start, stop, softening):
+                    try:
+                        solver.softening = softening
+                        arrays.acceleration[start:stop] = solver.accelerations(
+                            arrays.position[:n],
+                            arrays.mass[:n],
+                            arrays.targets[start:stop],
+                        )
+                        conn.send(None)
+
+                    except Exception as error:
+                        conn.send(error)
+
+                case ("resize", name, capacity):
+                    arrays.close()
+                    arrays = SharedArrays(capacity, name)
+
+                case ("stop",):
+                    break
+
+    except (EOFError, KeyboardInterrupt):
+        pass
+
+    finally:
+        arrays.close()
+
+
+def _shutdown(pool: tp.List[tp.Tuple[mp.Process, Connection]], shared: tp.List[SharedArrays]) -> None:
+    """
+    stop all workers and free the shared memory
+    """
+    for process, conn in pool:
+        try:
+            conn.send(("stop",))
+
+        except (BrokenPipeError, OSError):
+            pass
+
+    for process, conn in pool:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+        conn.close()
+
+    for arrays in shared:
+        arrays.close()
+
+    pool.clear()
+    shared.clear()
+
+
+class ParallelGravity(GravitySolver):
+    """
+    Exact all-pairs solver running in a pool of worker processes
+
+    The bodies are copied to shared memory once per evaluation, the targets
+    are split into one contiguous tile per worker and every worker writes
+    the accelerations of its tile straight back to shared memory. Only the
+    tile bounds are sent to the workers, so the cost per evaluation does not
+    depend on pickling and the work scales with the number of cores.
+    Small systems (below `min_bodies`) are calculated in this process,
+    where the overhead of the pool would dominate.
+    """
+    name = "parallel"
+
+    def __init__(self, softening: float = 0,
+                 workers: int | None = None,
+                 min_bodies: int = 2048,
+                 block_size: int = 2**18,
+                 context: str = "spawn") -> None:
+        """
+        :param softening: plummer softening length
+        :param workers: number of worker processes (default: number of cores)
+        :param min_bodies: systems with less bodies are calculated without the pool
+        :param block_size: maximum number of pair interactions a worker evaluates at once
+        :param context: multiprocessing start method of the workers
+        """
+        super().__init__(softening)
+        self.workers = workers or os.cpu_count() or 1
+        self.min_bodies = min_bodies
+        self.block_size = block_size
+
+        if self.workers < 1:
+            raise ValueError("Invalid value for \"workers\", needs to be at least 1")
+
+        self.__context = mp.get_context(context)
+        self.__local = NumpyGravity(softening, block_size)
+        self.__pool: tp.List[tp.Tuple[mp.Process, Connection]] = []
+        self.__shared: tp.List[SharedArrays] = []
+        self.__finalizer = weakref.finalize(self, _shutdown, self.__pool, self.__shared)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: softening={self.softening}, workers={self.workers}>"
+
+    @property
+    def running(self) -> bool:
+        return bool(self.__pool)
+
+    def __ensure(self, n: int) -> SharedArrays:
+        """
+        start the workers and make sure the shared memory can hold n bodies
+        """
+        if self.__shared and self.__shared[0].capacity >= n:
+            return self.__shared[0]
+
+        # grow by doubling like BodyStore
+        capacity = 1 << max(n - 1, 1).bit_length()
+        arrays = SharedArrays(capacity)
+
+        if self.__pool:
+            for process, conn in self.__pool:
+                conn.send(("resize", arrays.name, capacity))
+
+        else:
+            for _ in range(self.workers):
+                parent, child = self.__context.Pipe()
+                process = self.__context.Process(
+                    target=_worker,
+                    args=(child, arrays.name, capacity, self.block_size),
+                    daemon=True,
+                )
+                process.start()
+                child.close()
+                self.__pool.append((process, parent))
+
+        if self.__shared:
+            self.__shared.pop().close()
+
+        self.__shared.append(arrays)
+        return arrays
+
+    def accelerations(self, positions: np.ndarray, masses: np.ndarray,
+                      targets: np.ndarray | None = None) -> np.ndarray:
+        n = len(masses)
+        targets = np.arange(n) if targets is None else np.asarray(targets, dtype=np.int64)
+        if n < max(self.min_bodies, 2) or len(targets) == 0:
+            self.__local.softening = self.softening
+            return self.__local.accelerations(positions, masses, targets)
+
+        arrays = self.__ensure(n)
+        arrays.position[:n] = positions
+        arrays.mass[:n] = masses
+        arrays.targets[:len(targets)] = targets
+
+        # every body costs the same (O(N)), so equal tiles are balanced
+        bounds = np.linspace(0, len(targets), len(self.__pool) + 1).astype(int)
+        busy = []
+        for (process, conn), start, stop in zip(self.__pool, bounds[:-1], bounds[1:]):
+            if stop > start:
+                conn.send(("tile", n, int(start), int(stop), self.softening))
+                busy.append(conn)
+
+        errors = [error for error in (conn.recv() for conn in busy) if error is not None]
+        if errors:
+            raise errors[0]
+
+        return arrays.acceleration[:len(targets)].copy()
+
+    def close(self) -> None:
+        """
+        stop the worker processes and free the shared memory
+        (they are started again on the next large evaluation)
+        """
+        _shutdown(self.__pool, self.__shared)
+
+
+SOLVERS[ParallelGravity.name] = ParallelGravity
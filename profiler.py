@@ -0,0 +1,267 @@
+"""
+Opt-in timing of the simulation and render phases
+Author:
+Nilusink
+"""
+from contextlib import nullcontext
+import typing as tp
+import numpy as np
+import itertools
+import threading
+import json
+import time
+
+
+def null_phase(name: str) -> nullcontext:
+    """
+    stands in for `Profiler.phase` while profiling is off
+    """
+    return nullcontext()
+
+
+class _Phase:
+    """
+    context manager timing one phase, see `Profiler.phase`
+    """
+    __slots__ = ("_profiler", "_name", "_start", "_children")
+
+    def __init__(self, profiler: "Profiler", name: int) -> None:
+        self._profiler = profiler
+        self._name = name
+        self._start = 0
+        self._children = 0
+
+    def __enter__(self) -> "_Phase":
+        self._profiler._stack().append(self)
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        end = time.perf_counter_ns()
+        duration = end - self._start
+        stack = self._profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1]._children += duration
+
+        self._profiler._write(Profiler.KIND_PHASE, self._name, self._start, duration, duration - self._children)
+
+
+class Profiler:
+    """
+    Records phase timings and counters into a fixed size ring buffer
+
+    Phases can be nested (e.g. "gravity" inside "integrator"), every record
+    keeps its total and its self time (without nested phases). Several
+    threads can record at the same time, each gets its own row in the
+    Chrome trace. Without a profiler attached (`Simulation.profiler`),
+    `null_phase` takes its place and nothing is recorded.
+    """
+    KIND_PHASE = 0
+    KIND_COUNTER = 1
+
+    def __init__(self, capacity: int = 2**16) -> None:
+        """
+        :param capacity: number of records kept, older ones are overwritten
+        """
+        if capacity < 1:
+            raise ValueError("Invalid value for \"capacity\", needs to be at least 1")
+
+        self.capacity = capacity
+        self.__kind = np.zeros(capacity, dtype=np.int8)
+        self.__name = np.zeros(capacity, dtype=np.int32)
+        self.__thread = np.zeros(capacity, dtype=np.int64)
+        self.__start = np.zeros(capacity, dtype=np.int64)
+        self.__value = np.zeros(capacity, dtype=np.int64)
+        self.__self = np.zeros(capacity, dtype=np.int64)
+
+        # next(itertools.count()) is atomic, so every record gets its own slot
+        self.__counter = itertools.count()
+        self.__written = 0
+
+        self.__names: tp.List[str] = []
+        self.__ids: tp.Dict[str, int] = {}
+        self.__local = threading.local()
+        self.__origin = time.perf_counter_ns()
+
+        # counter totals of every thread, each only written by its own thread (see `totals`)
+        self.__totals: tp.List[tp.Dict[str, int]] = []
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: {min(self.__written, self.capacity)}/{self.capacity} records>"
+
+    def __id(self, name: str) -> int:
+        i = self.__ids.get(name)
+        if i is None:
+            i = self.__ids.setdefault(name, len(self.__names))
+            if i == len(self.__names):
+                self.__names.append(name)
+
+        return i
+
+    def _stack(self) -> tp.List[_Phase]:
+        stack = getattr(self.__local, "stack", None)
+        if stack is None:
+            stack = self.__local.stack = []
+
+        return stack
+
+    def _write(self, kind: int, name: int, start: int, value: int, self_time: int = 0) -> None:
+        i = next(self.__counter)
+        slot = i % self.capacity
+        self.__kind[slot] = kind
+        self.__name[slot] = name
+        self.__thread[slot] = threading.get_ident()
+        self.__start[slot] = start
+        self.__value[slot] = value
+        self.__self[slot] = self_time
+        self.__written = max(self.__written, i + 1)
+
+    def phase(self, name: str) -> _Phase:
+        """
+        time a phase: `with profiler.phase("gravity"): ...`
+        """
+        return _Phase(self, self.__id(name))
+
+    def wrap(self, name: str, function: tp.Callable[..., tp.Any]) -> tp.Callable[..., tp.Any]:
+        """
+        `function`, timed as phase `name` on every call
+        """
+        def wrapped(*args, **kw):
+            with self.phase(name):
+                return function(*args, **kw)
+
+        return wrapped
+
+    @property
+    def totals(self) -> tp.Dict[str, int]:
+        """
+        all time totals of the counters (over all threads)
+        """
+        totals: tp.Dict[str, int] = {}
+        for thread in list(self.__totals):
+            for name, value in list(thread.items()):
+                totals[name] = totals.get(name, 0) + value
+
+        return totals
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        add to a counter (e.g. pair interactions or collisions)
+        """
+        totals = getattr(self.__local, "totals", None)
+        if totals is None:
+            totals = self.__local.totals = {}
+            self.__totals.append(totals)
+
+        totals[name] = totals.get(name, 0) + value
+        self._write(self.KIND_COUNTER, self.__id(name), time.perf_counter_ns(), value)
+
+    def records(self) -> tp.Dict[str, np.ndarray]:
+        """
+        all records in the buffer, oldest first
+        """
+        n = min(self.__written, self.capacity)
+        order = (np.arange(n) + self.__written) % self.capacity if n == self.capacity else np.arange(n)
+        return {
+            "kind": self.__kind[order],
+            "name": self.__name[order],
+            "thread": self.__thread[order],
+            "start": self.__start[order],
+            "value": self.__value[order],
+            "self": self.__self[order],
+        }
+
+    def summary(self, seconds: float | None = None) -> tp.Dict[str, tp.Any]:
+        """
+        phase timings and counter rates over the last `seconds` (default: the whole buffer)
+        :return: {"duration": s, "phases": {name: {calls, total_ms, self_ms, mean_ms}},
+            "counters": {name: {total, per_second}}}
+        """
+        records = self.records()
+        if seconds is not None:
+            recent = records["start"] >= time.perf_counter_ns() - int(seconds * 1e9)
+            records = {key: value[recent] for key, value in records.items()}
+
+        start = records["start"]
+        phases = records["kind"] == self.KIND_PHASE
+        if len(start):
+            end = np.max(start + np.where(phases, records["value"], 0))
+            duration = max((end - start.min()) / 1e9, 1e-9)
+
+        else:
+            duration = 0.
+
+        summary = {"duration": duration, "phases": {}, "counters": {}}
+        for i, name in enumerate(self.__names):
+            mine = records["name"] == i
+            if (mine & phases).any():
+                values = records["value"][mine & phases]
+                summary["phases"][name] = {
+                    "calls": int(len(values)),
+                    "total_ms": float(values.sum() / 1e6),
+                    "self_ms": float(records["self"][mine & phases].sum() / 1e6),
+                    "mean_ms": float(values.mean() / 1e6),
+                }
+
+            if (mine & ~phases).any():
+                total = int(records["value"][mine & ~phases].sum())
+                summary["counters"][name] = {
+                    "total": total,
+                    "per_second": total / duration if duration else 0.,
+                }
+
+        return summary
+
+    def hud(self, seconds: float = 1.) -> tp.List[str]:
+        """
+        text lines for the HUD: share of the time and mean time per phase, counter rates
+        """
+        summary = self.summary(seconds)
+        duration = summary["duration"] or 1.
+        lines = []
+        for name, phase in sorted(summary["phases"].items(), key=lambda item: -item[1]["self_ms"]):
+            lines.append(f"{name}: {phase['self_ms'] / 10 / duration:.1f}% "
+                         f"({phase['mean_ms']:.3f} ms x {phase['calls'] / duration:.0f}/s)")
+
+        for name, counter in summary["counters"].items():
+            lines.append(f"{name}: {counter['per_second']:.4g}/s")
+
+        return lines
+
+    def dump_json(self, path: str, seconds: float | None = None) -> None:
+        """
+        write the summary and the counter totals as json
+        """
+        with open(path, "w") as file:
+            json.dump({"summary": self.summary(seconds), "totals": self.totals}, file, indent=2)
+
+    def dump_chrome_trace(self, path: str) -> None:
+        """
+        write all records in the Chrome trace event format (chrome://tracing, ui.perfetto.dev)
+        """
+        records = self.records()
+        threads = {ident: i for i, ident in enumerate(dict.fromkeys(records["thread"].tolist()))}
+        events = []
+        running: tp.Dict[str, int] = {}
+        for kind, name, thread, start, value in zip(
+                records["kind"].tolist(), records["name"].tolist(), records["thread"].tolist(),
+                records["start"].tolist(), records["value"].tolist()
+        ):
+            timestamp = (start - self.__origin) / 1e3
+            if kind == self.KIND_PHASE:
+                events.append({
+                    "name": self.__names[name], "ph": "X", "ts": timestamp, "dur": value / 1e3,
+                    "pid": 0, "tid": threads[thread],
+                })
+
+            else:
+                # counters are shown as running totals
+                running[self.__names[name]] = running.get(self.__names[name], 0) + value
+                events.append({
+                    "name": self.__names[name], "ph": "C", "ts": timestamp, "pid": 0,
+                    "args": {"total": running[self.__names[name]]},
+                })
+
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
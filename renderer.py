@@ -0,0 +1,267 @@
+"""
+Batched drawing of traces, bodies and labels
+Author:
+Nilusink
+"""
+from utils import expand_ranges
+import typing as tp
+import numpy as np
+import pygame as pg
+
+
+Color = tp.Tuple[int, ...]
+
+
+def premultiply(color: Color) -> Color:
+    """
+    the color a RGBA color has on a black background
+    """
+    if len(color) < 4:
+        return tuple(color)
+
+    return tuple(round(c * color[3] / 255) for c in color[:3])
+
+
+class GlyphCache:
+    """
+    Renders text from cached glyphs
+
+    Every character is rendered once per color, a label is then only a
+    batch of blits. Labels which change every frame (e.g. velocities)
+    don't need a `font.render` call each time.
+    """
+    def __init__(self, font: pg.font.Font) -> None:
+        self.__font = font
+        self.__glyphs: tp.Dict[tp.Tuple[str, Color], pg.Surface] = {}
+
+    def glyph(self, char: str, color: Color) -> pg.Surface:
+        key = (char, color)
+        glyph = self.__glyphs.get(key)
+        if glyph is None:
+            glyph = self.__font.render(char, True, color)
+            self.__glyphs[key] = glyph
+
+        return glyph
+
+    def layout(self, text: str, position: tp.Tuple[float, float],
+               color: Color) -> tp.List[tp.Tuple[pg.Surface, tp.Tuple[float, float]]]:
+        """
+        (glyph, position) pairs of a text, to be passed to `Surface.blits`
+        """
+        x, y = position
+        out = []
+        for char in text:
+            glyph = self.glyph(char, color)
+            out.append((glyph, (x, y)))
+            x += glyph.get_width()
+
+        return out
+
+    def draw(self, surface: pg.Surface, text: str, position: tp.Tuple[float, float], color: Color) -> None:
+        surface.blits(self.layout(text, position, color), doreturn=False)
+
+
+class SpatialIndex:
+    """
+    Uniform grid over the bodies of one snapshot, to find the ones in a viewport
+
+    The bodies are sorted by grid cell once per snapshot (the cell keys fit
+    into 16 bits, so numpy sorts them with a radix sort in O(N)). A query
+    only touches the cells overlapping the viewport, so a zoomed in view of
+    a huge system only costs as much as the bodies near it. Bodies larger
+    than a cell are returned by every query.
+    """
+    CELLS = 256
+
+    def __init__(self, position: np.ndarray, radius: np.ndarray, margin: float = 0.) -> None:
+        """
+        :param position: (N, 2) world positions
+        :param radius: (N,) world radii
+        :param margin: distance the bodies may move while the index is used (e.g. interpolation)
+        """
+        n = len(position)
+        self.size = n
+        self.lower = position.min(axis=0) if n else np.zeros(2)
+        extent = float((position.max(axis=0) - self.lower).max()) if n else 0.
+        self.cell = extent / self.CELLS if extent > 0 else 1.
+
+        large = radius > self.cell
+        self.large = np.flatnonzero(large)
+        small = np.flatnonzero(~large)
+        self.margin = margin + (float(radius[small].max()) if len(small) else 0.)
+
+        inner = position[small] if len(self.large) else position
+        cells = np.minimum(((inner - self.lower) / self.cell).astype(np.int64), self.CELLS - 1)
+        keys = (cells[:, 0] * self.CELLS + cells[:, 1]).astype(np.uint16)
+        order = np.argsort(keys, kind="stable")
+        self.rows = small[order]
+
+        # rows of cell k: self.rows[starts[k]:starts[k + 1]]
+        self.starts = np.zeros(self.CELLS ** 2 + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=self.CELLS ** 2), out=self.starts[1:])
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: {self.size} bodies, {len(self.large)} large, cell {self.cell:.4g}>"
+
+    def query(self, lower: tp.Tuple[float, float], upper: tp.Tuple[float, float]) -> np.ndarray:
+        """
+        rows of the bodies which might overlap the box from `lower` to `upper` (world coordinates)
+        """
+        first = np.floor((np.asarray(lower) - self.margin - self.lower) / self.cell).astype(np.int64)
+        last = np.floor((np.asarray(upper) + self.margin - self.lower) / self.cell).astype(np.int64)
+        if (last < 0).any() or (first >= self.CELLS).any():
+            return self.large
+
+        first, last = np.maximum(first, 0), np.minimum(last, self.CELLS - 1)
+        if (first == 0).all() and (last == self.CELLS - 1).all():
+            return np.arange(self.size)
+
+        columns = np.arange(first[0], last[0] + 1) * self.CELLS
+        start, stop = self.starts[columns + first[1]], self.starts[columns + last[1] + 1]
+        column, offset = expand_ranges(stop - start)
+        return np.concatenate((self.rows[start[column] + offset], self.large))
+
+
+def by_priority(rows: np.ndarray, priority: np.ndarray, limit: int) -> np.ndarray:
+    """
+    the `limit` rows with the highest priority, highest first
+    """
+    if len(rows) > limit:
+        rows = rows[np.argpartition(-priority[rows], limit)[:limit]]
+
+    return rows[np.argsort(-priority[rows], kind="stable")]
+
+
+class Renderer:
+    """
+    Draws whole sets of bodies with a few array operations
+
+    Traces are written straight into the pixels of the target surface
+    (brightness ramp precomputed, one write per trace sample), bodies of
+    one pixel are accumulated into a density map and only larger bodies are
+    drawn as circles. Everything outside of the surface is skipped.
+    """
+    def __init__(self, surface: pg.Surface, font: pg.font.Font, max_trace_points: int = 250_000) -> None:
+        """
+        :param surface: target surface (without per pixel alpha)
+        :param font: font of the labels
+        :param max_trace_points: upper limit of trace samples drawn per frame, longer traces are thinned out
+        """
+        self.surface = surface
+        self.glyphs = GlyphCache(font)
+        self.max_trace_points = max_trace_points
+        self.__ramps: tp.Dict[tp.Tuple[int, Color], np.ndarray] = {}
+
+    @property
+    def size(self) -> tp.Tuple[int, int]:
+        return self.surface.get_size()
+
+    def __ramp(self, length: int, color: Color) -> np.ndarray:
+        """
+        (length,) mapped pixel values of the trace samples, from the oldest (dark) to the newest
+        """
+        key = (length, color)
+        ramp = self.__ramps.get(key)
+        if ramp is None:
+            alpha = np.arange(length) / length
+            rgb = (np.asarray(color[:3], dtype=float)[np.newaxis, :] * alpha[:, np.newaxis]).astype(np.uint8)
+            ramp = pg.surfarray.map_array(self.surface, rgb[np.newaxis, :, :])[0]
+            self.__ramps[key] = ramp
+
+        return ramp
+
+    def visible(self, screen_positions: np.ndarray, radii: np.ndarray) -> np.ndarray:
+        """
+        indices of the bodies which (partially) overlap the surface
+        """
+        w, h = self.size
+        x, y = screen_positions[:, 0], screen_positions[:, 1]
+        return np.flatnonzero((x + radii >= 0) & (x - radii < w) & (y + radii >= 0) & (y - radii < h))
+
+    def traces(self, samples: np.ndarray, counts: np.ndarray, scale: float, offset: tp.Tuple[float, float],
+               color: Color, length: int) -> int:
+        """
+        draw the traces of all bodies
+        :param samples: (N, L, 2) world positions, oldest first
+        :param counts: (N,) number of valid (most recent) samples of every body
+        :param scale: pixels per meter
+        :param offset: screen offset in pixels
+        :param color: color of the newest sample
+        :param length: the full trace length (for the brightness ramp)
+        :return: number of samples drawn
+        """
+        n, slots = samples.shape[:2]
+        if not n or not slots:
+            return 0
+
+        # thin out long traces to stay within the budget
+        stride = max(1, -(-int(counts.sum()) // self.max_trace_points))
+        first = (slots - 1) % stride
+        columns = np.arange(first, slots, stride)
+
+        # the age of a slot counted from the oldest valid sample of its body
+        age = columns[np.newaxis, :] - (slots - counts[:, np.newaxis])
+        points = samples[:, first::stride]
+        px = (points[..., 0] * scale - offset[0]).astype(np.int64, copy=False)
+        py = (points[..., 1] * scale - offset[1]).astype(np.int64, copy=False)
+
+        w, h = self.size
+        valid = (age >= 0) & (px >= 0) & (px < w) & (py >= 0) & (py < h)
+        if not valid.any():
+            return 0
+
+        # the age picks the brightness, samples are written body by body, oldest first
+        # (where they overlap, the last write wins like with single draw calls)
+        brightness = np.minimum(age[valid], length - 1)
+        pixels = pg.surfarray.pixels2d(self.surface)
+        pixels[px[valid], py[valid]] = self.__ramp(length, color)[brightness]
+        del pixels
+        return int(valid.sum())
+
+    def density(self, screen_positions: np.ndarray, color: Color) -> int:
+        """
+        draw bodies as a density map: every pixel gets a brightness from half
+        to the full color, growing with the log of the number of bodies in it
+        :return: number of pixels drawn
+        """
+        w, h = self.size
+        px = screen_positions[:, 0].astype(np.int64)
+        py = screen_positions[:, 1].astype(np.int64)
+        inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+        if not inside.any():
+            return 0
+
+        # counting over all pixels only pays off for many bodies, otherwise sort the few pixels hit
+        keys = px[inside] * h + py[inside]
+        if len(keys) > w * h // 8:
+            counts = np.bincount(keys)
+            hit = np.flatnonzero(counts)
+            counts = counts[hit]
+
+        else:
+            hit, counts = np.unique(keys, return_counts=True)
+
+        levels = np.log(counts) / np.log(max(int(counts.max()), 2))
+        ramp = self.__ramp(256, color)
+
+        pixels = pg.surfarray.pixels2d(self.surface)
+        pixels[hit // h, hit % h] = ramp[(128 + 127 * levels).astype(np.int64)]
+        del pixels
+        return len(hit)
+
+    def bodies(self, screen_positions: np.ndarray, radii: np.ndarray, color: Color) -> None:
+        """
+        draw all bodies, radii in pixels (bodies below 1.5 pixels go into a density map)
+        """
+        visible = self.visible(screen_positions, radii)
+        small = visible[radii[visible] < 1.5]
+        large = visible[radii[visible] >= 1.5]
+
+        if len(small):
+            self.density(screen_positions[small], color)
+
+        for (x, y), r in zip(screen_positions[large].tolist(), radii[large].tolist()):
+            pg.draw.circle(self.surface, color, (x, y), r)
+
+    def text(self, text: str, position: tp.Tuple[float, float], color: Color) -> None:
+        self.glyphs.draw(self.surface, text, position, color)
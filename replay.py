@@ -0,0 +1,146 @@
+"""
+Playback of recorded trajectories (see trajectory.py)
+Author:
+Nilusink
+"""
+from objects import Vector, BasicObject, Planet
+from trajectory import Trajectory
+import typing as tp
+import numpy as np
+
+
+class Replay:
+    """
+    Plays a trajectory file in scaled real time
+
+    The playback time advances by `speed` simulated seconds per real
+    second and the state is interpolated between the two surrounding
+    frames. Frames between two rendered frames are skipped, so the
+    playback speed does not depend on the frame rate. With `frame_skip`,
+    the playback instead moves a fixed number of frames per rendered frame.
+    Reaching the end, the file is checked for new frames, so a run that is
+    still being written can be followed.
+    """
+    def __init__(self, trajectory: Trajectory | str,
+                 speed: float | None = None,
+                 frame_skip: int = 0) -> None:
+        """
+        :param trajectory: trajectory or path of a trajectory file
+        :param speed: simulated seconds per real second, defaults to playing the whole file in one minute
+        :param frame_skip: if set, move this many frames per rendered frame instead of following the time
+        """
+        self.trajectory = trajectory if isinstance(trajectory, Trajectory) else Trajectory(trajectory)
+        if not len(self.trajectory):
+            raise ValueError(f"Invalid trajectory {self.trajectory.path!r}, it contains no frames")
+
+        if frame_skip < 0:
+            raise ValueError("Invalid value for \"frame_skip\", can't be negative")
+
+        times = self.trajectory.time
+        self.speed = speed if speed is not None else max(float(times[-1] - times[0]) / 60, 1e-9)
+        self.frame_skip = frame_skip
+        self.time = float(times[0])
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: frame {self.index}/{len(self.trajectory)}, t={self.time}>"
+
+    @property
+    def start(self) -> float:
+        return float(self.trajectory.time[0])
+
+    @property
+    def end(self) -> float:
+        return float(self.trajectory.time[-1])
+
+    @property
+    def index(self) -> int:
+        """
+        index of the frame at or before the playback time
+        """
+        return self.trajectory.index(self.time)
+
+    @property
+    def alpha(self) -> float:
+        """
+        position of the playback time between the current and the next frame (0..1)
+        """
+        i = self.index
+        times = self.trajectory.time
+        if i + 1 >= len(times) or times[i + 1] <= times[i]:
+            return 0.
+
+        return float(np.clip((self.time - times[i]) / (times[i + 1] - times[i]), 0, 1))
+
+    def seek(self, time: float) -> None:
+        """
+        jump to a simulated time (clamped to the recorded range)
+        """
+        self.time = float(np.clip(time, self.start, self.end))
+
+    def seek_frames(self, frames: int) -> None:
+        """
+        jump by a number of frames (negative: backwards)
+        """
+        i = int(np.clip(self.index + frames, 0, len(self.trajectory) - 1))
+        self.time = float(self.trajectory.time[i])
+
+    def advance(self, dt: float) -> None:
+        """
+        move the playback on after `dt` real seconds
+        """
+        if self.time >= self.end:
+            self.trajectory.refresh()
+
+        if self.frame_skip:
+            self.seek_frames(self.frame_skip)
+
+        else:
+            self.seek(self.time + dt * self.speed)
+
+    def __blend(self, field: str) -> np.ndarray:
+        i = self.index
+        current = self.trajectory.frames[i][field]
+        alpha = self.alpha
+        if not alpha:
+            return np.array(current)
+
+        following = self.trajectory.frames[i + 1][field]
+        return current + (following - current) * alpha
+
+    def positions(self) -> np.ndarray:
+        """
+        (N, 2) positions at the playback time
+        """
+        return self.__blend("position")
+
+    def velocities(self) -> np.ndarray:
+        """
+        (N, 2) velocities at the playback time
+        """
+        return self.__blend("velocity")
+
+    def traces(self, length: int) -> np.ndarray:
+        """
+        the last `length` recorded positions of every body (N, <=length, 2), oldest first
+        """
+        i = self.index
+        return np.swapaxes(self.trajectory.position[max(i + 1 - length, 0):i + 1], 0, 1)
+
+    def objects(self) -> tp.List[BasicObject]:
+        """
+        objects with the recorded metadata (name, mass, diameter, fixed) at the first frame
+        """
+        traj = self.trajectory
+        first = traj.frames[0]
+        objects = []
+        for i in range(traj.bodies):
+            position = Vector(*first["position"][i].tolist())
+            velocity = Vector(*first["velocity"][i].tolist())
+            if traj.diameter[i] > 0 or traj.names[i]:
+                objects.append(Planet(traj.names[i], float(traj.diameter[i]), float(traj.mass[i]),
+                                      position, velocity, fixed=bool(traj.fixed[i])))
+
+            else:
+                objects.append(BasicObject(float(traj.mass[i]), position, velocity, fixed=bool(traj.fixed[i])))
+
+        return objects
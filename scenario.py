@@ -0,0 +1,266 @@
+"""
+Scenario files: initial conditions as data instead of Python code
+
+Small, hand written scenarios are TOML or JSON files with a list of bodies
+and (optionally) procedurally generated groups, see generators.py:
+
+    [[bodies]]
+    name = "Sun"
+    mass = 1.9885e30
+    diameter = 1392684000
+    position = [0, 0]           # m
+    velocity = [0, 0]           # m/s
+    fixed = false
+
+    [[generate]]
+    generator = "kepler"        # any name in generators.GENERATORS
+    n = 100000
+    seed = 1
+    outer = 1.5e12              # all other keys are passed on to the generator
+    central = false             # the sun is listed above, don't add a second one
+
+Large scenarios are stored as columns: NPZ files with the arrays mass (N,),
+position (N, 2), velocity (N, 2), diameter (N,), fixed (N,) and names (N,)
+(batch.py snapshots can be loaded as well), or CSV files with a header and
+the columns name, mass, x, y, vx, vy, diameter, fixed. Every loader returns
+the arrays of generators.bodies, ready for `Simulation.from_arrays(**bodies)`.
+
+Author:
+Nilusink
+"""
+from generators import Bodies, bodies, generate
+from objects import Simulation, BasicObject, Planet
+import typing as tp
+import numpy as np
+import tomllib
+import json
+import csv
+import os
+
+
+# csv columns, the ones without a default are required
+CSV_COLUMNS = {
+    "name": "",
+    "mass": None,
+    "x": None,
+    "y": None,
+    "vx": 0.,
+    "vy": 0.,
+    "diameter": 0.,
+    "fixed": False,
+}
+
+
+def concatenate(*groups: Bodies) -> Bodies:
+    """
+    all bodies of several scenarios in one
+    """
+    if not groups:
+        return bodies(np.zeros(0), np.zeros((0, 2)))
+
+    return bodies(
+        np.concatenate([group["mass"] for group in groups]),
+        np.concatenate([group["position"] for group in groups]),
+        np.concatenate([group["velocity"] for group in groups]),
+        np.concatenate([group["diameter"] for group in groups]),
+        np.concatenate([group["fixed"] for group in groups]),
+        [name for group in groups for name in group["names"]],
+    )
+
+
+def from_objects(objects: tp.Sequence[BasicObject]) -> Bodies:
+    """
+    bodies of a list of objects (e.g. a scenario of setup.py, to save it as a file)
+    """
+    planets = [isinstance(obj, Planet) for obj in objects]
+    return bodies(
+        [obj.mass for obj in objects],
+        [(obj.position.x, obj.position.y) for obj in objects],
+        [(obj.velocity.x, obj.velocity.y) for obj in objects],
+        [obj.diameter if planet else 0 for obj, planet in zip(objects, planets)],
+        [obj.fixed for obj in objects],
+        [obj.name if planet else "" for obj, planet in zip(objects, planets)],
+    )
+
+
+def parse(data: tp.Mapping[str, tp.Any]) -> Bodies:
+    """
+    bodies of a parsed TOML / JSON scenario
+    """
+    unknown = set(data) - {"bodies", "generate"}
+    if unknown:
+        raise ValueError(f"Invalid scenario keys: {', '.join(sorted(unknown))} (expected bodies, generate)")
+
+    listed = list(data.get("bodies", ()))
+    for i, body in enumerate(listed):
+        if "mass" not in body or "position" not in body:
+            raise ValueError(f"Invalid body {i}: \"mass\" and \"position\" are required")
+
+    groups = [bodies(
+        [body["mass"] for body in listed],
+        [body["position"] for body in listed],
+        [body.get("velocity", (0, 0)) for body in listed],
+        [body.get("diameter", 0) for body in listed],
+        [body.get("fixed", False) for body in listed],
+        [body.get("name", "") for body in listed],
+    )]
+
+    for group in data.get("generate", ()):
+        group = dict(group)
+        try:
+            name, n = group.pop("generator"), group.pop("n")
+
+        except KeyError as error:
+            raise ValueError(f"Invalid generated group, {error.args[0]!r} is required") from None
+
+        groups.append(generate(name, int(n), **group))
+
+    return concatenate(*groups)
+
+
+def load_toml(path: str) -> Bodies:
+    with open(path, "rb") as file:
+        return parse(tomllib.load(file))
+
+
+def load_json(path: str) -> Bodies:
+    with open(path) as file:
+        return parse(json.load(file))
+
+
+def load_npz(path: str) -> Bodies:
+    with np.load(path) as data:
+        if "mass" not in data or "position" not in data:
+            raise ValueError(f"Invalid scenario {path!r}: the arrays \"mass\" and \"position\" are required")
+
+        return bodies(
+            data["mass"],
+            data["position"],
+            data["velocity"] if "velocity" in data else None,
+            data["diameter"] if "diameter" in data else None,
+            data["fixed"] if "fixed" in data else None,
+            data["names"].tolist() if "names" in data else None,
+        )
+
+
+def load_csv(path: str) -> Bodies:
+    with open(path, newline="") as file:
+        header = [column.strip() for column in next(csv.reader(file), [])]
+
+    missing = [column for column, default in CSV_COLUMNS.items() if default is None and column not in header]
+    if missing:
+        raise ValueError(f"Invalid scenario {path!r}: missing columns {', '.join(missing)}")
+
+    # the numbers are parsed in bulk, only the names (if any) as strings
+    # (fields may be quoted like csv.writer does it, e.g. names with commas)
+    numeric = [column for column in header if column in CSV_COLUMNS and column != "name"]
+    values = np.loadtxt(
+        path, delimiter=",", quotechar='"', skiprows=1, ndmin=2,
+        usecols=[header.index(column) for column in numeric],
+        converters={header.index("fixed"): lambda value: float(value.strip().lower() in ("1", "true"))}
+        if "fixed" in header else None,
+    )
+    columns = dict(zip(numeric, values.T))
+    n = len(values)
+
+    def column(name: str) -> np.ndarray:
+        return columns[name] if name in columns else np.full(n, CSV_COLUMNS[name])
+
+    names = None
+    if "name" in header:
+        names = np.loadtxt(
+            path, delimiter=",", quotechar='"', skiprows=1, ndmin=1, usecols=header.index("name"), dtype=str
+        )
+        names = [name.strip() for name in names.tolist()]
+
+    return bodies(
+        column("mass"),
+        np.stack((column("x"), column("y")), axis=1),
+        np.stack((column("vx"), column("vy")), axis=1),
+        column("diameter"),
+        column("fixed").astype(bool),
+        names,
+    )
+
+
+LOADERS: tp.Dict[str, tp.Callable[[str], Bodies]] = {
+    ".toml": load_toml,
+    ".json": load_json,
+    ".npz": load_npz,
+    ".csv": load_csv,
+}
+
+
+def load(path: str) -> Bodies:
+    """
+    bodies of a scenario file, the format is chosen by the extension
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in LOADERS:
+        raise ValueError(f"Invalid scenario file {path!r} (supported: {', '.join(LOADERS)})")
+
+    return LOADERS[extension](path)
+
+
+def resolve(spec: str) -> Bodies:
+    """
+    bodies of a scenario file or of a generator: "generator:n[:seed]" (e.g. "kepler:1000000")
+    """
+    if os.path.isfile(spec):
+        return load(spec)
+
+    name, _, rest = spec.partition(":")
+    if not rest:
+        raise ValueError(f"Invalid scenario {spec!r}, expected a file or \"generator:n[:seed]\"")
+
+    n, _, seed = rest.partition(":")
+    return generate(name, int(n), seed=int(seed) if seed else 0)
+
+
+def save(body: Bodies, path: str) -> None:
+    """
+    write bodies as NPZ, JSON or CSV (chosen by the extension)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    match extension:
+        case ".npz":
+            np.savez(path, **{key: np.asarray(value) for key, value in body.items()})
+
+        case ".json":
+            with open(path, "w") as file:
+                json.dump({"bodies": [
+                    {
+                        "name": name,
+                        "mass": mass,
+                        "diameter": diameter,
+                        "position": position,
+                        "velocity": velocity,
+                        "fixed": fixed,
+                    }
+                    for name, mass, diameter, position, velocity, fixed in zip(
+                        body["names"], body["mass"].tolist(), body["diameter"].tolist(),
+                        body["position"].tolist(), body["velocity"].tolist(), body["fixed"].tolist(),
+                    )
+                ]}, file, indent=2)
+
+        case ".csv":
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(CSV_COLUMNS)
+                writer.writerows(zip(
+                    body["names"], body["mass"].tolist(),
+                    body["position"][:, 0].tolist(), body["position"][:, 1].tolist(),
+                    body["velocity"][:, 0].tolist(), body["velocity"][:, 1].tolist(),
+                    body["diameter"].tolist(), body["fixed"].astype(int).tolist(),
+                ))
+
+        case _:
+            raise ValueError(f"Invalid scenario file {path!r} (supported: .npz, .json, .csv)")
+
+
+def simulation(spec: str, **kw) -> Simulation:
+    """
+    a simulation of a scenario file or generator (see `resolve`)
+    :param kw: passed on to `Simulation`
+    """
+    return Simulation.from_arrays(**resolve(spec), **kw)
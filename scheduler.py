@@ -0,0 +1,101 @@
+"""
+Fixed time step scheduling of the physics
+Author:
+Nilusink
+"""
+import typing as tp
+import numpy as np
+import time
+
+
+class FixedStepScheduler:
+    """
+    Runs the physics with a constant step size, independent of the wall clock
+
+    Real time is collected in an accumulator and spent in whole steps of
+    `step` simulated seconds, so the same number of steps always gives
+    the same result. If the physics can't keep up, at most `max_steps`
+    are run per call and the rest of the backlog is dropped (the
+    simulation slows down instead of spiraling).
+    """
+    def __init__(self, step: float,
+                 time_scale: float = 1,
+                 max_steps: int = 8,
+                 clock: tp.Callable[[], float] = time.perf_counter) -> None:
+        """
+        :param step: simulated seconds per physics step
+        :param time_scale: how many simulated seconds one real second represents
+        :param max_steps: maximum number of steps per `advance` call (catch-up budget)
+        :param clock: time source in seconds
+        """
+        if step <= 0:
+            raise ValueError("Invalid value for \"step\", needs to be positive")
+
+        self.step = step
+        self.time_scale = time_scale
+        self.max_steps = max_steps
+        self.__clock = clock
+        self.__last = clock()
+        self.__accumulator = 0.
+
+        self.steps = 0
+        self.dropped = 0
+
+    @property
+    def alpha(self) -> float:
+        """
+        how far the real time is between the last and the next step (0..1),
+        used to interpolate the rendered state
+        """
+        return min(self.__accumulator / self.step, 1.)
+
+    @property
+    def time_to_next_step(self) -> float:
+        """
+        real seconds until the next step is due
+        """
+        if self.time_scale <= 0:
+            return float("inf")
+
+        return max(self.step - self.__accumulator, 0.) / self.time_scale
+
+    def reset(self) -> None:
+        """
+        forget the time passed since the last call (e.g. while paused)
+        """
+        self.__last = self.__clock()
+        self.__accumulator = 0.
+
+    def advance(self, step_function: tp.Callable[[float], None]) -> int:
+        """
+        run all physics steps which are due
+        :param step_function: called with the step size for every step
+        :return: number of steps run
+        """
+        now = self.__clock()
+        self.__accumulator += (now - self.__last) * self.time_scale
+        self.__last = now
+
+        n = 0
+        while self.__accumulator >= self.step and n < self.max_steps:
+            step_function(self.step)
+            self.__accumulator -= self.step
+            n += 1
+
+        # drop the backlog if the physics can't keep up
+        if self.__accumulator >= self.step:
+            skipped = int(self.__accumulator // self.step)
+            self.dropped += skipped
+            self.__accumulator -= skipped * self.step
+
+        self.steps += n
+        return n
+
+    def interpolate(self, previous: np.ndarray, current: np.ndarray) -> np.ndarray:
+        """
+        blend the states before and after the last step by `alpha`
+        """
+        if previous.shape != current.shape:
+            return current
+
+        return previous + (current - previous) * self.alpha
@@ -0,0 +1,200 @@
+"""
+Hand over the simulation state from the physics thread to the renderer
+Author:
+Nilusink
+"""
+from objects import Simulation, Planet
+from collections import deque
+import typing as tp
+import numpy as np
+
+
+class Snapshot:
+    """
+    Read-only copy of the simulation state at one point in time
+
+    The arrays are reused for later snapshots once the reader has moved
+    on, so they must not be kept after the next `SnapshotExchange.latest`.
+    """
+    FIELDS = ("ids", "position", "previous", "velocity", "mass", "diameter", "collides", "trace_counts")
+
+    def __init__(self) -> None:
+        self.time = 0.
+        self.steps = 0
+
+        # number of the publish which filled this snapshot, to recognize a new state
+        self.serial = 0
+
+        # names of the planets ("" for other bodies), only rebuilt when the ids change
+        self.names = np.zeros(0, dtype=str)
+        self.__names_of: np.ndarray | None = None
+
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.position = np.zeros((0, 2))
+        self.previous = np.zeros((0, 2))
+        self.velocity = np.zeros((0, 2))
+        self.mass = np.zeros(0)
+        self.diameter = np.zeros(0)
+        self.collides = np.zeros(0, dtype=bool)
+        self.trace_counts = np.zeros(0, dtype=np.int64)
+
+        # (N, L, 2) traces, oldest first, thinned out to a budget of samples (L = 0 without traces),
+        # only as long as the longest one, trace_length is the length of a full (thinned out) trace
+        self.trace = np.zeros((0, 0, 2))
+        self.trace_length = 0
+
+        self.__buffers: tp.Dict[str, np.ndarray] = {}
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: {len(self)} objects, step {self.steps}, t={self.time}>"
+
+    def __len__(self) -> int:
+        return len(self.position)
+
+    def _fill(self, sim: Simulation, previous: np.ndarray | None = None, trace_points: int = 0) -> None:
+        """
+        copy the state of `sim` into this snapshot (only called by the writer)
+        :param previous: positions before the last step (for interpolation), defaults to the current ones
+        :param trace_points: number of trace samples to copy, longer traces are thinned out (0 skips them)
+        """
+        store = sim.store
+        n = len(store.mass)
+        if previous is None or previous.shape != store.position.shape:
+            previous = store.position
+
+        trace = store.trace if trace_points > 0 else None
+        counts = trace.counts(n) if trace is not None else np.zeros(n, dtype=np.int64)
+        if trace is not None:
+            stride = max(1, -(-int(counts.sum()) // trace_points))
+            longest = int(counts.max()) if n else 0
+            window, counts = trace.window(longest, rows=n, stride=stride)
+
+            # room for a full trace, so growing traces don't allocate a new buffer every time
+            samples = self.__buffer("trace", n, window.shape[1:], float, (-(-trace.length // stride), 2))
+            samples[:] = window
+            self.trace_length = -(-trace.length // stride)
+
+        else:
+            samples = self.__buffer("trace", n, (0, 2), float)
+            self.trace_length = 0
+
+        samples.flags.writeable = False
+        self.trace = samples
+
+        for name, source in zip(self.FIELDS, (
+                store.ids, store.position, previous, store.velocity, store.mass, store.diameter, store.collides,
+                counts
+        )):
+            view = self.__buffer(name, n, source.shape[1:], source.dtype)
+            view[:] = source
+            view.flags.writeable = False
+            setattr(self, name, view)
+
+        if self.__names_of is None or not np.array_equal(self.__names_of, store.ids):
+            self.names = np.array([obj.name if isinstance(obj, Planet) else "" for obj in sim.objects], dtype=str)
+            self.names.flags.writeable = False
+            self.__names_of = store.ids.copy()
+
+        self.time = sim.time
+        self.steps = sim.steps
+
+    def __buffer(self, name: str, n: int, shape: tp.Tuple[int, ...], dtype: np.dtype,
+                 room: tp.Tuple[int, ...] | None = None) -> np.ndarray:
+        """
+        the first n rows of a reused (writeable) buffer
+        :param shape: shape of a row
+        :param room: shape of a row to allocate if the buffer is too small (at least `shape`)
+        """
+        buffer = self.__buffers.get(name)
+        if buffer is None or len(buffer) < n or len(buffer.shape) != len(shape) + 1 \
+                or any(have < want for have, want in zip(buffer.shape[1:], shape)):
+            room = shape if room is None else tuple(max(a, b) for a, b in zip(room, shape))
+            buffer = np.zeros((max(2 * n, 1),) + room, dtype=dtype)
+            self.__buffers[name] = buffer
+
+        view = buffer[(slice(n),) + tuple(slice(k) for k in shape)]
+        view.flags.writeable = True
+        return view
+
+    # aggregates, calculated from the snapshot instead of the live simulation
+    @property
+    def total_mass(self) -> float:
+        return float(self.mass.sum())
+
+    @property
+    def gravity_center(self) -> np.ndarray:
+        total = self.mass.sum()
+        return self.mass @ self.position / total if total else np.zeros(2)
+
+    @property
+    def size(self) -> np.ndarray:
+        if not len(self.position):
+            return np.zeros(2)
+
+        return self.position.max(axis=0) - self.position.min(axis=0)
+
+
+class SnapshotExchange:
+    """
+    Triple buffer of snapshots between one writer and one reader
+
+    The writer fills a free snapshot and puts it in a mailbox (replacing an
+    unread one), the reader takes the newest snapshot out of the mailbox and
+    returns the one it held before. Both sides only use single
+    `deque.append` / `deque.popleft` calls, which are atomic, so neither
+    side ever waits for the other and no snapshot is written while it is
+    read. If the reader happens to hold two snapshots at the moment the
+    writer needs a new one, a fourth one is created.
+    """
+    def __init__(self, buffers: int = 3, trace_points: int = 0) -> None:
+        """
+        :param buffers: number of snapshots created up front
+        :param trace_points: number of trace samples copied into every snapshot (0 skips traces),
+            can be changed between publishes
+        """
+        self.__free: tp.Deque[Snapshot] = deque(Snapshot() for _ in range(buffers))
+        self.__mailbox: tp.Deque[Snapshot] = deque()
+        self.__current: Snapshot | None = None
+
+        self.published = 0
+        self.trace_points = trace_points
+
+    def publish(self, sim: Simulation, previous: np.ndarray | None = None) -> None:
+        """
+        publish the current state of `sim` (writer side)
+        :param previous: positions before the last step, for interpolation
+        """
+        try:
+            snapshot = self.__free.popleft()
+
+        except IndexError:
+            snapshot = Snapshot()
+
+        snapshot._fill(sim, previous, self.trace_points)
+        snapshot.serial = self.published + 1
+
+        # an unread snapshot is outdated now
+        try:
+            self.__free.append(self.__mailbox.popleft())
+
+        except IndexError:
+            pass
+
+        self.__mailbox.append(snapshot)
+        self.published += 1
+
+    def latest(self) -> Snapshot | None:
+        """
+        the newest published snapshot (reader side), None before the first one
+        """
+        try:
+            snapshot = self.__mailbox.popleft()
+
+        except IndexError:
+            return self.__current
+
+        if self.__current is not None:
+            self.__free.append(self.__current)
+
+        self.__current = snapshot
+        return snapshot
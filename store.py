@@ -0,0 +1,296 @@
+"""
+Array backed storage of all body states
+Author:
+Nilusink
+"""
+from traces import TraceBuffer
+import typing as tp
+import numpy as np
+
+
+class BodyStore:
+    """
+    Struct-of-arrays storage for bodies
+
+    Every body is one row in a set of contiguous arrays. The arrays are
+    allocated with spare capacity and grow geometrically, the properties
+    only return views of the used rows.
+    """
+    def __init__(self, capacity: int = 16, trace: TraceBuffer | None = None) -> None:
+        """
+        :param capacity: initial number of rows
+        :param trace: buffer for the traces of the bodies (optional)
+        """
+        capacity = max(1, capacity)
+        self.__size = 0
+        self.__next_id = 0
+
+        # changed whenever rows are added or changed, see `touch`
+        self.version = 0
+
+        self.__arrays: tp.Dict[str, np.ndarray] = {
+            "position": np.zeros((capacity, 2)),
+            "velocity": np.zeros((capacity, 2)),
+            "acceleration": np.zeros((capacity, 2)),
+            "mass": np.zeros(capacity),
+            "diameter": np.zeros(capacity),
+            "fixed": np.zeros(capacity, dtype=bool),
+            "collides": np.zeros(capacity, dtype=bool),
+            "ids": np.zeros(capacity, dtype=np.int64),
+        }
+
+        # the handle object (e.g. a Planet) of every row
+        self.__views: tp.List[tp.Any] = []
+
+        self.trace = trace
+        if trace is not None:
+            trace.reserve(capacity)
+
+    def __len__(self) -> int:
+        return self.__size
+
+    @property
+    def capacity(self) -> int:
+        return len(self.__arrays["mass"])
+
+    # array views of the used rows
+    @property
+    def position(self) -> np.ndarray:
+        return self.__arrays["position"][:self.__size]
+
+    @property
+    def velocity(self) -> np.ndarray:
+        return self.__arrays["velocity"][:self.__size]
+
+    @property
+    def acceleration(self) -> np.ndarray:
+        return self.__arrays["acceleration"][:self.__size]
+
+    @property
+    def mass(self) -> np.ndarray:
+        return self.__arrays["mass"][:self.__size]
+
+    @property
+    def diameter(self) -> np.ndarray:
+        return self.__arrays["diameter"][:self.__size]
+
+    @property
+    def fixed(self) -> np.ndarray:
+        return self.__arrays["fixed"][:self.__size]
+
+    @property
+    def collides(self) -> np.ndarray:
+        """
+        if true, the body takes part in collisions
+        """
+        return self.__arrays["collides"][:self.__size]
+
+    @property
+    def ids(self) -> np.ndarray:
+        """
+        unique id of every body, stays the same when rows are moved
+        """
+        return self.__arrays["ids"][:self.__size]
+
+    @property
+    def views(self) -> tp.List[tp.Any]:
+        return self.__views
+
+    # management
+    def touch(self) -> None:
+        """
+        mark the contents as changed (invalidates values cached from the arrays)
+        """
+        self.version += 1
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        """
+        copy of the used rows (and the trace), for checkpoints
+        """
+        state: tp.Dict[str, tp.Any] = {name: arr[:self.__size].copy() for name, arr in self.__arrays.items()}
+        state["next_id"] = self.__next_id
+        if self.trace is not None:
+            state["trace"] = self.trace.state()
+
+        return state
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        """
+        overwrite all rows with a state from `state` (the views are kept,
+        rows without a view get None)
+        """
+        size = len(state["mass"])
+        self.reserve(size)
+        for name, arr in self.__arrays.items():
+            arr[:size] = state[name]
+
+        self.__size = size
+        self.__next_id = int(state["next_id"])
+        del self.__views[size:]
+        self.__views.extend([None] * (size - len(self.__views)))
+
+        if self.trace is not None and "trace" in state:
+            self.trace.restore(state["trace"])
+            self.trace.reserve(self.capacity)
+
+        self.touch()
+
+    def reserve(self, capacity: int) -> None:
+        """
+        make sure there is room for at least `capacity` rows
+        """
+        if capacity <= self.capacity:
+            return
+
+        new = max(capacity, 2 * self.capacity)
+        for name, old in self.__arrays.items():
+            arr = np.zeros((new,) + old.shape[1:], dtype=old.dtype)
+            arr[:self.__size] = old[:self.__size]
+            self.__arrays[name] = arr
+
+        if self.trace is not None:
+            self.trace.reserve(new)
+
+    def add(self, mass: float,
+            position: tp.Tuple[float, float],
+            velocity: tp.Tuple[float, float] = (0, 0),
+            acceleration: tp.Tuple[float, float] = (0, 0),
+            fixed: bool = False,
+            diameter: float = 0,
+            collides: bool = False,
+            view: tp.Any = None) -> int:
+        """
+        append a body
+        :return: the row index of the new body
+        """
+        self.reserve(self.__size + 1)
+        i = self.__size
+        arrays = self.__arrays
+        arrays["position"][i] = position
+        arrays["velocity"][i] = velocity
+        arrays["acceleration"][i] = acceleration
+        arrays["mass"][i] = mass
+        arrays["diameter"][i] = diameter
+        arrays["fixed"][i] = fixed
+        arrays["collides"][i] = collides
+        arrays["ids"][i] = self.__next_id
+
+        self.__next_id += 1
+        self.__size += 1
+        self.__views.append(view)
+        self.touch()
+
+        if self.trace is not None:
+            self.trace.clear(i)
+
+        return i
+
+    def extend(self, mass: np.ndarray,
+               position: np.ndarray,
+               velocity: np.ndarray | None = None,
+               fixed: np.ndarray | None = None,
+               diameter: np.ndarray | None = None,
+               collides: np.ndarray | None = None,
+               views: tp.Sequence[tp.Any] | None = None) -> np.ndarray:
+        """
+        append many bodies at once (arrays with one row per body, missing ones are zero)
+        :return: the row indices of the new bodies
+        """
+        n = len(mass)
+        if views is not None and len(views) != n:
+            raise ValueError(f"Invalid number of views ({len(views)}), expected {n}")
+
+        self.reserve(self.__size + n)
+        rows = np.arange(self.__size, self.__size + n)
+        arrays = self.__arrays
+        for name, value in (
+                ("position", position), ("velocity", velocity), ("acceleration", None), ("mass", mass),
+                ("diameter", diameter), ("fixed", fixed), ("collides", collides)
+        ):
+            arrays[name][rows] = 0 if value is None else value
+
+        arrays["ids"][rows] = np.arange(self.__next_id, self.__next_id + n)
+
+        self.__next_id += n
+        self.__size += n
+        self.__views.extend(views if views is not None else [None] * n)
+        self.touch()
+
+        if self.trace is not None:
+            self.trace.clear(rows)
+
+        return rows
+
+    def remove(self, rows: np.ndarray | tp.Sequence[int]) -> tp.Tuple[np.ndarray, np.ndarray]:
+        """
+        swap-remove bodies: the last rows are moved into the gaps, so removing
+        k bodies copies at most k rows, no matter how many bodies there are.
+        Ids (and traces) move with their bodies, the handles of moved rows get
+        their new index. Removed handles keep their last state in a store of their own.
+        :return: (source, target) rows of the moved bodies
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if len(rows) and (rows[0] < 0 or rows[-1] >= self.__size):
+            raise ValueError(f"Invalid rows, the store has {self.__size} rows")
+
+        arrays, views = self.__arrays, self.__views
+        size = self.__size - len(rows)
+
+        # detach the removed handles (all in one store)
+        removed = BodyStore(capacity=len(rows))
+        removed.extend(
+            mass=arrays["mass"][rows],
+            position=arrays["position"][rows],
+            velocity=arrays["velocity"][rows],
+            fixed=arrays["fixed"][rows],
+            diameter=arrays["diameter"][rows],
+            collides=arrays["collides"][rows],
+            views=[views[i] for i in rows.tolist()],
+        )
+        removed.acceleration[:] = arrays["acceleration"][rows]
+        for j, view in enumerate(removed.views):
+            if view is not None:
+                view._store, view._index = removed, j
+
+        # fill the gaps below the new size with the remaining rows above it
+        tail = np.arange(size, self.__size)
+        source = tail[~np.isin(tail, rows)]
+        target = rows[rows < size]
+        for arr in arrays.values():
+            arr[target] = arr[source]
+
+        if self.trace is not None:
+            self.trace.move(source, target)
+
+        for i, j in zip(source.tolist(), target.tolist()):
+            view = views[j] = views[i]
+            if view is not None:
+                view._index = j
+
+        del views[size:]
+        self.__size = size
+        self.touch()
+
+        return source, target
+
+    def adopt(self, view: tp.Any) -> int:
+        """
+        move a body handle (anything with `_store` and `_index`) into this store
+        :return: the new row index of the body
+        """
+        store: BodyStore = view._store
+        j = view._index
+        i = self.add(
+            mass=store.mass[j],
+            position=store.position[j],
+            velocity=store.velocity[j],
+            acceleration=store.acceleration[j],
+            fixed=store.fixed[j],
+            diameter=store.diameter[j],
+            collides=store.collides[j],
+            view=view,
+        )
+        view._store = self
+        view._index = i
+
+        return i
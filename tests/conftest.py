@@ -0,0 +1,9 @@
+"""
+The modules live in the repository root, make them importable from the tests
+Author:
+Nilusink
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
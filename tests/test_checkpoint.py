@@ -0,0 +1,105 @@
+"""
+Resuming from checkpoints continues bit-identically, also the outputs of batch runs
+Author:
+Nilusink
+"""
+from analytics import ConservationObserver, OrbitObserver
+from checkpoint import save_checkpoint, resume
+from trajectory import Trajectory, TrajectoryWriter
+from generators import collision_pile
+from objects import Simulation
+import numpy as np
+import pytest
+import batch
+
+
+def pile(**kw) -> Simulation:
+    return Simulation.from_arrays(
+        **collision_pile(64, spacing=1.01, infall=20, seed=2), solver="numpy", trace_length=20,
+        observers=[ConservationObserver(2), OrbitObserver(3)], **kw
+    )
+
+
+def assert_same(a: Simulation, b: Simulation) -> None:
+    assert a.time == b.time and a.steps == b.steps
+    for name in ("ids", "position", "velocity", "mass", "diameter"):
+        assert np.array_equal(getattr(a.store, name), getattr(b.store, name)), name
+
+    for row in range(len(a.store.mass)):
+        assert np.array_equal(a.store.trace.last(row), b.store.trace.last(row))
+
+    for first, second in zip(a.observers, b.observers):
+        assert first.series.fields == second.series.fields
+        for field in first.series.fields:
+            assert np.array_equal(first.series[field], second.series[field], equal_nan=True), field
+
+
+@pytest.mark.parametrize("integrator", ("euler", "leapfrog", "block"))
+def test_resume_with_contacts(tmp_path, integrator):
+    path = str(tmp_path / "checkpoint.npz")
+    dt = 100.
+
+    uninterrupted = pile(integrator=integrator)
+    interrupted = pile(integrator=integrator)
+    for _ in range(6):
+        uninterrupted.iter(dt)
+        interrupted.iter(dt)
+
+    # the checkpoint is taken while planets touch
+    assert len(interrupted.contacts)
+    save_checkpoint(interrupted, path)
+
+    resumed = resume(pile(integrator=integrator), path)
+    for _ in range(10):
+        uninterrupted.iter(dt)
+        resumed.iter(dt)
+
+    assert_same(resumed, uninterrupted)
+
+
+def test_append_trajectory(tmp_path):
+    path = str(tmp_path / "run.trj")
+    sim = pile()
+    with TrajectoryWriter(path, sim, chunk_frames=3) as writer:
+        for _ in range(10):
+            sim.iter(20.)
+            writer.write(sim)
+
+    # resumed at step 6: the frames of steps 6 to 10 are written again
+    resumed = pile()
+    for _ in range(6):
+        resumed.iter(20.)
+
+    with TrajectoryWriter(path, resumed, append=True) as writer:
+        assert writer.frames == 5
+        writer.write(resumed)
+
+    assert list(Trajectory(path).step) == [1, 2, 3, 4, 5, 6]
+
+    with pytest.raises(ValueError):
+        TrajectoryWriter(path, Simulation.from_arrays(**collision_pile(9)), append=True)
+
+
+def test_batch_resume(tmp_path):
+    def run(name: str, steps: int) -> None:
+        batch.main([
+            "pile:36:1", "--dt", "20", "--steps", str(steps), "--solver", "numpy",
+            "--checkpoint", str(tmp_path / f"{name}.npz"), "--checkpoint-steps", "4",
+            "--trajectory", str(tmp_path / f"{name}.trj"),
+            "--analytics", str(tmp_path / f"{name}_analytics.npz"), "--analytics-every", "2",
+        ])
+
+    run("full", 20)
+    run("resumed", 11)
+    run("resumed", 20)
+
+    full, resumed = Trajectory(str(tmp_path / "full.trj")), Trajectory(str(tmp_path / "resumed.trj"))
+    assert len(full) == len(resumed) == 21
+    assert np.array_equal(full.frames, resumed.frames)
+
+    with np.load(tmp_path / "full_analytics.npz") as a, np.load(tmp_path / "resumed_analytics.npz") as b:
+        assert sorted(a.files) == sorted(b.files)
+        for key in a.files:
+            assert np.array_equal(a[key], b[key], equal_nan=True), key
+
+        assert len(a["conservation/step"]) == 10
@@ -0,0 +1,24 @@
+"""
+Integrator details which don't show in the parity of the results
+Author:
+Nilusink
+"""
+from integrators import BlockLeapfrog
+from objects import Simulation, Planet, Vector
+
+
+def test_block_collides_once_per_step():
+    sim = Simulation([
+        Planet("a", 1e6, 1e22, position=Vector(0, 0)),
+        Planet("b", 1e6, 1e22, position=Vector(2e6, 0), velocity=Vector(-10, 0)),
+        Planet("far", 1e6, 1e22, position=Vector(1e11, 0)),
+    ], solver="numpy")
+
+    integrator = BlockLeapfrog()
+    calls = []
+    for _ in range(3):
+        integrator.step(sim.store, 3600, lambda targets: None, lambda: calls.append(1))
+
+    # the close pair takes many small steps, collisions are still resolved once per step
+    assert integrator.levels.max() > 0
+    assert len(calls) == 3
@@ -0,0 +1,135 @@
+"""
+Parity of the kernels with the numpy / python solvers and the original collision response
+Author:
+Nilusink
+"""
+from gravity import PythonGravity, NumpyGravity, NumbaGravity
+from kernels import HAS_NUMBA, gravity_kernel, resolve_collisions, _gravity, _resolve_collisions
+from objects import Vector
+from constants import G, PI
+import numpy as np
+import pytest
+
+
+compiled = pytest.mark.skipif(not HAS_NUMBA, reason="numba is not installed")
+
+
+def random_system(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n, 2)), rng.normal(size=(n, 2)), rng.uniform(.5, 2, n)
+
+
+def touching(position: np.ndarray, distance: float = .5):
+    """
+    both orders of every pair closer than `distance`, in the order Simulation.__collide uses
+    """
+    i, j = np.triu_indices(len(position), 1)
+    close = np.linalg.norm(position[i] - position[j], axis=1) < distance
+    now, influence = np.concatenate((i[close], j[close])), np.concatenate((j[close], i[close]))
+    order = np.lexsort((influence, now))
+    return now[order], influence[order]
+
+
+def reference_collisions(now, influence, position, velocity, acceleration, mass) -> np.ndarray:
+    """
+    the per pair Vector response of the original Simulation.iter, on the arrays
+    """
+    done = set()
+    collided = np.zeros(len(now), dtype=bool)
+    for k, (i, j) in enumerate(zip(now.tolist(), influence.tolist())):
+        if i in done:
+            continue
+
+        done.update((i, j))
+        collided[k] = True
+
+        delta = Vector(*position[i]) - Vector(*position[j])
+        now_velocity, inf_velocity = Vector(*velocity[i]), Vector(*velocity[j])
+
+        # split the velocities in two directions (90°)
+        a = delta.angle - now_velocity.angle
+        now_carry = Vector.from_polar(angle=delta.angle - PI / 2, length=now_velocity.length * np.sin(a))
+        now_collision = Vector.from_polar(angle=delta.angle, length=now_velocity.length * np.cos(a))
+
+        a = delta.angle - inf_velocity.angle
+        inf_carry = Vector.from_polar(angle=delta.angle - PI / 2, length=inf_velocity.length * np.sin(a))
+        inf_collision = Vector.from_polar(angle=delta.angle, length=inf_velocity.length * np.cos(a))
+
+        now_v = now_collision.length * mass[i]
+        now_v += (inf_collision.length * 2 - now_collision.length) * mass[j]
+        now_v /= mass[i] + mass[j]
+
+        inf_v = inf_collision.length * mass[j]
+        inf_v += (now_collision.length * 2 - inf_collision.length) * mass[i]
+        inf_v /= mass[j] + mass[i]
+
+        now_v = now_carry + Vector.from_polar(angle=now_collision.angle, length=now_v)
+        inf_v = inf_carry + Vector.from_polar(angle=inf_collision.angle, length=inf_v)
+
+        velocity[i] = now_v.x, now_v.y
+        velocity[j] = inf_v.x, inf_v.y
+        acceleration[i] = acceleration[j] = 0
+
+    return collided
+
+
+@pytest.mark.parametrize("n", [2, 10, 100])
+@pytest.mark.parametrize("softening", [0, .1])
+def test_numba_solver_matches_numpy_and_python(n: int, softening: float) -> None:
+    position, _, mass = random_system(n)
+    expected = NumpyGravity(softening).accelerations(position, mass)
+
+    assert np.allclose(NumbaGravity(softening).accelerations(position, mass), expected, rtol=1e-10, atol=0)
+    assert np.allclose(PythonGravity(softening).accelerations(position, mass), expected, rtol=1e-10, atol=0)
+
+
+def test_numba_solver_targets() -> None:
+    position, _, mass = random_system(200, seed=1)
+    targets = np.array([0, 17, 199, 42])
+    expected = NumpyGravity().accelerations(position, mass)[targets]
+
+    assert np.allclose(NumbaGravity().accelerations(position, mass, targets), expected, rtol=1e-10, atol=0)
+
+
+@compiled
+def test_compiled_gravity_kernel_matches_python() -> None:
+    position, _, mass = random_system(300, seed=2)
+    targets = np.arange(300)
+    results = []
+    for kernel in (gravity_kernel, _gravity):
+        ax, ay = np.zeros(300), np.zeros(300)
+        kernel(position[:, 0].copy(), position[:, 1].copy(), G * mass, targets, 1e-4, ax, ay)
+        results.append(np.stack((ax, ay), axis=1))
+
+    assert np.allclose(results[0], results[1], rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize("kernel", [
+    pytest.param(resolve_collisions, id="kernel", marks=compiled),
+    pytest.param(_resolve_collisions, id="python"),
+])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_collisions_match_original_response(kernel, seed: int) -> None:
+    position, velocity, mass = random_system(60, seed)
+    now, influence = touching(position)
+    assert len(now)
+
+    v_expected, a_expected = velocity.copy(), np.ones((60, 2))
+    collided_expected = reference_collisions(now, influence, position, v_expected, a_expected, mass)
+
+    v, a = velocity.copy(), np.ones((60, 2))
+    collided = kernel(now, influence, position, v, a, mass)
+
+    assert np.array_equal(collided, collided_expected)
+    assert np.allclose(v, v_expected, rtol=1e-9, atol=1e-12)
+    assert np.array_equal(a, a_expected)
+
+
+def test_collisions_conserve_momentum_and_energy() -> None:
+    position, velocity, mass = random_system(60, seed=3)
+    now, influence = touching(position)
+    v = velocity.copy()
+    resolve_collisions(now, influence, position, v, np.zeros((60, 2)), mass)
+
+    assert np.allclose(mass @ v, mass @ velocity)
+    assert np.isclose(mass @ np.sum(v ** 2, axis=1), mass @ np.sum(velocity ** 2, axis=1))
@@ -0,0 +1,78 @@
+"""
+Merge mode: conservation and the bookkeeping of swap-removed bodies
+Author:
+Nilusink
+"""
+from objects import Simulation, Planet, Vector
+from generators import collision_pile
+import numpy as np
+import pytest
+import batch
+
+
+def planets() -> list:
+    """
+    a touching pair, a chain of three, a lone planet and a fixed planet touching a loose one
+    """
+    return [
+        Planet("a", 2, 1, position=Vector(0, 0), velocity=Vector(1, 0)),
+        Planet("b", 2, 3, position=Vector(1.5, 0), velocity=Vector(-1, 2)),
+        Planet("c", 2, 2, position=Vector(0, 10)),
+        Planet("d", 2, 5, position=Vector(1.8, 10), velocity=Vector(0, -3)),
+        Planet("e", 2, 1, position=Vector(3.6, 10), velocity=Vector(4, 1)),
+        Planet("lone", 2, 7, position=Vector(20, 20), velocity=Vector(1, 1)),
+        Planet("held", 2, 1, position=Vector(-20, 0), fixed=True),
+        Planet("f", 2, 9, position=Vector(-18.5, 0), velocity=Vector(0, 1)),
+    ]
+
+
+def totals(sim: Simulation):
+    store = sim.store
+    return store.mass.sum(), store.mass[~store.fixed] @ store.velocity[~store.fixed], np.sum(store.diameter ** 3)
+
+
+def test_merge():
+    sim = Simulation(planets(), solver="numpy", collision_mode="merge")
+    by_id = dict(zip(sim.store.ids.tolist(), sim.objects))
+    mass, momentum, volume = totals(sim)
+    free = sim.store.mass[~sim.store.fixed].sum()
+
+    sim.iter(1e-9, gravity=False)
+    store = sim.store
+
+    assert sorted(obj.name for obj in sim.objects) == ["b", "d", "held", "lone"]
+    assert np.isclose(store.mass.sum(), mass) and np.isclose(np.sum(store.diameter ** 3), volume)
+
+    # the fixed planet absorbs "f", the momentum of the loose planets only loses what "f" had
+    _, merged_momentum, _ = totals(sim)
+    assert np.allclose(merged_momentum, momentum - 9 * np.array([0, 1]))
+    assert np.isclose(store.mass[~store.fixed].sum(), free - 9)
+
+    held = [obj for obj in sim.objects if obj.name == "held"][0]
+    assert (held.position.x, held.position.y) == (-20, 0) and held.mass == 10
+
+    # ids and handles still belong to their rows
+    assert len(np.unique(store.ids)) == len(store) == len(sim.objects)
+    for row, obj in enumerate(sim.objects):
+        assert obj._store is store and obj._index == row
+        assert by_id[int(store.ids[row])] is obj
+
+
+def test_merge_pile():
+    sim = Simulation.from_arrays(**collision_pile(100, spacing=1., seed=1), solver="numpy", collision_mode="merge")
+    mass, momentum, volume = totals(sim)
+    by_id = dict(zip(sim.store.ids.tolist(), sim.objects))
+
+    sim.iter(1., gravity=False)
+
+    assert len(sim.objects) < 100
+    merged_mass, merged_momentum, merged_volume = totals(sim)
+    assert np.isclose(merged_mass, mass) and np.isclose(merged_volume, volume)
+    assert np.allclose(merged_momentum, momentum, atol=1e-6 * mass)
+    for row, obj in enumerate(sim.objects):
+        assert by_id[int(sim.store.ids[row])] is obj and obj._index == row
+
+
+def test_batch_rejects_merge_trajectory(tmp_path):
+    with pytest.raises(SystemExit):
+        batch.main(["pile:9", "--dt", "1", "--steps", "1", "--merge", "--trajectory", str(tmp_path / "run.trj")])
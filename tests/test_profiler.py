@@ -0,0 +1,47 @@
+"""
+Profiler records and counters
+Author:
+Nilusink
+"""
+from profiler import Profiler
+import threading
+import sys
+
+
+def test_count_from_threads():
+    profiler = Profiler(capacity=16)
+    barrier = threading.Barrier(4)
+
+    def work() -> None:
+        barrier.wait()
+        for _ in range(20_000):
+            profiler.count("pairs", 3)
+            profiler.count("steps")
+
+    # switch threads as often as possible, so unsynchronized updates would get lost
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    finally:
+        sys.setswitchinterval(interval)
+
+    # the totals don't depend on the (small) record buffer
+    assert profiler.totals == {"pairs": 4 * 20_000 * 3, "steps": 4 * 20_000}
+
+
+def test_phases():
+    profiler = Profiler()
+    with profiler.phase("step"):
+        with profiler.phase("gravity"):
+            pass
+
+    records = profiler.records()
+    assert (records["kind"] == Profiler.KIND_PHASE).all()
+    assert set(profiler.summary()["phases"]) == {"step", "gravity"}
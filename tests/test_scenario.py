@@ -0,0 +1,48 @@
+"""
+Scenario files and the generators they use
+Author:
+Nilusink
+"""
+from generators import keplerian_disk, rotating_disk
+from objects import Simulation
+import scenario
+import numpy as np
+import textwrap
+import tomllib
+import pytest
+
+
+def documented_example() -> dict:
+    """
+    the TOML example of the scenario module docstring
+    """
+    doc = scenario.__doc__
+    start = doc.index("    [[bodies]]")
+    return tomllib.loads(textwrap.dedent(doc[start:doc.index("\nLarge scenarios", start)]))
+
+
+@pytest.mark.parametrize("generator", (keplerian_disk, rotating_disk))
+def test_central(generator):
+    with_star = generator(10, seed=3)
+    without = generator(10, central=False, seed=3)
+
+    assert len(with_star["mass"]) == len(without["mass"]) == 10
+    assert np.count_nonzero(with_star["mass"] > 1e29) == 1
+    assert np.all(without["mass"] < 1e29)
+
+
+def test_documented_example():
+    data = documented_example()
+    data["generate"][0]["n"] = 200
+    body = scenario.parse(data)
+
+    # a single sun, the disk orbits it
+    assert np.count_nonzero(body["mass"] > 1e29) == 1
+    assert len(body["mass"]) == 201
+
+    sim = Simulation.from_arrays(**body)
+    radius = np.abs(sim.store.position).max()
+    sim.iter(3600)
+
+    assert np.all(np.isfinite(sim.store.position))
+    assert np.abs(sim.store.position).max() < 1.01 * radius
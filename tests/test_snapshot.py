@@ -0,0 +1,70 @@
+"""
+Snapshots hand over copies of the state (and traces) to the renderer
+Author:
+Nilusink
+"""
+from snapshot import Snapshot, SnapshotExchange
+from generators import keplerian_disk
+from objects import Simulation
+import numpy as np
+
+
+def disk(n: int = 50, trace_length: int = 40) -> Simulation:
+    return Simulation.from_arrays(**keplerian_disk(n, seed=4), solver="numpy", trace_length=trace_length)
+
+
+def test_trace_copy():
+    sim = disk()
+    for _ in range(10):
+        sim.iter(3600)
+
+    exchange = SnapshotExchange(trace_points=10 ** 6)
+    exchange.publish(sim)
+    snap = exchange.latest()
+
+    # a copy of the traces as of the snapshot, later steps don't change it
+    expected = [sim.store.trace.last(row).copy() for row in range(len(snap))]
+    sim.iter(3600)
+    for row, samples in enumerate(expected):
+        assert np.array_equal(snap.trace[row, snap.trace.shape[1] - snap.trace_counts[row]:], samples)
+
+    assert not snap.trace.flags.writeable
+
+
+def test_trace_budget():
+    sim = disk()
+    for _ in range(30):
+        sim.iter(3600)
+
+    snap = Snapshot()
+    snap._fill(sim, trace_points=500)
+    assert snap.trace_counts.sum() <= 500
+    assert snap.trace_length == snap.trace.shape[1]
+
+    snap._fill(sim)
+    assert snap.trace.shape[1] == 0 and snap.trace_length == 0
+
+
+def test_buffers_are_reused():
+    sim = disk()
+    snap = Snapshot()
+    snap._fill(sim, trace_points=10 ** 6)
+    buffers = snap.trace.base, snap.position.base
+
+    # the traces grow while the buffers stay the same
+    for _ in range(sim.store.trace.length + 5):
+        sim.iter(3600)
+        snap._fill(sim, trace_points=10 ** 6)
+        assert snap.trace.base is buffers[0] and snap.position.base is buffers[1]
+
+    assert snap.trace.shape[1] == sim.store.trace.length
+
+
+def test_names():
+    sim = disk(5)
+    snap = Snapshot()
+    snap._fill(sim)
+
+    assert snap.names.tolist() == ["Sun", "", "", "", ""]
+    assert np.array_equal(snap.ids, sim.store.ids)
+    assert len(snap) == 5
@@ -0,0 +1,73 @@
+"""
+The shared trace ring buffer and the traces of the objects
+Author:
+Nilusink
+"""
+from objects import Simulation, Planet, Vector
+from traces import TraceBuffer
+import numpy as np
+
+
+def filled(length: int = 7, samples: int = 10) -> TraceBuffer:
+    """
+    a buffer of 3 bodies, the second and third one only recorded for the last 4 / 1 samples
+    """
+    trace = TraceBuffer(length, rows=3)
+    for i in range(samples):
+        trace.record(np.array([[i, 0], [i, 1], [i, 2]], dtype=float), np.array([True, i >= 6, i >= 9]))
+
+    return trace
+
+
+def test_last_is_a_view():
+    trace = filled()
+    last = trace.last(0, 3)
+
+    assert np.array_equal(last[:, 0], [7, 8, 9])
+    assert np.shares_memory(last, trace.last(0)) and not last.flags.writeable
+    assert np.array_equal(trace.last(1)[:, 0], [6, 7, 8, 9])
+
+
+def test_window_stride():
+    trace = filled()
+    for stride, columns, counts in ((1, [3, 4, 5, 6, 7, 8, 9], [7, 4, 1]), (2, [3, 5, 7, 9], [4, 2, 1]),
+                                    (3, [3, 6, 9], [3, 2, 1]), (5, [4, 9], [2, 1, 1]), (9, [9], [1, 1, 1])):
+        samples, valid = trace.window(stride=stride)
+
+        assert samples.base is not None and not samples.flags.writeable
+        assert np.array_equal(samples[0, :, 0], columns)
+        assert np.array_equal(valid, counts)
+
+    assert trace.window(0)[0].shape == (3, 0, 2)
+
+
+def test_state():
+    trace = filled()
+    restored = TraceBuffer(7, rows=3)
+    restored.restore(trace.state())
+
+    for row in range(3):
+        assert np.array_equal(restored.last(row), trace.last(row))
+
+
+def simulation(**kw) -> Simulation:
+    return Simulation([
+        Planet("Sun", 1e9, 2e30, position=Vector(0, 0)),
+        Planet("Earth", 1e7, 6e24, position=Vector(1.5e11, 0), velocity=Vector(0, 3e4)),
+    ], solver="numpy", **kw)
+
+
+def test_traces_are_opt_in():
+    sim = simulation()
+    sim.iter(3600)
+
+    assert sim.store.trace is None
+    assert sim.objects[1].trace.shape == (0, 2)
+
+    sim = simulation(trace_length=5)
+    for _ in range(8):
+        sim.iter(3600)
+
+    trace = sim.objects[1].trace
+    assert len(trace) == 5
+    assert np.array_equal(trace[-1], sim.store.position[1])
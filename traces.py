@@ -0,0 +1,192 @@
+"""
+Fixed capacity storage for the traces of all bodies
+Author:
+Nilusink
+"""
+import typing as tp
+import numpy as np
+
+
+class TraceBuffer:
+    """
+    Shared ring buffer of the last positions of all bodies
+
+    All bodies share one (rows, 2*length, 2) array and one write head.
+    Every sample is written twice (at head and head + length), so the last
+    n samples of a body are always a single contiguous slice and can be
+    returned without copying. The price is twice the memory: 32 bytes per
+    sample and body (32 kB per body for the default length).
+    """
+    def __init__(self, length: int = 1000, every: int = 1, rows: int = 16) -> None:
+        """
+        :param length: number of samples kept per body
+        :param every: only record every n-th call of `record` (decimation)
+        :param rows: initial number of bodies
+        """
+        if length < 1:
+            raise ValueError("Invalid value for \"length\", needs to be at least 1")
+
+        if every < 1:
+            raise ValueError("Invalid value for \"every\", needs to be at least 1")
+
+        self.__length = length
+        self.__every = every
+        self.__calls = 0
+        self.__head = 0
+
+        self.__data = np.zeros((max(1, rows), 2 * length, 2))
+        self.__count = np.zeros(max(1, rows), dtype=np.int64)
+
+    @property
+    def length(self) -> int:
+        return self.__length
+
+    @property
+    def every(self) -> int:
+        return self.__every
+
+    @property
+    def rows(self) -> int:
+        return len(self.__count)
+
+    @property
+    def head(self) -> int:
+        """
+        slot the next sample is written to
+        """
+        return self.__head
+
+    def reserve(self, rows: int) -> None:
+        """
+        make sure there is room for at least `rows` bodies
+        """
+        if rows <= self.rows:
+            return
+
+        new = max(rows, 2 * self.rows)
+        data = np.zeros((new,) + self.__data.shape[1:])
+        data[:self.rows] = self.__data
+        count = np.zeros(new, dtype=np.int64)
+        count[:self.rows] = self.__count
+
+        self.__data = data
+        self.__count = count
+
+    def state(self) -> tp.Dict[str, tp.Any]:
+        """
+        copy of the buffer, for checkpoints (only one of the mirrored halves, oldest sample first)
+        """
+        return {
+            "length": self.__length,
+            "every": self.__every,
+            "calls": self.__calls,
+            "samples": self.__data[:, self.__head:self.__head + self.__length].copy(),
+            "count": self.__count.copy(),
+        }
+
+    def restore(self, state: tp.Dict[str, tp.Any]) -> None:
+        """
+        overwrite the buffer with a state from `state`
+        """
+        self.__length = int(state["length"])
+        self.__every = int(state["every"])
+        self.__calls = int(state["calls"])
+        self.__head = 0
+
+        samples = np.asarray(state["samples"], dtype=float)
+        self.__data = np.concatenate((samples, samples), axis=1)
+        self.__count = np.array(state["count"], dtype=np.int64)
+
+    def record(self, positions: np.ndarray, mask: np.ndarray | None = None) -> bool:
+        """
+        record one sample of all bodies
+        :param positions: (N, 2) current positions
+        :param mask: (N,) only bodies with a true value get a longer trace
+        :return: true if the sample was stored, false if it was skipped by decimation
+        """
+        self.__calls += 1
+        if (self.__calls - 1) % self.__every:
+            return False
+
+        n = len(positions)
+        self.reserve(n)
+
+        head = self.__head
+        self.__data[:n, head] = positions
+        self.__data[:n, head + self.__length] = positions
+        self.__head = (head + 1) % self.__length
+
+        count = self.__count[:n]
+        if mask is None:
+            count += 1
+
+        else:
+            count[mask] += 1
+
+        np.minimum(count, self.__length, out=count)
+        return True
+
+    def clear(self, row: int | np.ndarray) -> None:
+        """
+        forget the trace of one body (or of an array of rows)
+        """
+        self.__count[row] = 0
+
+    def move(self, source: int | np.ndarray, target: int | np.ndarray) -> None:
+        """
+        copy the trace of body `source` to body `target` (or of arrays of rows)
+        """
+        self.__data[target] = self.__data[source]
+        self.__count[target] = self.__count[source]
+
+    def count(self, row: int) -> int:
+        """
+        number of samples stored for a body
+        """
+        return int(self.__count[row])
+
+    def counts(self, rows: int | None = None) -> np.ndarray:
+        """
+        copy of the number of samples stored for the first `rows` bodies
+        """
+        return self.__count[:rows].copy()
+
+    def last(self, row: int, n: int | None = None) -> np.ndarray:
+        """
+        the last n samples of a body (oldest first) as a read-only view
+        :param row: index of the body
+        :param n: number of samples, defaults to everything stored
+        """
+        available = int(self.__count[row]) if row < self.rows else 0
+        n = available if n is None else max(0, min(n, available))
+
+        end = self.__head + self.__length
+        view = self.__data[row, end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def window(self, n: int | None = None, rows: int | None = None,
+               stride: int = 1) -> tp.Tuple[np.ndarray, np.ndarray]:
+        """
+        the last n sample slots of all bodies as one read-only view
+        :param n: number of samples, defaults to the full length
+        :param rows: number of bodies, defaults to all reserved rows
+        :param stride: only take every stride-th sample (always including the newest one)
+        :return: (rows, ceil(n / stride), 2) samples (oldest first) and the number of
+            valid (most recent) samples of each body
+        """
+        n = self.__length if n is None else max(0, min(n, self.__length))
+        rows = self.rows if rows is None else rows
+        if stride < 1:
+            raise ValueError("Invalid value for \"stride\", must be at least 1")
+
+        # the taken columns are first, first + stride, ... of the window, a body
+        # with c samples has the columns from n - c on
+        first = (n - 1) % stride
+        end = self.__head + self.__length
+        view = self.__data[:rows, end - n + first:end:stride]
+        view.flags.writeable = False
+
+        columns = view.shape[1]
+        missing = n - np.minimum(self.__count[:rows], n) - first
+        return view, columns - np.clip(-(-missing // stride), 0, columns)
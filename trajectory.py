@@ -0,0 +1,299 @@
+"""
+Binary trajectory files: body metadata plus a stream of state frames
+
+layout:
+    8 bytes     magic (b"GRVTRJ01")
+    8 bytes     header length (little endian uint64)
+    header      json with the body metadata (names, ids, mass, diameter, fixed)
+    padding     up to the next multiple of 64 bytes
+    frames      fixed size records (time, step, position (N, 2), velocity (N, 2)), float64 / int64
+
+Frames are appended in chunks, the number of frames is taken from the
+file size, so a file that is still being written (or was cut off) can
+always be read up to its last complete frame.
+Author:
+Nilusink
+"""
+from objects import Simulation, Planet
+import typing as tp
+import numpy as np
+import threading
+import queue
+import json
+import os
+
+
+MAGIC = b"GRVTRJ01"
+ALIGNMENT = 64
+
+
+def frame_dtype(bodies: int) -> np.dtype:
+    """
+    record layout of one frame with `bodies` bodies
+    """
+    return np.dtype([
+        ("time", "<f8"),
+        ("step", "<i8"),
+        ("position", "<f8", (bodies, 2)),
+        ("velocity", "<f8", (bodies, 2)),
+    ])
+
+
+class TrajectoryWriter:
+    """
+    Appends simulation frames to a trajectory file
+
+    `write` only copies the current state into a chunk buffer, full chunks
+    are written to disk by a background thread (at most `max_pending`
+    chunks are queued, after that `write` waits for the disk).
+    The number of bodies can't change while writing. With `append`, a
+    resumed run continues the file of the interrupted one.
+    """
+    def __init__(self, path: str, sim: Simulation,
+                 chunk_frames: int = 64,
+                 background: bool = True,
+                 max_pending: int = 8,
+                 metadata: tp.Dict[str, tp.Any] | None = None,
+                 append: bool = False) -> None:
+        """
+        :param path: file to create (an existing file is overwritten unless `append` is set)
+        :param sim: simulation the body metadata is taken from
+        :param chunk_frames: number of frames written at once
+        :param background: write chunks in a background thread
+        :param max_pending: maximum number of chunks waiting for the disk
+        :param metadata: additional (json serializable) information stored in the header
+        :param append: continue an existing file for the same bodies: the frames from the current step
+            of `sim` on are dropped (they are written again), a missing file is created
+        """
+        if chunk_frames < 1:
+            raise ValueError("Invalid value for \"chunk_frames\", needs to be at least 1")
+
+        store = sim.store
+        self.path = path
+        self.bodies = len(store.mass)
+        self.dtype = frame_dtype(self.bodies)
+        self.frames = 0
+
+        header = json.dumps({
+            "version": 1,
+            "bodies": self.bodies,
+            "names": [obj.name if isinstance(obj, Planet) else "" for obj in sim.objects],
+            "ids": store.ids.tolist(),
+            "mass": store.mass.tolist(),
+            "diameter": store.diameter.tolist(),
+            "fixed": store.fixed.tolist(),
+            "metadata": metadata or {},
+        }).encode()
+
+        if append and os.path.exists(path):
+            self.__file = self.__reopen(sim)
+
+        else:
+            self.__file = open(path, "wb")
+            self.__file.write(MAGIC)
+            self.__file.write(len(header).to_bytes(8, "little"))
+            self.__file.write(header)
+            self.__file.write(b"\0" * (-self.__file.tell() % ALIGNMENT))
+            self.__file.flush()
+
+        self.__chunk = np.zeros(chunk_frames, dtype=self.dtype)
+        self.__filled = 0
+        self.__error: BaseException | None = None
+        self.__queue: "queue.Queue[np.ndarray | None] | None" = None
+        self.__thread: threading.Thread | None = None
+
+        if background:
+            self.__queue = queue.Queue(maxsize=max_pending)
+            self.__thread = threading.Thread(target=self.__writer, name="trajectory writer", daemon=True)
+            self.__thread.start()
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: {self.path!r}, {self.frames} frames>"
+
+    def __enter__(self) -> "TrajectoryWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __reopen(self, sim: Simulation) -> tp.BinaryIO:
+        """
+        open the existing file for appending, without the frames from the current step on
+        """
+        existing = Trajectory(self.path)
+        if existing.bodies != self.bodies or not np.array_equal(existing.ids, sim.store.ids):
+            raise ValueError(f"Invalid trajectory file {self.path!r} to append to, it has different bodies")
+
+        kept = int(np.searchsorted(existing.step, sim.steps, side="left"))
+        end = existing.offset + kept * self.dtype.itemsize
+        existing.close()
+
+        file = open(self.path, "r+b")
+        file.truncate(end)
+        file.seek(end)
+        self.frames = kept
+        return file
+
+    def __writer(self) -> None:
+        while (chunk := self.__queue.get()) is not None:
+            try:
+                chunk.tofile(self.__file)
+                self.__file.flush()
+
+            except BaseException as error:
+                self.__error = error
+
+            finally:
+                self.__queue.task_done()
+
+        self.__queue.task_done()
+
+    def __submit(self) -> None:
+        """
+        hand the filled part of the chunk buffer to the disk
+        """
+        if not self.__filled:
+            return
+
+        if self.__error is not None:
+            raise self.__error
+
+        chunk = self.__chunk[:self.__filled]
+        if self.__queue is None:
+            chunk.tofile(self.__file)
+            self.__file.flush()
+
+        else:
+            # the thread owns the chunk now, continue in a new buffer
+            self.__queue.put(chunk)
+            self.__chunk = np.zeros(len(self.__chunk), dtype=self.dtype)
+
+        self.__filled = 0
+
+    def write(self, sim: Simulation) -> None:
+        """
+        append the current state of `sim`
+        """
+        store = sim.store
+        if len(store.mass) != self.bodies:
+            raise ValueError(f"Invalid number of bodies: {len(store.mass)} (the trajectory has {self.bodies})")
+
+        frame = self.__chunk[self.__filled]
+        frame["time"] = sim.time
+        frame["step"] = sim.steps
+        frame["position"] = store.position
+        frame["velocity"] = store.velocity
+        self.__filled += 1
+        self.frames += 1
+
+        if self.__filled == len(self.__chunk):
+            self.__submit()
+
+    def flush(self) -> None:
+        """
+        write all buffered frames (also waits for the background thread)
+        """
+        self.__submit()
+        if self.__queue is not None:
+            self.__queue.join()
+
+        if self.__error is not None:
+            raise self.__error
+
+    def close(self) -> None:
+        """
+        write the remaining frames and close the file
+        """
+        if self.__file.closed:
+            return
+
+        self.__submit()
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join()
+
+        self.__file.close()
+        if self.__error is not None:
+            raise self.__error
+
+
+class Trajectory:
+    """
+    Read-only, memory mapped access to a trajectory file
+
+    Frames are only read from disk when they are accessed, so files
+    larger than the memory can be replayed or analyzed:
+    `traj.position[i]` is the (N, 2) array of frame i,
+    `traj.position[:, body]` the path of one body.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Invalid trajectory file {path!r}")
+
+            length = int.from_bytes(file.read(8), "little")
+            header = json.loads(file.read(length))
+
+        self.header = header
+        self.bodies: int = header["bodies"]
+        self.names: tp.List[str] = header["names"]
+        self.ids = np.array(header["ids"], dtype=np.int64)
+        self.mass = np.array(header["mass"], dtype=float)
+        self.diameter = np.array(header["diameter"], dtype=float)
+        self.fixed = np.array(header["fixed"], dtype=bool)
+        self.metadata: tp.Dict[str, tp.Any] = header["metadata"]
+        self.dtype = frame_dtype(self.bodies)
+
+        data = len(MAGIC) + 8 + length
+        self.offset = data + -data % ALIGNMENT
+        self.frames: np.ndarray = np.zeros(0, dtype=self.dtype)
+        self.refresh()
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}: {self.path!r}, {len(self)} frames, {self.bodies} bodies>"
+
+    def refresh(self) -> int:
+        """
+        map all complete frames (call again to see frames written since)
+        :return: number of frames
+        """
+        count = max(os.path.getsize(self.path) - self.offset, 0) // self.dtype.itemsize
+        if count:
+            self.frames = np.memmap(self.path, dtype=self.dtype, mode="r", offset=self.offset, shape=(count,))
+
+        return count
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __getitem__(self, item):
+        return self.frames[item]
+
+    @property
+    def time(self) -> np.ndarray:
+        return self.frames["time"]
+
+    @property
+    def step(self) -> np.ndarray:
+        return self.frames["step"]
+
+    @property
+    def position(self) -> np.ndarray:
+        return self.frames["position"]
+
+    @property
+    def velocity(self) -> np.ndarray:
+        return self.frames["velocity"]
+
+    def index(self, time: float) -> int:
+        """
+        index of the last frame at or before `time`
+        """
+        return max(int(np.searchsorted(self.time, time, side="right")) - 1, 0)
+
+    def close(self) -> None:
+        """
+        release the memory map
+        """
+        self.frames = np.zeros(0, dtype=self.dtype)
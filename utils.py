@@ -0,0 +1,20 @@
+"""
+Small array helpers shared by the solvers
+Author:
+Nilusink
+"""
+import typing as tp
+import numpy as np
+
+
+def expand_ranges(counts: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+    """
+    for every row i with counts[i] entries, return (row index, offset within row)
+
+    >>> expand_ranges(np.array([2, 0, 3]))
+    (array([0, 0, 2, 2, 2]), array([0, 1, 0, 1, 2]))
+    """
+    rows = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    offsets = np.arange(len(rows)) - np.repeat(first, counts)
+    return rows, offsets